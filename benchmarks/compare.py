@@ -0,0 +1,78 @@
+"""Compara dois resultados de ``benchmarks.run`` (ex.: antes e depois de um commit).
+
+    python -m benchmarks.compare benchmarks/results/antes.json benchmarks/results/depois.json
+
+Mostra a variação de cada métrica por tamanho e termina com código 1 se
+alguma piorar mais que ``--threshold`` (padrão 10%), para uso em CI.
+"""
+import sys
+import json
+import argparse
+
+# (caminho no resultado, maior é melhor)
+METRICS = (
+    (('indexing', 'chunks_per_s'), True),
+    (('indexing', 'seconds'), False),
+    (('indexing', 'peak_rss_mb'), False),
+    (('indexing', 'index_bytes'), False),
+    (('peak_rss_mb',), False),
+    (('queries', 'semantic_search', 'p50_ms'), False),
+    (('queries', 'semantic_search', 'p95_ms'), False),
+    (('queries', 'semantic_search', 'p99_ms'), False),
+    (('queries', 'search', 'p50_ms'), False),
+    (('queries', 'search', 'p95_ms'), False),
+    (('queries', 'search', 'p99_ms'), False),
+    (('queries', 'search', 'throughput_qps'), True),
+    (('queries', 'asearch', 'p95_ms'), False),
+    (('queries', 'asearch', 'p99_ms'), False),
+    (('queries', 'asearch', 'throughput_qps'), True),
+)
+
+
+def _get(result, path):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(before, after, threshold=0.10):
+    """Linhas ``(tamanho, métrica, antes, depois, variação, piorou)`` dos tamanhos presentes nos dois"""
+    previous = {r['target_chunks']: r for r in before['results']}
+    rows = []
+    for result in after['results']:
+        old = previous.get(result['target_chunks'])
+        if old is None:
+            continue
+        for path, higher_is_better in METRICS:
+            a, b = _get(old, path), _get(result, path)
+            if not a or b is None:
+                continue
+            change = (b - a) / a
+            regressed = (-change if higher_is_better else change) > threshold
+            rows.append((result['target_chunks'], '.'.join(path), a, b, change, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara dois resultados de benchmark")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.10, help="piora tolerada (fração, padrão 0.10)")
+    args = parser.parse_args(argv)
+    with open(args.before, 'r', encoding='utf-8') as f:
+        before = json.load(f)
+    with open(args.after, 'r', encoding='utf-8') as f:
+        after = json.load(f)
+
+    print(f"antes:  {before['environment'].get('commit')}  depois: {after['environment'].get('commit')}")
+    rows = compare(before, after, args.threshold)
+    for size, metric, a, b, change, regressed in rows:
+        flag = "  <-- piorou" if regressed else ""
+        print(f"{size:>8}  {metric:<36} {a:>14.3f} {b:>14.3f} {change:>+8.1%}{flag}")
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
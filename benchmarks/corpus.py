@@ -0,0 +1,178 @@
+"""Corpus sintético de atas em português (TXT, DOCX e PDF) para os benchmarks.
+
+O texto é determinístico para a mesma semente, e o tamanho é dado em chunks
+(contados pelo mesmo ``StructuredChunker`` do indexador), de modo que
+execuções em commits diferentes indexem exatamente o mesmo conteúdo.
+"""
+import os
+import random
+
+from smart_chunker import StructuredChunker
+
+FORMATS = ("txt", "docx", "pdf")
+
+ORGAOS = (
+    "Conselho Municipal de Saúde", "Câmara Municipal", "Conselho Escolar da Escola Estadual Rui Barbosa",
+    "Associação de Moradores do Bairro São José", "Comissão Permanente de Licitação",
+    "Conselho Deliberativo do Clube Atlético", "Assembleia Geral do Condomínio Jardim das Flores",
+    "Conselho Municipal de Assistência Social",
+)
+NOMES = (
+    "Maria da Silva", "João Pereira", "Ana Souza", "Carlos Oliveira", "Fernanda Lima", "José Santos",
+    "Luciana Costa", "Paulo Rodrigues", "Mariana Almeida", "Ricardo Nunes", "Patrícia Gomes", "Antônio Ribeiro",
+    "Juliana Carvalho", "Roberto Martins", "Camila Araújo", "Sérgio Barbosa",
+)
+PAUTAS = (
+    "aprovação do orçamento anual", "reforma da quadra poliesportiva", "contratação de serviços de limpeza",
+    "prestação de contas do trimestre", "compra de equipamentos de informática", "eleição da nova diretoria",
+    "manutenção da rede de esgoto", "ampliação do posto de saúde", "campanha de vacinação contra a gripe",
+    "reajuste da taxa condominial", "instalação de câmeras de segurança", "transporte escolar da zona rural",
+    "merenda escolar e agricultura familiar", "pintura da fachada do prédio", "convênio com a universidade federal",
+)
+DECISOES = (
+    "aprovada por unanimidade", "aprovada por maioria, com {a} votos a favor e {b} contrários",
+    "rejeitada por {a} votos a {b}", "adiada para a próxima reunião por falta de orçamento",
+    "aprovada com ressalvas, condicionada à apresentação de três orçamentos",
+)
+MESES = ("janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho", "agosto", "setembro", "outubro",
+         "novembro", "dezembro")
+PERGUNTAS = (
+    "Qual foi a decisão sobre a {pauta}?", "Qual o valor aprovado para a {pauta}?",
+    "Quem presidiu a reunião do {orgao}?", "Quando foi discutida a {pauta}?",
+    "Quem apresentou a proposta de {pauta}?", "O que o {orgao} decidiu sobre a {pauta}?",
+)
+
+
+def _valor(rng):
+    reais = rng.randrange(1_000, 900_000)
+    return f"R$ {reais:,}".replace(",", ".") + f",{rng.randrange(100):02d}"
+
+
+def ata(rng, number):
+    """Parágrafos de uma ata de reunião"""
+    orgao = rng.choice(ORGAOS)
+    presidente, secretario = rng.sample(NOMES, 2)
+    dia, mes, ano = rng.randint(1, 28), rng.choice(MESES), rng.randint(2015, 2024)
+    paragraphs = [
+        f"ATA DA {number}ª REUNIÃO ORDINÁRIA DO {orgao.upper()}",
+        f"Aos {dia} dias do mês de {mes} de {ano}, às {rng.randint(8, 20)} horas, reuniram-se na sede do "
+        f"{orgao} os membros abaixo assinados, sob a presidência de {presidente}, para deliberar sobre a "
+        f"pauta previamente divulgada. Verificado o quórum regimental, a presidente declarou aberta a sessão "
+        f"e a ata da reunião anterior foi lida e aprovada sem alterações.",
+    ]
+    for item, pauta in enumerate(rng.sample(PAUTAS, rng.randint(4, 8)), start=1):
+        autor, aparte = rng.sample(NOMES, 2)
+        decisao = rng.choice(DECISOES).format(a=rng.randint(5, 12), b=rng.randint(1, 4))
+        paragraphs.append(
+            f"Item {item}: {pauta}. {autor} apresentou a proposta no valor de {_valor(rng)}, explicando que "
+            f"a medida atende às solicitações registradas nas reuniões anteriores e que os recursos constam "
+            f"da dotação orçamentária vigente. {aparte} pediu a palavra e questionou os prazos de execução e "
+            f"a forma de fiscalização dos serviços, sugerindo que a comissão acompanhe a execução mensalmente. "
+            f"Após ampla discussão, a proposta foi {decisao}. Ficou registrado que o prazo para conclusão é de "
+            f"{rng.randint(30, 180)} dias a contar da assinatura do contrato."
+        )
+    paragraphs.append(
+        f"Nada mais havendo a tratar, a presidente {presidente} agradeceu a presença de todos e encerrou a "
+        f"reunião, da qual eu, {secretario}, secretário(a), lavrei a presente ata, que após lida e aprovada "
+        f"será assinada por mim e pelos demais presentes."
+    )
+    return paragraphs
+
+
+def queries(n, seed=0):
+    """``n`` perguntas no vocabulário do corpus"""
+    rng = random.Random(seed + 1)
+    return [rng.choice(PERGUNTAS).format(pauta=rng.choice(PAUTAS), orgao=rng.choice(ORGAOS)) for _ in range(n)]
+
+
+def write_txt(path, paragraphs):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n\n".join(paragraphs))
+
+
+def write_docx(path, paragraphs):
+    from docx import Document
+
+    document = Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def _pdf_lines(paragraphs, width=95):
+    lines = []
+    for paragraph in paragraphs:
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + 1 + len(word) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.extend([line, ""])
+    return lines
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode('cp1252', 'replace')
+
+
+def write_pdf(path, paragraphs, lines_per_page=60):
+    """PDF mínimo (Helvetica, WinAnsiEncoding) com uma linha de texto por ``Tj``"""
+    lines = _pdf_lines(paragraphs)
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    # 1: catálogo, 2: árvore de páginas, 3: fonte, depois (página, conteúdo) por página
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for page_lines in pages:
+        stream = b"BT /F1 10 Tf 12 TL 50 800 Td " + b" ".join(
+            b"(" + _pdf_escape(line) + b") Tj T*" for line in page_lines) + b" ET"
+        page_number, content_number = len(objects) + 1, len(objects) + 2
+        kids.append(f"{page_number} 0 R")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {content_number} 0 R "
+                       f"/Resources << /Font << /F1 3 0 R >> >> >>".encode('ascii'))
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode('ascii') + stream + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode('ascii')
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode('ascii') + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('ascii')
+    out += b"".join(f"{offset:010d} 00000 n \n".encode('ascii') for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('ascii')
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+WRITERS = {"txt": write_txt, "docx": write_docx, "pdf": write_pdf}
+
+
+def generate_corpus(directory, target_chunks, formats=FORMATS, seed=0, atas_per_document=4, chunker=None):
+    """Grava atas em ``directory`` até somar ``target_chunks`` chunks.
+
+    Os formatos se alternam documento a documento. A contagem usa o texto
+    gerado; a extração de DOCX/PDF pode quebrar os chunks de forma um pouco
+    diferente, por isso o benchmark reporta também os chunks efetivamente
+    indexados. Retorna ``{'documents', 'chunks', 'bytes'}``.
+    """
+    chunker = chunker or StructuredChunker.from_env()
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    documents = chunks = size = 0
+    number = 1
+    while chunks < target_chunks:
+        paragraphs = []
+        for _ in range(atas_per_document):
+            paragraphs.extend(ata(rng, number))
+            number += 1
+        fmt = formats[documents % len(formats)]
+        path = os.path.join(directory, f"ata_{documents:06d}.{fmt}")
+        WRITERS[fmt](path, paragraphs)
+        chunks += len(chunker.chunk("\n\n".join(paragraphs)))
+        size += os.path.getsize(path)
+        documents += 1
+    return {'documents': documents, 'chunks': chunks, 'bytes': size}
@@ -0,0 +1,277 @@
+"""Benchmark reproduzível da indexação e da busca.
+
+Para cada tamanho (em chunks) gera um corpus sintético de atas
+(``benchmarks.corpus``), indexa com ``index_directory`` e mede:
+
+- vazão da indexação (documentos, chunks e MB por segundo) e o tempo de
+  cada etapa (extract, chunk, vectorize) pelos histogramas de ``smart_metrics``;
+- pico de RSS do processo (e dos workers de extração) e tamanho do índice em disco;
+- latência p50/p95/p99 de ``_semantic_search`` (só recuperação) e de
+  ``search``/``asearch`` (pergunta completa) contra um Ollama falso com
+  latência configurável (``benchmarks.stub_ollama``).
+
+Cada tamanho roda num processo novo, para que o pico de RSS seja só dele.
+O resultado é um JSON com o commit, o ambiente e a configuração, para
+comparar execuções com ``python -m benchmarks.compare``.
+
+    python -m benchmarks.run --sizes 1k,10k,100k
+    python -m benchmarks.run --sizes 10k --llm-latency 1.5 --concurrency 16 --out resultado.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+def parse_size(text):
+    """``"10k"`` -> 10000, ``"1m"`` -> 1000000"""
+    text = text.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def percentiles(samples):
+    """Resumo das latências (em milissegundos)"""
+    if not samples:
+        return {'count': 0}
+    ms = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'count': len(samples), 'mean_ms': round(float(ms.mean()), 3), 'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3), 'p99_ms': round(float(p99), 3), 'max_ms': round(float(ms.max()), 3)}
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _index_size(indexer):
+    """Bytes em disco do JSON do índice e de todos os arquivos auxiliares"""
+    directory = os.path.dirname(os.path.abspath(indexer.index_file))
+    prefix = os.path.basename(indexer._index_path(''))
+    return sum(entry.stat().st_size for entry in os.scandir(directory)
+               if entry.is_file() and entry.name.startswith(prefix))
+
+
+def _stage_summary(since=None):
+    """Chamadas e tempo total/médio de cada etapa (desde ``since``, uma leitura anterior dos histogramas)"""
+    from smart_metrics import STAGE_SECONDS
+
+    since = since or {}
+    summary = {}
+    for key, (_counts, total, count) in sorted(STAGE_SECONDS.samples().items()):
+        if key in since:
+            total, count = total - since[key][1], count - since[key][2]
+        if count:
+            summary[key[0]] = {'count': count, 'total_s': round(total, 4), 'mean_ms': round(total / count * 1000, 3)}
+    return summary
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def prepare_corpus(workdir, size, formats, seed):
+    """Gera (ou reaproveita, se já existe em ``workdir``) o corpus de um tamanho"""
+    from benchmarks.corpus import generate_corpus
+
+    directory = os.path.join(workdir, f"corpus-{size}-{'-'.join(formats)}-s{seed}")
+    manifest = os.path.join(directory, "corpus.json")
+    if os.path.exists(manifest):
+        with open(manifest, 'r', encoding='utf-8') as f:
+            return directory, json.load(f)
+    shutil.rmtree(directory, ignore_errors=True)
+    started = time.perf_counter()
+    info = generate_corpus(os.path.join(directory, "docs"), size, formats, seed)
+    info['generation_s'] = round(time.perf_counter() - started, 2)
+    with open(manifest, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    return directory, info
+
+
+def _timed_calls(func, items, concurrency):
+    """Latência de cada ``func(item)`` com ``concurrency`` threads e a duração total"""
+    def call(item):
+        started = time.perf_counter()
+        func(item)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(call, items))
+    return latencies, time.perf_counter() - started
+
+
+async def _atimed_calls(func, items, concurrency, client=None):
+    """Versão asyncio de ``_timed_calls``; fecha a sessão aiohttp de ``client`` no fim"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(item):
+        async with semaphore:
+            started = time.perf_counter()
+            await func(item)
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(call(item) for item in items))
+    if client is not None:
+        await client.aclose()
+    return list(latencies), time.perf_counter() - started
+
+
+def _query_result(latencies, elapsed):
+    return {**percentiles(latencies), 'throughput_qps': round(len(latencies) / elapsed, 2) if elapsed else None}
+
+
+def run_size(size, config):
+    """Executa o benchmark de um tamanho (no processo atual) e devolve o resultado"""
+    logging.basicConfig(level=getattr(logging, config['log_level']))
+    from benchmarks.corpus import queries
+    from benchmarks.stub_ollama import StubOllama
+    from smart_cache import AnswerCache
+    from smart_indexer import SmartDocumentIndexer
+    from smart_llm import OllamaClient
+    from smart_metrics import STAGE_SECONDS
+
+    corpus_dir, corpus = prepare_corpus(config['workdir'], size, config['formats'], config['seed'])
+    index_dir = os.path.join(config['workdir'], f"index-{size}")
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.makedirs(index_dir)
+
+    with StubOllama(latency=config['llm_latency'], token_latency=config['token_latency']) as stub:
+        indexer = SmartDocumentIndexer(autoload=False)
+        indexer.index_file = os.path.join(index_dir, "index.json")
+        indexer.llm_client = OllamaClient(host=stub.url)
+        # Sem caches: cada pergunta repetida deve ir ao LLM e cada página ser extraída de novo
+        indexer.answer_cache = AnswerCache(max_entries=0)
+        indexer.page_cache = None
+        indexer.max_generations = config['concurrency']
+        indexer.initialize()
+
+        stages_before = STAGE_SECONDS.samples()
+        started = time.perf_counter()
+        indexer.index_directory(os.path.join(corpus_dir, "docs"), incremental=False)
+        index_seconds = time.perf_counter() - started
+        snapshot = indexer._snapshot
+        indexing = {
+            'seconds': round(index_seconds, 3),
+            'documents': len(snapshot.documents),
+            'chunks': snapshot.n_chunks,
+            'docs_per_s': round(len(snapshot.documents) / index_seconds, 2),
+            'chunks_per_s': round(snapshot.n_chunks / index_seconds, 2),
+            'mb_per_s': round(corpus['bytes'] / index_seconds / 1e6, 3),
+            'index_bytes': _index_size(indexer),
+            'peak_rss_mb': _peak_rss_mb(),
+            'peak_rss_children_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN),
+            'stages': _stage_summary(stages_before),
+        }
+
+        questions = queries(config['queries'], config['seed'])
+        for question in questions[:5]:
+            indexer._semantic_search(question)  # aquece o vetorizador
+        stages_before = STAGE_SECONDS.samples()
+        retrieval = []
+        for question in questions:
+            started = time.perf_counter()
+            indexer._semantic_search(question)
+            retrieval.append(time.perf_counter() - started)
+        # Um resultado por pergunta, como o padrão de /search
+        search = _timed_calls(lambda q: indexer.search(q, max_results=1), questions, config['concurrency'])
+        asearch = asyncio.run(_atimed_calls(lambda q: indexer.asearch(q, max_results=1), questions,
+                                            config['concurrency'], indexer.llm_client))
+        query_results = {
+            'semantic_search': percentiles(retrieval),
+            'search': _query_result(*search),
+            'asearch': _query_result(*asearch),
+            'llm_requests': stub.requests,
+            'stages': _stage_summary(stages_before),
+        }
+        indexer.llm_client.close()
+
+    return {'target_chunks': size, 'corpus': corpus, 'indexing': indexing, 'queries': query_results,
+            'peak_rss_mb': _peak_rss_mb()}
+
+
+def _environment():
+    commit, dirty = _git_commit()
+    return {'commit': commit, 'dirty': dirty, 'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'timestamp': datetime.now().isoformat(timespec='seconds')}
+
+
+def run(sizes, config):
+    """Roda cada tamanho num processo novo (spawn) e junta os resultados"""
+    results = []
+    for size in sizes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            result = executor.submit(run_size, size, config).result()
+        results.append(result)
+        indexing, queries = result['indexing'], result['queries']
+        print(f"{size:>8} chunks: indexação {indexing['seconds']}s ({indexing['chunks_per_s']} chunks/s), "
+              f"RSS {result['peak_rss_mb']} MB, índice {indexing['index_bytes'] / 1e6:.1f} MB, "
+              f"retrieve p95 {queries['semantic_search'].get('p95_ms')} ms, "
+              f"search p95 {queries['search'].get('p95_ms')} ms", flush=True)
+    return {'environment': _environment(), 'config': config, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de indexação e busca do DocIA")
+    parser.add_argument("--sizes", default="1k,10k,100k", help="tamanhos em chunks, separados por vírgula")
+    parser.add_argument("--formats", default="txt,docx,pdf", help="formatos do corpus (txt, docx, pdf)")
+    parser.add_argument("--queries", type=int, default=200, help="perguntas por modo de busca")
+    parser.add_argument("--concurrency", type=int, default=8, help="perguntas simultâneas em search/asearch")
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="latência (s) do Ollama falso")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="latência (s) por token no stream")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="onde ficam corpus e índices (reaproveita corpus já gerados)")
+    parser.add_argument("--out", help="arquivo JSON do resultado (padrão: benchmarks/results/<data>-<commit>.json)")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="docia-bench-")
+    config = {'formats': [f.strip() for f in args.formats.split(',') if f.strip()], 'queries': args.queries,
+              'concurrency': args.concurrency, 'llm_latency': args.llm_latency,
+              'token_latency': args.token_latency, 'seed': args.seed, 'workdir': os.path.abspath(workdir),
+              'log_level': args.log_level.upper()}
+    try:
+        report = run([parse_size(size) for size in args.sizes.split(',')], config)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    out = args.out
+    if not out:
+        commit = (report['environment']['commit'] or 'unknown')[:10]
+        out = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Resultado gravado em {out}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Servidor que imita a API do Ollama com latência configurável.
+
+Responde ``/api/tags`` e ``/api/generate`` (com e sem ``stream``) depois de
+``latency`` segundos, mais ``token_latency`` por token no modo stream, sem
+rodar modelo nenhum. Assim os benchmarks medem o app e não a GPU.
+
+Uso avulso (ex.: teste de carga contra um pod): ``python -m benchmarks.stub_ollama --port 11435 --latency 1.5``
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = ("De acordo com a ata, a proposta foi aprovada pelo conselho após discussão entre os membros presentes, "
+          "com prazo de execução definido e acompanhamento mensal pela comissão responsável.")
+
+
+class StubOllama:
+    """Servidor em thread própria; use como context manager ou com ``start``/``stop``"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_latency=0.0, answer=ANSWER, model="mistral"):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.answer = answer
+        self.model = model
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, data, status=200):
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == '/api/tags':
+                    self._send_json({'models': [{'name': f"{stub.model}:latest"}]})
+                else:
+                    self._send_json({'error': 'not found'}, status=404)
+
+            def do_POST(self):
+                if self.path != '/api/generate':
+                    self._send_json({'error': 'not found'}, status=404)
+                    return
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with stub._lock:
+                    stub.requests += 1
+                time.sleep(stub.latency)
+                if not payload.get('stream'):
+                    self._send_json({'model': payload.get('model'), 'response': stub.answer, 'done': True})
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for token in stub.answer.split(" "):
+                    self._write_chunk({'response': token + " ", 'done': False})
+                    time.sleep(stub.token_latency)
+                self._write_chunk({'response': '', 'done': True})
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, data):
+                line = json.dumps(data).encode('utf-8') + b"\n"
+                self.wfile.write(f"{len(line):x}\r\n".encode('ascii') + line + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama falso com latência configurável")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=1.0, help="segundos até a resposta (ou o 1º token)")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="segundos entre tokens no stream")
+    args = parser.parse_args()
+    stub = StubOllama(args.host, args.port, args.latency, args.token_latency)
+    print(f"Ollama falso em {stub.url} (latência {args.latency}s)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Configuração de produção: ``gunicorn -c gunicorn.conf.py``.
+
+Por padrão serve o app asyncio (``smart_async_app``) com o worker do
+aiohttp; ``DOCIA_APP=smart_app:app`` volta ao app Flask com threads.
+
+O app é importado uma vez no processo mestre antes do fork
+(``preload_app``); o import é leve e não carrega modelo nem índice.
+Depois do fork cada worker recria suas conexões com o Ollama, carrega o
+índice em segundo plano (por memory-map: as páginas ficam compartilhadas
+no cache do sistema operacional) e disputa a liderança: só o líder roda
+o watcher e as reindexações; os demais recarregam o índice quando o
+líder grava uma versão nova.
+"""
+import os
+
+wsgi_app = os.getenv("DOCIA_APP", "smart_async_app:app")
+bind = os.getenv("DOCIA_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("DOCIA_WEB_WORKERS", "2"))
+worker_class = os.getenv("DOCIA_WORKER_CLASS") or (
+    "aiohttp.GunicornWebWorker" if wsgi_app.startswith("smart_async_app") else "gthread")
+threads = int(os.getenv("DOCIA_WEB_THREADS", "4"))
+preload_app = True
+# Gerações do LLM podem levar até 2 minutos
+timeout = int(os.getenv("DOCIA_WEB_TIMEOUT", "180"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
+# Cada worker grava suas métricas aqui e o /metrics de qualquer um deles soma todas
+os.environ.setdefault("DOCIA_METRICS_DIR", "/tmp/docia-metrics")
+
+
+def on_starting(server):
+    # Métricas de uma execução anterior do servidor não devem ser somadas
+    import shutil
+
+    shutil.rmtree(os.environ["DOCIA_METRICS_DIR"], ignore_errors=True)
+
+
+def post_fork(server, worker):
+    import smart_app
+
+    # DOCIA_MAX_GENERATIONS é o limite do pod: cada worker fica com a sua parte
+    smart_app.indexer.generation_queue.split(server.cfg.workers)
+    smart_app.indexer.llm_client.after_fork()
+    smart_app.start_background_services()
@@ -0,0 +1,212 @@
+"""Controle de admissão das gerações do LLM.
+
+O Ollama atende poucas gerações de cada vez; acima disso as requisições só
+se acumulam, cada uma esperando até o timeout. ``GenerationQueue`` deixa
+no máximo ``max_concurrency`` gerações em andamento por processo, com uma
+fila FIFO de até ``max_waiting`` pedidos. Cada pergunta tem um prazo
+(``deadline``, em ``time.monotonic()``): quem encontra a fila cheia, ou não
+consegue vaga antes do prazo, recebe ``AdmissionRejected`` na hora e o
+indexador responde com o sistema interno em vez de esperar o Ollama.
+
+A mesma fila atende threads (``slot``) e corrotinas (``aslot``), de modo
+que o limite vale para o processo inteiro, qualquer que seja o app.
+
+``DOCIA_MAX_GENERATIONS`` é o limite do pod: com vários workers pré-fork,
+``split(workers)`` (chamado pelo ``post_fork`` do gunicorn) dá a cada um
+a sua parte, para que a soma não passe do que o Ollama atende. A fila de
+espera continua sendo por worker.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from smart_metrics import GENERATION_QUEUE_SECONDS, GENERATION_REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Geração recusada: ``reason`` é ``queue_full`` ou ``deadline``"""
+
+    def __init__(self, reason):
+        super().__init__(f"geração recusada ({reason})")
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ('granted', 'event', 'loop', 'future')
+
+    def __init__(self, event=None, loop=None, future=None):
+        self.granted = False
+        self.event = event
+        self.loop = loop
+        self.future = future
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class GenerationQueue:
+    """Vagas de geração com fila limitada e prazo por pergunta.
+
+    ``timeout`` é o prazo padrão de cada pergunta em segundos (``None`` ou
+    0: sem prazo); ``deadline()`` o converte num instante absoluto, que vai
+    de ``slot``/``aslot`` até o timeout da chamada ao Ollama.
+    """
+
+    def __init__(self, max_concurrency=2, max_waiting=16, timeout=120.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_waiting = max(0, max_waiting)
+        self.timeout = timeout or None
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self.active = 0
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'deadline': 0}
+        self.wait_seconds = 0.0
+        self.workers = 1
+
+    @classmethod
+    def from_env(cls):
+        return cls(max_concurrency=int(os.getenv("DOCIA_MAX_GENERATIONS", "2")),
+                   max_waiting=int(os.getenv("DOCIA_GENERATION_QUEUE", "16")),
+                   timeout=float(os.getenv("DOCIA_GENERATION_DEADLINE", "120")))
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def deadline(self, seconds=None):
+        """Prazo absoluto daqui a ``seconds`` (padrão: ``timeout``), ou ``None`` sem prazo"""
+        seconds = self.timeout if seconds is None else seconds
+        return time.monotonic() + seconds if seconds else None
+
+    @staticmethod
+    def remaining(deadline):
+        """Segundos até o prazo (``None`` sem prazo; nunca negativo)"""
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    def resize(self, max_concurrency):
+        """Muda o número de vagas, liberando quem estiver na fila se ele cresceu"""
+        with self._lock:
+            self.max_concurrency = max(1, max_concurrency)
+            self._grant()
+
+    def split(self, workers):
+        """Divide o limite atual (o do pod) entre ``workers`` processos; retorna a parte deste.
+
+        A divisão arredonda para baixo, para a soma não passar do limite;
+        com menos vagas que workers cada um fica com uma, e o total passa.
+        """
+        workers = max(1, workers)
+        share = max(1, self.max_concurrency // workers)
+        if share * workers > self.max_concurrency:
+            logger.warning(f"{self.max_concurrency} gerações para {workers} workers: "
+                           f"até {share * workers} gerações simultâneas no Ollama")
+        self.workers = workers
+        self.resize(share)
+        return share
+
+    def _grant(self):
+        # Chamado com o lock: passa as vagas livres aos primeiros da fila
+        while self._waiters and self.active < self.max_concurrency:
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self.active += 1
+            waiter.wake()
+
+    def _try_acquire(self, deadline, waiter_factory):
+        """Vaga imediata (``None``), recusa, ou um ``_Waiter`` já na fila"""
+        with self._lock:
+            if not self._waiters and self.active < self.max_concurrency:
+                self.active += 1
+                self.admitted += 1
+                return None
+            if len(self._waiters) >= self.max_waiting:
+                reason = 'queue_full'
+            elif deadline is not None and deadline <= time.monotonic():
+                reason = 'deadline'
+            else:
+                waiter = waiter_factory()
+                self._waiters.append(waiter)
+                return waiter
+        self._reject(reason)
+
+    def _finish_wait(self, waiter, started):
+        """Fim da espera na fila; ``True`` se a vaga foi concedida a tempo"""
+        with self._lock:
+            waited = time.monotonic() - started
+            self.wait_seconds += waited
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                return False
+            self.admitted += 1
+        GENERATION_QUEUE_SECONDS.observe(waited)
+        return True
+
+    def _reject(self, reason):
+        with self._lock:
+            self.rejected[reason] += 1
+        GENERATION_REJECTIONS.inc(reason=reason)
+        raise AdmissionRejected(reason)
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+            self._grant()
+
+    @contextmanager
+    def slot(self, deadline=None):
+        """Segura uma vaga (threads); levanta ``AdmissionRejected`` sem vaga até o prazo"""
+        started = time.monotonic()
+        waiter = self._try_acquire(deadline, lambda: _Waiter(event=threading.Event()))
+        if waiter is not None:
+            waiter.event.wait(self.remaining(deadline))
+            if not self._finish_wait(waiter, started):
+                self._reject('deadline')
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, deadline=None):
+        """Versão asyncio de ``slot``: espera a vaga sem prender uma thread"""
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        waiter = self._try_acquire(deadline, lambda: _Waiter(loop=loop, future=loop.create_future()))
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(waiter.future, self.remaining(deadline))
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # Cancelada na fila: devolve a vaga se ela chegou junto com o cancelamento
+                if self._finish_wait(waiter, started):
+                    self.release()
+                raise
+            if not self._finish_wait(waiter, started):
+                self._reject('deadline')
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {'max_generations': self.max_concurrency, 'workers': self.workers, 'active': self.active,
+                    'waiting': len(self._waiters), 'max_waiting': self.max_waiting,
+                    'deadline_seconds': self.timeout, 'admitted': self.admitted,
+                    'rejected': dict(self.rejected), 'wait_seconds': round(self.wait_seconds, 3)}
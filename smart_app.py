@@ -1,12 +1,18 @@
-from flask import Flask, request, jsonify, render_template_string
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, Response, g, request, jsonify, render_template_string, stream_with_context
 from flask_cors import CORS
 import os
+import json
 from smart_indexer import SmartDocumentIndexer
+from smart_scheduler import FileWatch, LeaderElection, ReindexScheduler, touch
+from smart_readers import get_reader
+import smart_metrics
+from smart_metrics import HTTP_REQUESTS, HTTP_SECONDS, REGISTRY
 import logging
-import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-import requests
 from datetime import datetime
 
 logging.basicConfig(level=logging.INFO)
@@ -15,7 +21,11 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-indexer = SmartDocumentIndexer()
+# Construtor barato: modelo e índice carregam em segundo plano (start_background_services)
+indexer = SmartDocumentIndexer(autoload=False)
+
+# Orçamento (em segundos) para importar este módulo; acima dele o tempo é logado como aviso
+STARTUP_BUDGET = float(os.getenv("DOCIA_STARTUP_BUDGET", "2"))
 
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -104,24 +114,46 @@ HTML_TEMPLATE = """
             const resultsDiv = document.getElementById('results');
             if (!query) return;
             resultsDiv.innerHTML = '<div class="loading">Buscando...</div>';
-            fetch('/search', { method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify({query}) })
-                .then(res => res.json())
-                .then(data => {
-                    if (data.success && data.results.length > 0) {
-                        const result = data.results[0];
-                        let html = '<h3>Resposta:</h3>';
-                        if (result.ai_answer) {
-                            html += `<div class="ai-answer">
-                                <div class="response-text"><b>Resposta IA:</b> ${result.ai_answer}</div>
-                                <div class="confidence-info">Confiança: ${Math.round(result.confidence * 100)}%</div>
-                            </div>`;
-                        } else {
-                            html += '<div class="ai-answer"><div class="response-text">Nenhuma resposta direta encontrada, mas o trecho a seguir pode ser útil.</div></div>';
+            fetch('/search/stream', { method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify({query}) })
+                .then(res => {
+                    const reader = res.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+                    let answerDiv = null;
+                    function handle(event) {
+                        if (event.type === 'context') {
+                            resultsDiv.innerHTML = `<h3>Resposta:</h3>
+                                <div class="ai-answer">
+                                    <div class="response-text"><b>Resposta IA:</b> <span id="answerText"></span></div>
+                                    <div class="confidence-info" id="answerInfo">Gerando resposta...</div>
+                                </div>`;
+                            answerDiv = document.getElementById('answerText');
+                            if (event.results.length > 0) {
+                                document.getElementById('answerInfo').innerText = 'Gerando resposta com base em: ' + event.results.map(r => r.filename).join(', ');
+                            }
+                        } else if (event.type === 'token' && answerDiv) {
+                            answerDiv.textContent += event.text;
+                        } else if (event.type === 'done') {
+                            document.getElementById('answerInfo').innerText = `Confiança: ${Math.round(event.confidence * 100)}%`
+                                + (event.partial ? ' (resposta interrompida)' : '');
                         }
-                        resultsDiv.innerHTML = html;
-                    } else {
-                        resultsDiv.innerHTML = '<div class="no-results">Nenhum resultado encontrado.</div>';
                     }
+                    function read() {
+                        return reader.read().then(({done, value}) => {
+                            if (done) return;
+                            buffer += decoder.decode(value, {stream: true});
+                            const parts = buffer.split('\n\n');
+                            buffer = parts.pop();
+                            parts.forEach(part => {
+                                if (part.startsWith('data: ')) handle(JSON.parse(part.slice(6)));
+                            });
+                            return read();
+                        });
+                    }
+                    return read();
+                })
+                .catch(() => {
+                    resultsDiv.innerHTML = '<div class="no-results">Erro ao buscar resposta.</div>';
                 });
         }
         function reindexDocuments() {
@@ -146,11 +178,77 @@ HTML_TEMPLATE = """
 </html>
 """
 
+def _run_reindex(touched_paths, full):
+    # A reindexação incremental parte do índice em disco, então espera ele ser carregado
+    indexer.initialized.wait()
+    indexer.index_directory("documents", incremental=not full, touched_paths=touched_paths)
+
+scheduler = ReindexScheduler.from_env(_run_reindex)
+
+# Papel do processo: "standalone" (sem eleição), "leader" (watcher + reindexação)
+# ou "follower" (só atende buscas e recarrega o índice gravado pelo líder)
+process_role = "standalone"
+leader = LeaderElection(os.getenv("DOCIA_LEADER_LOCK", indexer._index_path('.leader.lock')))
+_index_watch = None
+
+# Gauges lidos na hora da coleta do /metrics
+REGISTRY.gauge("doc_ia_documents_indexed_total", "Documentos no índice carregado",
+               aggregate="max").set_function(lambda: len(indexer.documents))
+REGISTRY.gauge("doc_ia_reindex_queue_depth", "Arquivos aguardando reindexação",
+               aggregate="max").set_function(lambda: scheduler.stats()['queue_depth'])
+REGISTRY.gauge("doc_ia_generations_active", "Gerações do LLM em andamento").set_function(
+    lambda: indexer.generation_queue.active)
+# Somado entre os workers: é a métrica do HPA (k8s/hpa.yaml)
+REGISTRY.gauge("doc_ia_generations_waiting", "Gerações do LLM aguardando vaga").set_function(
+    lambda: indexer.generation_queue.waiting)
+
+def positive_int(body, name, default=None):
+    """Parâmetro inteiro positivo do JSON (``default`` se ausente); ``ValueError`` se inválido"""
+    value = body.get(name)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"'{name}' deve ser um inteiro positivo")
+    return value
+
+def _reindex_request_path():
+    return indexer._index_path('.reindex-request')
+
+def _become_leader():
+    global process_role
+    process_role = "leader"
+    if _index_watch is not None:
+        _index_watch.stop()
+    logger.info(f"Processo {os.getpid()} eleito líder: watcher e reindexações rodam aqui.")
+    start_watcher()
+    FileWatch(_reindex_request_path(), scheduler.request_reindex).start()
+    # Indexação inicial em segundo plano (fora do import): as buscas usam o índice em disco até lá
+    scheduler.request_reindex()
+
+def start_background_services():
+    """Define o papel deste processo; chamado após o fork de cada worker (ou no modo de desenvolvimento)"""
+    global process_role, _index_watch
+    os.makedirs("documents", exist_ok=True)
+    smart_metrics.configure_from_env()
+    indexer.start_background_init()
+    if leader.try_acquire():
+        _become_leader()
+    else:
+        process_role = "follower"
+        logger.info(f"Processo {os.getpid()} seguidor: recarrega o índice gravado pelo líder.")
+        _index_watch = FileWatch(indexer.index_file, lambda: indexer.load_index(refit=False))
+        _index_watch.start()
+        leader.start(_become_leader)
+    app.config['STARTUP_COMPLETE'] = True
+
 class DocumentsEventHandler(FileSystemEventHandler):
     def on_any_event(self, event):
-        if not event.is_directory and any(event.src_path.endswith(ext) for ext in ['.pdf', '.docx', '.txt']):
-            logger.info(f"Alteração detectada em '{event.src_path}'. Reindexando em background...")
-            threading.Thread(target=indexer.index_directory, args=("documents",), daemon=True).start()
+        if event.is_directory:
+            return
+        for path in (event.src_path, getattr(event, 'dest_path', None)):
+            if path and get_reader(path) is not None:
+                logger.debug(f"Alteração detectada em '{path}'. Reindexação agendada.")
+                scheduler.notify(path)
 
 def start_watcher():
     if os.path.exists("documents"):
@@ -160,6 +258,18 @@ def start_watcher():
         observer.start()
         logger.info("Monitoramento automático da pasta 'documents' ativado.")
 
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+    if 'request_started' in g:
+        HTTP_SECONDS.observe(time.perf_counter() - g.request_started, method=request.method, endpoint=endpoint)
+    return response
+
 @app.route('/')
 def index(): return render_template_string(HTML_TEMPLATE)
 
@@ -167,41 +277,94 @@ def index(): return render_template_string(HTML_TEMPLATE)
 def search_endpoint():
     query = request.json.get('query', '').strip()
     if not query: return jsonify({'success': False, 'error': 'Query vazia'})
-    results = indexer.search(query, max_results=1)
+    per_result_answers = bool(request.json.get('per_result_answers', False))
+    try:
+        max_results = positive_int(request.json, 'max_results', 1)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    results = indexer.search(query, max_results=max_results, per_result_answers=per_result_answers)
     return jsonify({'success': True, 'results': results})
 
+@app.route('/search/batch', methods=['POST'])
+def search_batch_endpoint():
+    """Busca em lote: várias perguntas em uma requisição"""
+    queries = [q.strip() for q in request.json.get('queries', []) if isinstance(q, str) and q.strip()]
+    if not queries: return jsonify({'success': False, 'error': 'Nenhuma pergunta informada'})
+    try:
+        max_results = positive_int(request.json, 'max_results', 1)
+        concurrency = positive_int(request.json, 'concurrency')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    items = indexer.search_batch(queries, max_results=max_results, concurrency=concurrency)
+    return jsonify({'success': True, 'items': items})
+
+@app.route('/search/answer', methods=['POST'])
+def search_answer_endpoint():
+    """Resposta sob demanda para um resultado específico de uma busca"""
+    query = request.json.get('query', '').strip()
+    doc_id = request.json.get('id')
+    if not query or doc_id is None: return jsonify({'success': False, 'error': 'Informe query e id'})
+    try:
+        max_results = positive_int(request.json, 'max_results', 10)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    result = indexer.answer_result(query, doc_id, max_results=max_results)
+    if result is None: return jsonify({'success': False, 'error': 'Resultado não encontrado'}), 404
+    return jsonify({'success': True, 'result': result})
+
+@app.route('/search/stream', methods=['POST'])
+def search_stream_endpoint():
+    """Busca com resposta em streaming (Server-Sent Events)"""
+    query = request.json.get('query', '').strip()
+    if not query: return jsonify({'success': False, 'error': 'Query vazia'})
+
+    def generate():
+        for event in indexer.search_stream(query, max_results=1):
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/documents/<int:doc_id>')
+def document_endpoint(doc_id):
+    """Conteúdo completo de um documento (as buscas devolvem só o chunk encontrado)"""
+    document = indexer.get_document(doc_id)
+    if document is None: return jsonify({'success': False, 'error': 'Documento não encontrado'}), 404
+    return jsonify({'success': True, 'document': document})
+
 @app.route('/index', methods=['POST'])
 def index_documents_endpoint():
-    threading.Thread(target=indexer.index_directory, args=("documents",), daemon=True).start()
+    if process_role == "follower":
+        # Só o líder reindexa: deixa o pedido para ele
+        touch(_reindex_request_path())
+    else:
+        scheduler.request_reindex()
     return jsonify({'success': True, 'message': 'Reindexação iniciada em background.'})
 
 @app.route('/stats')
 def stats_endpoint():
     stats_data = indexer.get_stats()
-    return jsonify({'success': True, **stats_data})
+    stats_data['startup'].update(import_seconds=import_seconds, budget=STARTUP_BUDGET)
+    return jsonify({'success': True, **stats_data, 'reindex': scheduler.stats(),
+                    'process': {'role': process_role, 'pid': os.getpid()},
+                    'generations': indexer.generation_stats()})
+
+@app.route('/metrics')
+def metrics():
+    """Métricas no formato do Prometheus (somadas entre os workers com DOCIA_METRICS_DIR)"""
+    return Response(REGISTRY.render(), mimetype=smart_metrics.CONTENT_TYPE)
 
 @app.route('/health')
 def health():
     """Health check endpoint for Kubernetes liveness probe"""
-    try:
-        # Verificar se o indexador está funcionando
-        if hasattr(indexer, 'search_documents'):
-            return jsonify({
-                'status': 'healthy',
-                'timestamp': datetime.now().isoformat(),
-                'version': '2.3.0',
-                'ollama_status': _check_ollama_status()
-            }), 200
-        else:
-            return jsonify({
-                'status': 'unhealthy',
-                'error': 'Indexer not initialized'
-            }), 503
-    except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e)
-        }), 503
+    # Responde na hora, mesmo durante a inicialização em segundo plano (só lê estado em cache)
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'version': '2.3.0',
+        'initialized': indexer.initialized.is_set(),
+        'ollama_status': _check_ollama_status()
+    }), 200
 
 @app.route('/ready')
 def ready():
@@ -232,7 +395,8 @@ def startup():
     try:
         # Verificar se a aplicação completou a inicialização
         startup_complete = (
-            hasattr(indexer, 'search_documents') and
+            indexer.initialized.is_set() and
+            indexer.is_ready() and
             os.path.exists('documents') and
             app.config.get('STARTUP_COMPLETE', False)
         )
@@ -254,35 +418,27 @@ def startup():
         }), 503
 
 def _check_ollama_status():
-    """Verificar status detalhado do Ollama"""
-    try:
-        response = requests.get('http://localhost:11434/api/tags', timeout=2)
-        if response.status_code == 200:
-            tags = response.json()
-            models = [model['name'] for model in tags.get('models', [])]
-            return {
-                'available': True,
-                'models': models,
-                'mistral_available': any('mistral' in model.lower() for model in models)
-            }
-    except:
-        pass
-    return {'available': False}
+    """Verificar status detalhado do Ollama (saúde em cache do cliente)"""
+    health = indexer.llm_client.health
+    if health['available']:
+        models = health['models']
+        return {
+            'available': True,
+            'models': models,
+            'mistral_available': any('mistral' in model.lower() for model in models),
+            'circuit_breaker': indexer.llm_client.breaker.state
+        }
+    return {'available': False, 'circuit_breaker': indexer.llm_client.breaker.state}
 
 def _check_ollama_available():
     """Verificar se Ollama está disponível (simpler check)"""
-    try:
-        response = requests.get('http://localhost:11434/api/tags', timeout=2)
-        return response.status_code == 200
-    except:
-        return False
+    return indexer.llm_client.is_available()
+
+import_seconds = time.perf_counter() - _import_started
+if import_seconds > STARTUP_BUDGET:
+    logger.warning(f"Import do app levou {import_seconds:.2f}s (orçamento: {STARTUP_BUDGET:.2f}s)")
 
 if __name__ == '__main__':
-    if not os.path.exists("documents"): os.makedirs("documents")
-    indexer.index_directory("documents")
-    start_watcher()
-    
-    # Marcar inicialização como completa para health checks
-    app.config['STARTUP_COMPLETE'] = True
-    
+    # Servidor de desenvolvimento (um processo). Em produção: gunicorn -c gunicorn.conf.py smart_app:app
+    start_background_services()
     app.run(host='0.0.0.0', port=5000)
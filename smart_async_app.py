@@ -0,0 +1,250 @@
+"""Servidor asyncio (aiohttp) com as mesmas rotas de ``smart_app``.
+
+Cada pergunta em ``/search`` é uma corrotina: a recuperação roda num pool
+de threads e a geração espera por uma vaga entre as
+``DOCIA_MAX_GENERATIONS`` do processo (fila e prazo de ``smart_admission``),
+sem prender uma thread enquanto o Ollama responde. Acima de ``DOCIA_MAX_INFLIGHT`` buscas pendentes o
+servidor responde 503 na hora (com ``Retry-After``) em vez de enfileirar
+sem limite. Indexador, agendador e eleição de líder são os de
+``smart_app``.
+
+Produção: ``gunicorn -c gunicorn.conf.py`` (o padrão é este app com o
+worker ``aiohttp.GunicornWebWorker``).
+"""
+import os
+import json
+import time
+import logging
+from datetime import datetime
+
+from aiohttp import web
+
+import smart_app
+import smart_metrics
+from smart_metrics import HTTP_REQUESTS, HTTP_SECONDS, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MAX_INFLIGHT = int(os.getenv("DOCIA_MAX_INFLIGHT", "256"))
+# Rotas que passam pelo limite de buscas pendentes
+_LIMITED_PATHS = ("/search", "/search/stream", "/search/batch", "/search/answer")
+
+
+def _indexer():
+    # Lido a cada requisição: os testes (e recargas) trocam ``smart_app.indexer``
+    return smart_app.indexer
+
+
+class InflightLimiter:
+    """Conta buscas em andamento e recusa as que passam de ``max_inflight``"""
+
+    def __init__(self, max_inflight):
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self.rejected = 0
+
+    def stats(self):
+        return {'inflight': self.inflight, 'max_inflight': self.max_inflight, 'rejected': self.rejected}
+
+
+LIMITER = web.AppKey("limiter", InflightLimiter)
+
+
+@web.middleware
+async def instrument(request, handler):
+    """Conta e mede as requisições por rota (inclusive as recusadas pelo limite)"""
+    started = time.perf_counter()
+    resource = request.match_info.route.resource
+    endpoint = resource.canonical if resource is not None else "unmatched"
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=status)
+        HTTP_SECONDS.observe(time.perf_counter() - started, method=request.method, endpoint=endpoint)
+
+
+@web.middleware
+async def backpressure(request, handler):
+    """Rejeita buscas acima de ``max_inflight`` em vez de acumulá-las na memória"""
+    if request.path not in _LIMITED_PATHS:
+        return await handler(request)
+    limiter = request.app[LIMITER]
+    if limiter.inflight >= limiter.max_inflight:
+        limiter.rejected += 1
+        return web.json_response({'success': False, 'error': 'Servidor ocupado, tente novamente'},
+                                 status=503, headers={'Retry-After': '1'})
+    limiter.inflight += 1
+    try:
+        return await handler(request)
+    finally:
+        limiter.inflight -= 1
+
+
+async def _json_body(request):
+    try:
+        body = await request.json()
+    except (ValueError, UnicodeDecodeError):
+        raise web.HTTPBadRequest(text=json.dumps({'success': False, 'error': 'JSON inválido'}),
+                                 content_type='application/json')
+    return body if isinstance(body, dict) else {}
+
+
+def _positive_int(body, name, default=None):
+    """``smart_app.positive_int`` com 400 para valores inválidos"""
+    try:
+        return smart_app.positive_int(body, name, default)
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False),
+                                 content_type='application/json')
+
+
+async def index(request):
+    return web.Response(text=smart_app.HTML_TEMPLATE, content_type='text/html')
+
+
+async def search(request):
+    body = await _json_body(request)
+    query = str(body.get('query', '')).strip()
+    if not query:
+        return web.json_response({'success': False, 'error': 'Query vazia'})
+    results = await _indexer().asearch(query, max_results=_positive_int(body, 'max_results', 1),
+                                       per_result_answers=bool(body.get('per_result_answers', False)))
+    return web.json_response({'success': True, 'results': results})
+
+
+async def search_stream(request):
+    """Busca com resposta em streaming (Server-Sent Events)"""
+    body = await _json_body(request)
+    query = str(body.get('query', '')).strip()
+    if not query:
+        return web.json_response({'success': False, 'error': 'Query vazia'})
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache',
+                                           'X-Accel-Buffering': 'no'})
+    await response.prepare(request)
+    async for event in _indexer().asearch_stream(query, max_results=1):
+        await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+    await response.write_eof()
+    return response
+
+
+async def search_batch(request):
+    """Busca em lote: recuperação vetorizada no pool de busca, gerações em corrotinas"""
+    body = await _json_body(request)
+    queries = [q.strip() for q in body.get('queries', []) if isinstance(q, str) and q.strip()]
+    if not queries:
+        return web.json_response({'success': False, 'error': 'Nenhuma pergunta informada'})
+    max_results, concurrency = _positive_int(body, 'max_results', 1), _positive_int(body, 'concurrency')
+    items = await _indexer().asearch_batch(queries, max_results, concurrency)
+    return web.json_response({'success': True, 'items': items})
+
+
+async def search_answer(request):
+    """Resposta sob demanda para um resultado específico de uma busca"""
+    body = await _json_body(request)
+    query = str(body.get('query', '')).strip()
+    doc_id = body.get('id')
+    if not query or doc_id is None:
+        return web.json_response({'success': False, 'error': 'Informe query e id'})
+    max_results = _positive_int(body, 'max_results', 10)
+    result = await _indexer().aanswer_result(query, doc_id, max_results)
+    if result is None:
+        return web.json_response({'success': False, 'error': 'Resultado não encontrado'}, status=404)
+    return web.json_response({'success': True, 'result': result})
+
+
+async def document(request):
+    """Conteúdo completo de um documento (as buscas devolvem só o chunk encontrado)"""
+    indexer = _indexer()
+    document = await indexer._run_blocking(indexer.get_document, int(request.match_info['doc_id']))
+    if document is None:
+        return web.json_response({'success': False, 'error': 'Documento não encontrado'}, status=404)
+    return web.json_response({'success': True, 'document': document})
+
+
+async def index_documents(request):
+    if smart_app.process_role == "follower":
+        smart_app.touch(smart_app._reindex_request_path())
+    else:
+        smart_app.scheduler.request_reindex()
+    return web.json_response({'success': True, 'message': 'Reindexação iniciada em background.'})
+
+
+async def stats(request):
+    indexer = _indexer()
+    stats_data = indexer.get_stats()
+    stats_data['startup'].update(import_seconds=smart_app.import_seconds, budget=smart_app.STARTUP_BUDGET)
+    return web.json_response({
+        'success': True, **stats_data, 'reindex': smart_app.scheduler.stats(),
+        'process': {'role': smart_app.process_role, 'pid': os.getpid()},
+        'requests': request.app[LIMITER].stats(),
+        'generations': indexer.generation_stats(),
+    })
+
+
+async def metrics(request):
+    """Métricas no formato do Prometheus (somadas entre os workers com DOCIA_METRICS_DIR)"""
+    return web.Response(body=REGISTRY.render().encode('utf-8'),
+                        headers={'Content-Type': smart_metrics.CONTENT_TYPE})
+
+
+async def health(request):
+    """Health check endpoint for Kubernetes liveness probe"""
+    return web.json_response({'status': 'healthy', 'timestamp': datetime.now().isoformat(), 'version': '2.3.0',
+                              'initialized': _indexer().initialized.is_set(),
+                              'ollama_status': smart_app._check_ollama_status()})
+
+
+async def ready(request):
+    """Readiness check endpoint for Kubernetes readiness probe"""
+    if not os.path.exists('documents'):
+        return web.json_response({'status': 'not_ready', 'error': 'Documents directory not found'}, status=503)
+    return web.json_response({'status': 'ready', 'timestamp': datetime.now().isoformat(),
+                              'documents_indexed': len(_indexer().documents),
+                              'ollama_available': smart_app._check_ollama_available()})
+
+
+async def startup(request):
+    """Startup check endpoint for Kubernetes startup probe"""
+    indexer = _indexer()
+    if indexer.initialized.is_set() and indexer.is_ready() and os.path.exists('documents') and smart_app.app.config.get('STARTUP_COMPLETE', False):
+        return web.json_response({'status': 'started', 'timestamp': datetime.now().isoformat()})
+    return web.json_response({'status': 'starting', 'message': 'Application is still starting up'}, status=503)
+
+
+async def _close_llm_sessions(app):
+    await _indexer().llm_client.aclose()
+
+
+def create_app(max_inflight=MAX_INFLIGHT):
+    app = web.Application(middlewares=[instrument, backpressure])
+    limiter = app[LIMITER] = InflightLimiter(max_inflight)
+    REGISTRY.gauge("doc_ia_requests_inflight", "Buscas em andamento no app asyncio").set_function(
+        lambda: limiter.inflight)
+    app.router.add_get('/', index)
+    app.router.add_post('/search', search)
+    app.router.add_post('/search/stream', search_stream)
+    app.router.add_post('/search/batch', search_batch)
+    app.router.add_post('/search/answer', search_answer)
+    app.router.add_get(r'/documents/{doc_id:\d+}', document)
+    app.router.add_post('/index', index_documents)
+    app.router.add_get('/stats', stats)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/health', health)
+    app.router.add_get('/ready', ready)
+    app.router.add_get('/startup', startup)
+    app.on_cleanup.append(_close_llm_sessions)
+    return app
+
+
+app = create_app()
+
+if __name__ == '__main__':
+    # Servidor de desenvolvimento (um processo)
+    smart_app.start_background_services()
+    web.run_app(app, host='0.0.0.0', port=5000)
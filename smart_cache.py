@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+import re
+import uuid
+from collections import OrderedDict
+
+from smart_metrics import CACHE_HITS, CACHE_MISSES
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question):
+    """Normaliza a pergunta: minúsculas, sem acentos, sem pontuação e espaços extras"""
+    text = unicodedata.normalize('NFKD', question.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+
+class AnswerCache:
+    """Cache de respostas do LLM com despejo LRU + TTL.
+
+    A chave combina a pergunta normalizada com os identificadores dos chunks
+    usados como contexto (hash do documento + posição do chunk). Cada entrada
+    guarda os ids dos documentos que contribuíram para a resposta, e
+    ``invalidate_documents`` remove todas as entradas afetadas por uma
+    reindexação.
+
+    Com ``directory`` definido, as entradas também são gravadas em disco
+    (um JSON por chave) para que outras réplicas com o mesmo volume possam
+    reaproveitá-las. Como a chave inclui o hash do conteúdo dos documentos,
+    uma entrada em disco de uma versão antiga de um documento simplesmente
+    deixa de ser encontrada e expira pelo TTL.
+
+    O diretório é limpo durante as gravações: a cada ``max_disk_entries / 10``
+    entradas gravadas, as vencidas são apagadas e, acima de
+    ``max_disk_entries`` (0: sem limite), as mais antigas também.
+    """
+
+    def __init__(self, max_entries=1000, ttl=3600.0, directory=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._by_document = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._sweep_every = max(1, max_disk_entries // 10)
+        # A primeira gravação já limpa o que outras execuções deixaram
+        self._writes_since_sweep = self._sweep_every
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv("DOCIA_ANSWER_CACHE_SIZE", "1000")),
+            ttl=float(os.getenv("DOCIA_ANSWER_CACHE_TTL", "3600")),
+            directory=os.getenv("DOCIA_ANSWER_CACHE_DIR") or None,
+            max_disk_entries=int(os.getenv("DOCIA_ANSWER_CACHE_DISK_SIZE", "10000")),
+        )
+
+    @staticmethod
+    def make_key(question, chunk_keys):
+        """Chave do cache: pergunta normalizada + chunks de contexto"""
+        raw = normalize_question(question) + '\0' + '\0'.join(sorted(chunk_keys))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry['created_at'] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                CACHE_HITS.inc(cache='answer')
+                return entry['answer']
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                CACHE_MISSES.inc(cache='answer')
+                return None
+            self.hits += 1
+            CACHE_HITS.inc(cache='answer')
+            self._store(key, entry)
+        return entry['answer']
+
+    def put(self, key, answer, doc_ids):
+        entry = {'answer': answer, 'doc_ids': sorted(set(doc_ids)), 'created_at': time.time()}
+        with self._lock:
+            self._store(key, entry)
+        self._write_disk(key, entry)
+
+    def invalidate_documents(self, doc_ids):
+        """Remove as respostas que usaram algum dos documentos informados"""
+        removed = 0
+        with self._lock:
+            for doc_id in doc_ids:
+                for key in list(self._by_document.get(doc_id, ())):
+                    self._remove(key)
+                    self._delete_disk(key)
+                    removed += 1
+        if removed:
+            logger.info(f"Cache de respostas: {removed} entradas invalidadas por reindexação.")
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._delete_disk(key)
+            self._entries.clear()
+            self._by_document.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    # ---- Internos (chamados com o lock) ---------------------------------
+
+    def _store(self, key, entry):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        for doc_id in entry['doc_ids']:
+            self._by_document.setdefault(doc_id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for doc_id in entry['doc_ids']:
+            keys = self._by_document.get(doc_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_document[doc_id]
+
+    # ---- Backend em disco -------------------------------------------------
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get('created_at', 0) > self.ttl:
+            self._delete_disk(key)
+            return None
+        return entry
+
+    def _write_disk(self, key, entry):
+        if not self.directory:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Nome único: duas threads gravando a mesma chave não dividem o temporário
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar o cache de respostas em disco: {e}")
+            return
+        with self._lock:
+            self._writes_since_sweep += 1
+            sweep = self._writes_since_sweep >= self._sweep_every
+            if sweep:
+                self._writes_since_sweep = 0
+        if sweep:
+            self._sweep_disk()
+
+    def _sweep_disk(self):
+        """Apaga as entradas vencidas e, acima de ``max_disk_entries``, as mais antigas.
+
+        A idade vem do mtime do arquivo (o momento da gravação), sem abrir
+        os JSONs; réplicas que dividem o diretório limpam as entradas umas
+        das outras. Temporários de gravações em andamento não contam nem são
+        apagados, a não ser os abandonados há mais que o TTL.
+        """
+        now = time.time()
+        files, orphans = [], []
+        try:
+            shards = [entry.path for entry in os.scandir(self.directory) if entry.is_dir()]
+        except OSError:
+            return
+        for shard in shards:
+            try:
+                with os.scandir(shard) as entries:
+                    for entry in entries:
+                        try:
+                            mtime = entry.stat().st_mtime
+                        except OSError:
+                            continue
+                        if entry.name.endswith('.json'):
+                            files.append((mtime, entry.path))
+                        elif now - mtime > self.ttl:
+                            orphans.append(entry.path)
+            except OSError:
+                continue
+        files.sort(reverse=True)
+        fresh = [path for mtime, path in files if now - mtime <= self.ttl]
+        removed = [path for mtime, path in files if now - mtime > self.ttl]
+        if self.max_disk_entries:
+            removed += fresh[self.max_disk_entries:]
+        for path in removed + orphans:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if removed:
+            logger.info(f"Cache de respostas em disco: {len(removed)} entradas removidas.")
+
+    def _delete_disk(self, key):
+        if not self.directory:
+            return
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+
+class PageTextCache:
+    """Cache em disco do texto extraído de cada página, por (hash do arquivo, página).
+
+    Uma extração interrompida (timeout, página com erro) deixa gravadas as
+    páginas já extraídas, e a próxima tentativa só processa as que faltam.
+    Quando todas as páginas foram extraídas, ``complete`` registra o total
+    e o arquivo pode ser relido sem abrir o PDF.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @classmethod
+    def from_env(cls):
+        directory = os.getenv("DOCIA_PAGE_CACHE_DIR")
+        return cls(directory) if directory else None
+
+    def _path(self, file_hash, name):
+        return os.path.join(self.directory, file_hash[:2], file_hash, name)
+
+    def get(self, file_hash, page):
+        try:
+            with open(self._path(file_hash, f"{page}.txt"), 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            CACHE_MISSES.inc(cache='pdf_page')
+            return None
+        CACHE_HITS.inc(cache='pdf_page')
+        return text
+
+    def put(self, file_hash, page, text):
+        self._write(self._path(file_hash, f"{page}.txt"), text)
+
+    def page_count(self, file_hash):
+        """Total de páginas se a extração do arquivo já terminou, senão ``None``"""
+        try:
+            with open(self._path(file_hash, "pages.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)['pages']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def complete(self, file_hash, pages):
+        self._write(self._path(file_hash, "pages.json"), json.dumps({'pages': pages}))
+
+    def discard(self, file_hash):
+        """Remove as páginas de uma versão de arquivo que saiu do índice"""
+        directory = os.path.dirname(self._path(file_hash, "pages.json"))
+        try:
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+        except OSError:
+            pass
+
+    def _write(self, path, text):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Nome único: duas threads gravando a mesma chave não dividem o temporário
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar o cache de páginas: {e}")
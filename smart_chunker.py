@@ -0,0 +1,186 @@
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Separador de páginas gravado pelos leitores (mesma convenção do pdftotext)
+PAGE_BREAK = "\f"
+
+_PARAGRAPH_RE = re.compile(r"\n[ \t\r]*\n")
+# Fim de frase: pontuação seguida de espaço e de algo que começa uma frase nova
+SENTENCE_RE = re.compile(r"(?<=[.!?…;])[\"'”)]*\s+(?=[\"'“(]*[A-ZÀ-ÖØ-Ý0-9§•–-])")
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+class TokenCounter:
+    """Conta tokens do modelo de linguagem.
+
+    Com ``tokenizer_name`` usa o tokenizador do Hugging Face (carregado só
+    do cache local, na primeira chamada). Sem ele, estima a contagem de um
+    tokenizador BPE/SentencePiece: cada pontuação vale um token e cada
+    palavra ``ceil(len / 4)`` tokens, o que fica próximo do Mistral em
+    textos em português.
+    """
+
+    def __init__(self, tokenizer_name=None):
+        self.tokenizer_name = tokenizer_name
+        self._tokenizer = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("DOCIA_TOKENIZER") or None)
+
+    @property
+    def name(self):
+        return self.tokenizer_name or "estimativa"
+
+    def __call__(self, text):
+        if self.tokenizer_name:
+            if self._tokenizer is None:
+                from transformers import AutoTokenizer
+
+                logger.info(f"Carregando tokenizador: {self.tokenizer_name}")
+                self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name, local_files_only=True)
+            return len(self._tokenizer.encode(text, add_special_tokens=False))
+        return sum((len(token) + 3) // 4 for token in _TOKEN_RE.findall(text))
+
+
+class Chunk:
+    """Trecho de um documento: intervalo de caracteres, página e tamanho em tokens"""
+
+    __slots__ = ('start', 'end', 'page', 'tokens')
+
+    def __init__(self, start, end, page, tokens):
+        self.start = start
+        self.end = end
+        self.page = page
+        self.tokens = tokens
+
+    def __repr__(self):
+        return f"Chunk({self.start}, {self.end}, page={self.page}, tokens={self.tokens})"
+
+
+class StructuredChunker:
+    """Divide o texto respeitando páginas, parágrafos e frases, com tamanho em tokens.
+
+    Um chunk nunca atravessa uma quebra de página (``PAGE_BREAK``). Dentro
+    da página, parágrafos inteiros são agrupados até ``max_tokens``; um
+    parágrafo maior é quebrado entre frases, e só uma frase sozinha maior
+    que o limite é cortada entre palavras. Não há sobreposição de texto:
+    os chunks vizinhos são reconstituídos pelos offsets na hora de montar
+    o contexto.
+    """
+
+    VERSION = 1
+
+    def __init__(self, max_tokens=400, min_tokens=40, counter=None):
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.counter = counter or TokenCounter()
+
+    @classmethod
+    def from_env(cls):
+        return cls(max_tokens=int(os.getenv("DOCIA_CHUNK_TOKENS", "400")),
+                   min_tokens=int(os.getenv("DOCIA_CHUNK_MIN_TOKENS", "40")),
+                   counter=TokenCounter.from_env())
+
+    @property
+    def signature(self):
+        """Identifica a configuração: documentos com outra assinatura são rechunkados"""
+        return f"v{self.VERSION}:{self.max_tokens}:{self.min_tokens}:{self.counter.name}"
+
+    def chunk(self, text):
+        """Retorna a lista de ``Chunk`` do texto, em ordem"""
+        chunks = []
+        page_start = 0
+        for page_number, page_end in enumerate(self._page_ends(text), start=1):
+            chunks.extend(self._chunk_page(text, page_start, page_end, page_number))
+            page_start = page_end + len(PAGE_BREAK)
+        return chunks
+
+    def chunk_page(self, text, page):
+        """Chunks de uma única página, com offsets relativos a ela.
+
+        Serve para chunkar um documento à medida que as páginas são
+        extraídas: o resultado, deslocado pelo início de cada página, é o
+        mesmo de ``chunk`` sobre as páginas unidas por ``PAGE_BREAK``.
+        """
+        return self._chunk_page(text, 0, len(text), page)
+
+    def spans(self, text):
+        return [(chunk.start, chunk.end) for chunk in self.chunk(text)]
+
+    @staticmethod
+    def _page_ends(text):
+        ends, pos = [], text.find(PAGE_BREAK)
+        while pos >= 0:
+            ends.append(pos)
+            pos = text.find(PAGE_BREAK, pos + 1)
+        ends.append(len(text))
+        return ends
+
+    def _chunk_page(self, text, start, end, page):
+        chunks, current, current_tokens = [], None, 0
+
+        def flush():
+            if current is not None:
+                chunks.append(Chunk(current[0], current[1], page, current_tokens))
+
+        for unit_start, unit_end, tokens in self._units(text, start, end):
+            if current is not None and current_tokens + tokens <= self.max_tokens:
+                current, current_tokens = (current[0], unit_end), current_tokens + tokens
+                continue
+            flush()
+            current, current_tokens = (unit_start, unit_end), tokens
+        flush()
+        # Um resto muito pequeno no fim da página vai para o chunk anterior
+        if len(chunks) > 1 and chunks[-1].tokens < self.min_tokens \
+                and chunks[-2].tokens + chunks[-1].tokens <= self.max_tokens + self.min_tokens:
+            last = chunks.pop()
+            chunks[-1] = Chunk(chunks[-1].start, last.end, page, chunks[-1].tokens + last.tokens)
+        return chunks
+
+    def _units(self, text, start, end):
+        """Parágrafos que cabem no limite, senão frases, senão janelas de palavras"""
+        for p_start, p_end in self._split(text, start, end, _PARAGRAPH_RE):
+            tokens = self.counter(text[p_start:p_end])
+            if tokens <= self.max_tokens:
+                yield p_start, p_end, tokens
+                continue
+            for s_start, s_end in self._split(text, p_start, p_end, SENTENCE_RE):
+                tokens = self.counter(text[s_start:s_end])
+                if tokens <= self.max_tokens:
+                    yield s_start, s_end, tokens
+                else:
+                    yield from self._word_windows(text, s_start, s_end)
+
+    @staticmethod
+    def _split(text, start, end, pattern):
+        """Intervalos entre as ocorrências de ``pattern``, sem espaços nas pontas"""
+        pieces, pos = [], start
+        for match in pattern.finditer(text, start, end):
+            pieces.append((pos, match.start()))
+            pos = match.end()
+        pieces.append((pos, end))
+        spans = []
+        for piece_start, piece_end in pieces:
+            segment = text[piece_start:piece_end]
+            stripped = segment.strip()
+            if stripped:
+                offset = piece_start + segment.index(stripped[0])
+                spans.append((offset, offset + len(stripped)))
+        return spans
+
+    def _word_windows(self, text, start, end):
+        window_start, window_end, tokens = None, None, 0
+        for match in re.finditer(r"\S+", text[start:end]):
+            word_tokens = self.counter(match.group())
+            if window_start is not None and tokens + word_tokens > self.max_tokens:
+                yield window_start, window_end, tokens
+                window_start, tokens = None, 0
+            if window_start is None:
+                window_start = start + match.start()
+            window_end, tokens = start + match.end(), tokens + word_tokens
+        if window_start is not None:
+            yield window_start, window_end, tokens
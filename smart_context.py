@@ -0,0 +1,119 @@
+import os
+import re
+import logging
+
+from smart_chunker import SENTENCE_RE, TokenCounter
+
+logger = logging.getLogger(__name__)
+
+_WORD_GAP_RE = re.compile(r"\s+")
+
+
+class PackedContext:
+    """Contexto final do prompt e os chunks/documentos que entraram nele"""
+
+    __slots__ = ('text', 'chunk_keys', 'doc_ids', 'tokens')
+
+    def __init__(self, text, chunk_keys, doc_ids, tokens):
+        self.text = text
+        self.chunk_keys = chunk_keys
+        self.doc_ids = doc_ids
+        self.tokens = tokens
+
+
+class ContextPacker:
+    """Monta o contexto do prompt dentro de um orçamento de tokens.
+
+    Recebe trechos em ordem de prioridade, cada um um dict com ``id``,
+    ``content`` (texto do documento, ou de um trecho dele que contenha todos
+    os chunks pedidos; o mesmo para todos os trechos de um ``id``),
+    ``start``/``end`` (offsets do chunk em ``content``) e ``chunk_key``. Um trecho só consome orçamento pela parte
+    ainda não coberta por trechos já escolhidos do mesmo documento, e
+    trechos sobrepostos ou vizinhos viram uma passagem contínua. Um trecho
+    que não cabe inteiro é cortado no fim de uma frase. ``neighbours`` é
+    quantos chunks vizinhos de cada resultado o indexador oferece depois
+    dos resultados, para completar o orçamento.
+    """
+
+    def __init__(self, max_tokens=1500, min_tokens=30, neighbours=1, counter=None):
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.neighbours = neighbours
+        self.counter = counter or TokenCounter()
+
+    @classmethod
+    def from_env(cls, counter=None):
+        return cls(max_tokens=int(os.getenv("DOCIA_CONTEXT_TOKENS", "1500")),
+                   neighbours=int(os.getenv("DOCIA_CONTEXT_NEIGHBOURS", "1")),
+                   counter=counter or TokenCounter.from_env())
+
+    def pack(self, pieces):
+        """Escolhe os trechos em ordem até esgotar o orçamento e monta o texto"""
+        selected, order, keys = {}, [], []
+        used = 0
+        for piece in pieces:
+            content = piece['content']
+            intervals = selected.setdefault(piece['id'], [])
+            added = False
+            for start, end in self._uncovered(intervals, piece['start'], piece['end']):
+                if not content[start:end].strip():
+                    continue
+                tokens = self.counter(content[start:end])
+                if used + tokens > self.max_tokens:
+                    remaining = self.max_tokens - used
+                    if remaining < self.min_tokens:
+                        break
+                    end = start + len(self.fit(content[start:end], remaining))
+                    tokens = self.counter(content[start:end])
+                    if end <= start:
+                        break
+                intervals.append((start, end))
+                used += tokens
+                added = True
+            if added:
+                keys.append(piece['chunk_key'])
+                if piece['id'] not in order:
+                    order.append(piece['id'])
+            if used >= self.max_tokens - self.min_tokens:
+                break
+
+        contents = {piece['id']: piece['content'] for piece in pieces}
+        passages = []
+        for doc_id in order:
+            content = contents[doc_id]
+            passages.extend(content[start:end].strip() for start, end in self._merge(content, selected[doc_id]))
+        return PackedContext("\n\n".join(passages), keys, order, used)
+
+    def fit(self, text, max_tokens):
+        """Maior prefixo de ``text`` com até ``max_tokens``, terminando numa frase (ou palavra)"""
+        if self.counter(text) <= max_tokens:
+            return text
+        for pattern in (SENTENCE_RE, _WORD_GAP_RE):
+            end, used = 0, 0
+            for match in pattern.finditer(text + " "):
+                tokens = self.counter(text[end:match.start()])
+                if used + tokens > max_tokens:
+                    break
+                end, used = match.start(), used + tokens
+            if end:
+                return text[:end]
+        return ""
+
+    @staticmethod
+    def _uncovered(intervals, start, end):
+        """Partes de [start, end) fora dos intervalos já escolhidos"""
+        parts = [(start, end)]
+        for s, e in intervals:
+            parts = [piece for a, b in parts for piece in ((a, min(b, s)), (max(a, e), b)) if piece[0] < piece[1]]
+        return sorted(parts)
+
+    @staticmethod
+    def _merge(content, intervals):
+        """Junta intervalos sobrepostos ou separados só por espaços, em ordem de offset"""
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and not content[merged[-1][1]:start].strip():
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
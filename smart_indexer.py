@@ -1,50 +1,366 @@
 import os
 import json
+import hashlib
+import importlib.util
 from datetime import datetime
-import PyPDF2
-from docx import Document
 import logging
 import re
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
 import warnings
 import string
 import threading
+import time
+import signal
+import asyncio
+import tempfile
+import functools
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from smart_admission import AdmissionRejected, GenerationQueue
+from smart_llm import OllamaClient, StreamInterrupted
+from smart_metrics import LLM_FALLBACKS, LLM_RETRIES, STAGE_SECONDS
+from smart_cache import AnswerCache, PageTextCache
+from smart_chunker import PAGE_BREAK, StructuredChunker
+from smart_context import ContextPacker
+from smart_readers import CHEAP, DEFAULT_EXCLUDE, EXPENSIVE, get_reader, globs_from_env, register_reader, walk_documents
+from smart_retrievers import (DEFAULT_EMBEDDING_MODEL, BM25Index, DenseIndex, TransformersEmbedder,
+                              reciprocal_rank_fusion)
+from smart_store import DocumentStore, DocumentStoreBuilder, byte_spans
 
 warnings.filterwarnings("ignore")
 
+INDEX_FORMAT_VERSION = 3
+# Formato das chaves de chunk (``_chunk_key``) gravadas no índice BM25
+CHUNK_KEY_VERSION = 2
+# Fim do ``<índice>.text``: marca + id da gravação (16 bytes), repetido no JSON
+TEXT_TRAILER_MAGIC = b'DOCIATXT'
+TEXT_TRAILER_SIZE = len(TEXT_TRAILER_MAGIC) + 16
+
+# sklearn, scipy, PyPDF2, python-docx e transformers são importados só quando
+# usados (vetorização, leitura de PDF/DOCX, modelo HF), para o import ser rápido
+
+# Modelos de fallback cujas respostas não entram no cache
+FALLBACK_MODELS = ("sistema_aprimorado", "sistema_basico")
+
+# Confiança de uma resposta do Mistral cortada no meio do stream
+PARTIAL_ANSWER_CONFIDENCE = 0.4
+
+# Opções de geração enviadas ao Ollama/Mistral
+OLLAMA_OPTIONS = {
+    "temperature": 0.3,  # Diminui criatividade
+    "num_predict": 300,  # Respostas mais concisas
+    "top_p": 0.8,
+    "repeat_penalty": 1.1,
+    "top_k": 20
+}
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@contextmanager
+def _time_limit(seconds):
+    """Interrompe o bloco com TimeoutError após ``seconds`` (onde há SIGALRM)"""
+    if not seconds or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+
+    def _raise_timeout(signum, frame):
+        raise TimeoutError(f"extração excedeu {seconds}s")
+
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _extract_worker(file_path, timeout, file_hash=None, page_cache=None, chunker=None):
+    """Executado no pool de processos: extrai um arquivo com limite de tempo"""
+    try:
+        with _time_limit(timeout):
+            return SmartDocumentIndexer._read_document(file_path, file_hash, page_cache, chunker)
+    except TimeoutError as e:
+        logger.error(f"Extração de {file_path} interrompida: {e}")
+        return ""
+
+
+class PagedText:
+    """Documento extraído página a página (ver ``_spool_pages``).
+
+    O texto fica num arquivo temporário em UTF-8 (``path``), que o store
+    copia e o indexador apaga; ``fields`` são os campos de chunking e
+    ``byte_spans`` os intervalos dos chunks em bytes. ``partial`` indica
+    páginas que falharam na extração. Falso quando não há texto.
+    """
+
+    __slots__ = ('path', 'fields', 'byte_spans', 'nbytes', 'partial')
+
+    def __init__(self, path, fields, byte_spans, nbytes, partial):
+        self.path = path
+        self.fields = fields
+        self.byte_spans = byte_spans
+        self.nbytes = nbytes
+        self.partial = partial
+
+    def __bool__(self):
+        return self.nbytes > 0
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _spool_pages(pages, chunker):
+    """Chunka cada página assim que ela é extraída e grava o texto num arquivo temporário.
+
+    Só uma página fica em memória por vez. As páginas são separadas por
+    ``PAGE_BREAK``, como no texto que ``_read_pdf`` monta, e os chunks são
+    os mesmos de ``chunker.chunk`` sobre esse texto.
+    """
+    fd, path = tempfile.mkstemp(prefix="docia-pages-", suffix=".txt")
+    spans, pages_of, tokens, spans_in_bytes = [], [], [], []
+    char_base = byte_base = 0
+    partial = False
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for page_number, text in enumerate(pages, start=1):
+                if text is None:
+                    partial, text = True, ""
+                text = text.replace(PAGE_BREAK, "\n")
+                if page_number > 1:
+                    f.write(PAGE_BREAK.encode('utf-8'))
+                    char_base += len(PAGE_BREAK)
+                    byte_base += len(PAGE_BREAK.encode('utf-8'))
+                data = text.encode('utf-8')
+                f.write(data)
+                chunks = chunker.chunk_page(text, page_number)
+                page_spans = [(chunk.start, chunk.end) for chunk in chunks]
+                spans.extend((start + char_base, end + char_base) for start, end in page_spans)
+                pages_of.extend(chunk.page for chunk in chunks)
+                tokens.extend(chunk.tokens for chunk in chunks)
+                spans_in_bytes.append(byte_spans(text, page_spans) + byte_base)
+                char_base += len(text)
+                byte_base += len(data)
+    except BaseException:
+        os.remove(path)
+        raise
+    fields = {'chunk_spans': spans, 'chunk_pages': pages_of, 'chunk_tokens': tokens, 'chunker': chunker.signature}
+    all_byte_spans = np.concatenate(spans_in_bytes) if spans_in_bytes else np.zeros((0, 2), dtype=np.int64)
+    return PagedText(path, fields, all_byte_spans, byte_base, partial)
+
+
+class IndexSnapshot:
+    """Estado imutável do índice: documentos, texto, mapa de chunks, vetorizador e matriz.
+
+    Uma reindexação monta um snapshot novo à parte e o publica trocando uma
+    única referência, de modo que as buscas em andamento continuam usando
+    o snapshot anterior, sempre consistente. Os documentos são só
+    metadados; o texto (conteúdo e chunks) fica em ``store``.
+    """
+
+    __slots__ = ('documents', 'store', 'vectorizer', 'document_vectors', 'dense_index', 'bm25', 'bm25_positions',
+                 'chunk_doc_index', 'chunk_local_index', 'doc_positions')
+
+    def __init__(self, documents, vectorizer, document_vectors=None, dense_index=None, bm25=None, store=None):
+        store = store if store is not None else DocumentStore()
+        if store.n_documents != len(documents):
+            raise ValueError("O store de texto não corresponde aos documentos do snapshot")
+        counts = store.chunk_counts()
+        starts = np.repeat(store.doc_chunks[:-1], counts)
+        object.__setattr__(self, 'documents', documents)
+        object.__setattr__(self, 'store', store)
+        object.__setattr__(self, 'vectorizer', vectorizer)
+        object.__setattr__(self, 'document_vectors', document_vectors)
+        object.__setattr__(self, 'dense_index', dense_index)
+        object.__setattr__(self, 'bm25', bm25)
+        # Slot do BM25 -> posição do chunk neste snapshot (-1: chunk de outra versão)
+        positions = None
+        if bm25 is not None:
+            positions = np.full(bm25.n_slots, -1, dtype=np.int32)
+            keys = [SmartDocumentIndexer._chunk_key(doc, i) for doc, count in zip(documents, counts.tolist())
+                    for i in range(count)]
+            slots = [bm25.slot_of.get(key, -1) for key in keys]
+            found = np.asarray([slot >= 0 for slot in slots], dtype=bool)
+            positions[np.asarray(slots, dtype=np.int64)[found]] = np.flatnonzero(found)
+        object.__setattr__(self, 'bm25_positions', positions)
+        # Arrays chunk -> (documento, chunk local) usados na busca
+        object.__setattr__(self, 'chunk_doc_index', np.repeat(np.arange(len(documents), dtype=np.int32), counts))
+        object.__setattr__(self, 'chunk_local_index',
+                           (np.arange(int(counts.sum()), dtype=np.int64) - starts).astype(np.int32))
+        object.__setattr__(self, 'doc_positions', {doc['id']: i for i, doc in enumerate(documents)})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("IndexSnapshot é imutável")
+
+    def replace(self, **changes):
+        """Novo snapshot com os campos informados substituídos"""
+        fields = {'documents': self.documents, 'vectorizer': self.vectorizer, 'document_vectors': self.document_vectors,
+                  'dense_index': self.dense_index, 'bm25': self.bm25, 'store': self.store}
+        fields.update(changes)
+        return IndexSnapshot(**fields)
+
+    @property
+    def n_chunks(self):
+        return len(self.chunk_doc_index)
+
+
 class SmartDocumentIndexer:
-    def __init__(self):
-        self.documents = []
+    def __init__(self, autoload=True):
+        """Com ``autoload=False`` o construtor é barato: o modelo e o índice só são
+        carregados por ``start_background_init`` (ou ``initialize``)."""
         self.index_file = "smart_documents_index.json"
         self.last_update = None
-        self.vectorizer = TfidfVectorizer(
+        # O vetorizador é criado no primeiro uso (importar o sklearn é caro)
+        self._snapshot = IndexSnapshot([], None)
+        self._default_vectorizer = None
+        self.extract_workers = int(os.getenv("DOCIA_EXTRACT_WORKERS", os.cpu_count() or 1))
+        self.extract_timeout = float(os.getenv("DOCIA_EXTRACT_TIMEOUT", "300"))
+        # Pool separado para formatos caros (PDF), que não ocupam os workers dos leves
+        self.heavy_extract_workers = int(os.getenv("DOCIA_EXTRACT_HEAVY_WORKERS", max(1, self.extract_workers // 2)))
+        self.include_globs = globs_from_env("DOCIA_INCLUDE")
+        self.exclude_globs = globs_from_env("DOCIA_EXCLUDE", DEFAULT_EXCLUDE)
+        self.batch_concurrency = int(os.getenv("DOCIA_BATCH_CONCURRENCY", "2"))
+        # Caminho asyncio: recuperação num pool de threads. Nos dois caminhos
+        # no máximo ``max_generations`` gerações simultâneas por processo (a
+        # parte deste worker do limite do pod), com fila e prazo por pergunta
+        # (ver ``smart_admission``)
+        self.search_threads = int(os.getenv("DOCIA_SEARCH_THREADS", "4"))
+        self.generation_queue = GenerationQueue.from_env()
+        self._search_executor = None
+        # Retriever usado nas buscas: "tfidf" (padrão), "dense" (embeddings + ANN),
+        # "hybrid" (BM25 + TF-IDF) ou "hybrid_dense" (BM25 + embeddings), os híbridos fundidos por RRF
+        self.retriever = os.getenv("DOCIA_RETRIEVER", "tfidf")
+        self.dense_dtype = os.getenv("DOCIA_DENSE_DTYPE", "int8")
+        self.embedder = None
+        # Nome do modelo gravado com o índice denso (sem carregar o modelo)
+        self.embedding_model = os.getenv("DOCIA_EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+        self.chunker = StructuredChunker.from_env()
+        self.context_packer = ContextPacker.from_env(counter=self.chunker.counter)
+        self.qa_pipeline = None
+        self.hf_model = os.getenv("DOCIA_HF_MODEL", "microsoft/DialoGPT-medium")
+        self._qa_pipeline_lock = threading.Lock()
+        self.llm_client = OllamaClient()
+        self.answer_cache = AnswerCache.from_env()
+        self.page_cache = PageTextCache.from_env()
+        self._indexing_lock = threading.Lock()  # Lock para evitar concorrência
+        self.initialized = threading.Event()
+        self.startup_timings = {}
+        self._init_thread = None
+        if autoload:
+            self.initialize()
+
+    def initialize(self):
+        """Carrega o índice e escolhe o backend do LLM, medindo o tempo de cada etapa"""
+        try:
+            for stage, step in (('index_load', self.load_index), ('model_init', self._init_qa_model)):
+                started = time.perf_counter()
+                step()
+                self.startup_timings[stage] = time.perf_counter() - started
+        finally:
+            self.initialized.set()
+        logger.info("Inicialização concluída: " +
+                    ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in self.startup_timings.items()))
+
+    def start_background_init(self):
+        """Roda ``initialize`` numa thread; as buscas usam o sistema interno até o backend ficar pronto"""
+        if self._init_thread is None and not self.initialized.is_set():
+            def run():
+                try:
+                    self.initialize()
+                except Exception as e:
+                    logger.error(f"Erro na inicialização em segundo plano: {e}")
+
+            self._init_thread = threading.Thread(target=run, name="docia-init", daemon=True)
+            self._init_thread.start()
+        return self._init_thread
+
+    def _new_vectorizer(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        return TfidfVectorizer(
             stop_words=self._get_portuguese_stop_words(),
             max_features=5000,
             ngram_range=(1, 3),
             min_df=1,
             max_df=0.8
         )
-        self.document_vectors = None
-        self.qa_pipeline = None
-        self._init_qa_model()
-        self.load_index()
-        self._indexing_lock = threading.Lock()  # Lock para evitar concorrência
+
+    # Atalhos para o snapshot atual (leituras sem lock). Os documentos só mudam
+    # por ``index_directory``/``load_index``, que montam store e vetores juntos
+    @property
+    def documents(self):
+        return self._snapshot.documents
+
+    @property
+    def vectorizer(self):
+        """Vetorizador do snapshot atual ou, antes do primeiro ajuste, o modelo
+        (não ajustado) que será clonado; nunca troca o snapshot"""
+        vectorizer = self._snapshot.vectorizer
+        if vectorizer is not None:
+            return vectorizer
+        if self._default_vectorizer is None:
+            self._default_vectorizer = self._new_vectorizer()
+        return self._default_vectorizer
+
+    @property
+    def bm25(self):
+        return self._snapshot.bm25
+
+    @property
+    def document_vectors(self):
+        return self._snapshot.document_vectors
+
+    @document_vectors.setter
+    def document_vectors(self, document_vectors):
+        # Mesmo lock da indexação, para não sobrescrever um snapshot publicado no meio
+        with self._indexing_lock:
+            self._snapshot = self._snapshot.replace(document_vectors=document_vectors)
+
+    @property
+    def chunk_doc_index(self):
+        return self._snapshot.chunk_doc_index
+
+    @property
+    def chunk_local_index(self):
+        return self._snapshot.chunk_local_index
+
+    def document_content(self, doc_id):
+        """Conteúdo completo de um documento, lido do store sob demanda (``None`` se não existe)"""
+        snapshot = self._snapshot
+        position = snapshot.doc_positions.get(doc_id)
+        return snapshot.store.content(position) if position is not None else None
+
+    def get_document(self, doc_id):
+        """Metadados e conteúdo completo de um documento, para exibição (``None`` se não existe)"""
+        snapshot = self._snapshot
+        position = snapshot.doc_positions.get(doc_id)
+        if position is None:
+            return None
+        doc = snapshot.documents[position]
+        return {'id': doc['id'], 'filename': doc['filename'], 'indexed_at': doc.get('indexed_at'),
+                'content': snapshot.store.content(position)}
+
+    def document_chunks(self, doc_id):
+        """Textos dos chunks de um documento (``None`` se não existe)"""
+        snapshot = self._snapshot
+        position = snapshot.doc_positions.get(doc_id)
+        return snapshot.store.document_chunks(position) if position is not None else None
 
     def _init_qa_model(self):
         """Inicializa modelo de IA externo (prioriza Ollama)"""
         try:
             logger.info("Tentando conectar com modelo Ollama...")
-            import requests
-            
-            # Tenta conectar com Ollama
-            response = requests.get("http://localhost:11434/api/tags", timeout=3)
-            if response.status_code == 200:
-                models = response.json().get('models', [])
+            # Tenta conectar com Ollama (health check único; depois a saúde é
+            # atualizada em segundo plano pelo cliente)
+            health = self.llm_client.refresh_health()
+            self.llm_client.start_health_monitor()
+            if health['available']:
+                models = health['models']
                 self.llm_type = "ollama"
                 
                 # Usa modelo definido na variável de ambiente ou força Mistral como padrão
@@ -53,11 +369,11 @@ class SmartDocumentIndexer:
                     self.model_name = model_env
                 elif models:
                     # Procura especificamente por Mistral nos modelos disponíveis
-                    mistral_models = [m['name'] for m in models if 'mistral' in m['name'].lower()]
+                    mistral_models = [m for m in models if 'mistral' in m.lower()]
                     if mistral_models:
                         self.model_name = mistral_models[0]
                     else:
-                        self.model_name = models[0]['name']
+                        self.model_name = models[0]
                 else:
                     self.model_name = "mistral"  # sempre Mistral como padrão
                 
@@ -66,15 +382,13 @@ class SmartDocumentIndexer:
             
             logger.warning("Ollama não encontrado, tentando outros modelos...")
             
-            # Se não conseguiu Ollama, tenta outros modelos
-            try:
-                from transformers import pipeline
-                self.qa_pipeline = pipeline("text-generation", model="microsoft/DialoGPT-medium")
+            # Se não conseguiu Ollama, escolhe o Hugging Face; o modelo só é
+            # carregado na primeira resposta que precisar dele
+            if self.hf_model and importlib.util.find_spec("transformers") is not None:
                 self.llm_type = "huggingface"
-                logger.info("✅ Modelo Hugging Face carregado")
+                logger.info(f"✅ Hugging Face escolhido ({self.hf_model}); carregado no primeiro uso")
                 return
-            except Exception as e:
-                logger.warning(f"Hugging Face não disponível: {e}")
+            logger.warning("Hugging Face não disponível")
             
             # Fallback para sistema interno apenas se nada funcionar
             self.llm_type = "internal"
@@ -86,165 +400,1300 @@ class SmartDocumentIndexer:
             self.qa_pipeline = None
             self.llm_type = "internal"
 
-    def index_directory(self, directory_path):
-        """Indexa todos os documentos de um diretório"""
+    def index_directory(self, directory_path, incremental=True, touched_paths=None):
+        """Indexa os documentos de um diretório.
+
+        Percorre as subpastas e lê todo formato com leitor registrado em
+        ``smart_readers``. No modo incremental (padrão) usa o manifesto de cada documento
+        (caminho, tamanho, mtime e hash do conteúdo) para reler apenas os
+        arquivos novos ou alterados, remover os apagados e manter os ids
+        estáveis. Com ``incremental=False`` refaz o índice do zero.
+        ``touched_paths`` (ex.: vindo do watcher) limita a verificação de
+        arquivos já indexados aos caminhos informados.
+
+        Só a leitura/extração, o BM25 e o cache de respostas são incrementais:
+        quando algum conteúdo muda, o TF-IDF é reajustado sobre todos os chunks
+        e o store de texto é regravado inteiro, então o custo dessa etapa
+        continua proporcional ao corpus (execuções sem mudança não refazem nada).
+        """
         with self._indexing_lock:  # Evita concorrência durante indexação
-            logger.info(f"Iniciando indexação do diretório: {directory_path}")
-            self.documents = []
-            for filename in os.listdir(directory_path):
-                file_path = os.path.join(directory_path, filename)
-                content = ""
-                if filename.endswith(".pdf"):
-                    content = self._read_pdf(file_path)
-                elif filename.endswith(".docx"):
-                    content = self._read_docx(file_path)
-                elif filename.endswith(".txt"):
-                    content = self._read_txt(file_path)
-                
-                if content:
-                    doc_id = len(self.documents) + 1
-                    chunks = self._chunk_text(content)
-                    doc = {
-                        'id': doc_id, 'filename': filename, 'content': content, 
-                        'chunks': chunks, 'file_path': file_path, 'indexed_at': datetime.now().isoformat()
-                    }
-                    self.documents.append(doc)
-            if self.documents:
-                self._vectorize_documents()
+            logger.info(f"Iniciando indexação do diretório: {directory_path} (incremental={incremental})")
+            snapshot = self._snapshot
+            previous = {doc.get('file_path'): doc for doc in snapshot.documents} if incremental else {}
+            next_id = max((doc['id'] for doc in previous.values()), default=0) + 1
+            entries, to_read, to_read_hashes, changed = [], [], [], not incremental
+            touched = {os.path.abspath(path) for path in touched_paths} if touched_paths is not None else None
+            # Subpastas incluídas; o nome do documento é o caminho relativo ao diretório
+            for filename, file_path in walk_documents(directory_path, self.include_globs, self.exclude_globs):
+                old_doc = previous.pop(file_path, None)
+                # Indexado antes da extração por páginas: o texto guardado não tem as quebras de
+                # página, então o arquivo é relido em vez de rechunkado
+                repage = old_doc is not None and self._predates_pages(old_doc, file_path)
+                if old_doc and not repage and touched is not None and os.path.abspath(file_path) not in touched:
+                    entries.append((old_doc, None))
+                    continue
+                fingerprint = self._file_fingerprint(file_path, old_doc.get('fingerprint') if old_doc else None)
+                if fingerprint is None:
+                    continue
+                if not repage and old_doc and old_doc.get('fingerprint', {}).get('hash') == fingerprint['hash']:
+                    if old_doc['fingerprint'] != fingerprint:
+                        # Copia: o documento original pertence ao snapshot publicado
+                        old_doc = dict(old_doc, fingerprint=fingerprint)
+                        changed = True
+                    entries.append((old_doc, None))
+                    continue
+                entries.append(((filename, file_path, old_doc, fingerprint), len(to_read)))
+                to_read.append(file_path)
+                to_read_hashes.append(fingerprint['hash'])
+            if previous:
+                logger.info(f"Removendo {len(previous)} documentos apagados do índice.")
+            stale_ids = [doc['id'] for doc in previous.values()]
+            stale_hashes = [doc.get('fingerprint', {}).get('hash') for doc in previous.values()]
+            # Documentos chunkados com outra configuração são refeitos sem reextração
+            rechunk = any(entry.get('chunker') != self.chunker.signature for entry, read_idx in entries if read_idx is None)
+            content_changed = not incremental or bool(previous) or bool(to_read) or rechunk
+
+            if not changed and not content_changed:
+                logger.info("Nenhuma alteração detectada; índice mantido.")
+                self.last_update = datetime.now().isoformat()
+                return
+
+            started = time.perf_counter()
+            contents = self._extract_documents(to_read, to_read_hashes)
+            if to_read:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage='extract')
+            # PDFs chegam como ``PagedText``: já chunkados, com o texto num arquivo temporário
+            spooled = [content for content in contents if isinstance(content, PagedText)]
+            try:
+                # ``texts``: conteúdo (id -> texto) dos documentos novos ou rechunkados; os demais
+                # são copiados do store do snapshot atual
+                documents, texts = [], {}
+                for entry, read_idx in entries:
+                    if read_idx is None:
+                        if entry.get('chunker') != self.chunker.signature:
+                            content = snapshot.store.content(snapshot.doc_positions[entry['id']])
+                            entry = dict(entry, **self._chunk_fields(content))
+                            texts[entry['id']] = content
+                            stale_ids.append(entry['id'])
+                        documents.append(entry)
+                        continue
+                    filename, file_path, old_doc, fingerprint = entry
+                    content = contents[read_idx]
+                    if old_doc:
+                        stale_ids.append(old_doc['id'])
+                        if old_doc.get('fingerprint', {}).get('hash') != fingerprint['hash']:
+                            stale_hashes.append(old_doc.get('fingerprint', {}).get('hash'))
+                    if content:
+                        doc_id = old_doc['id'] if old_doc else next_id
+                        if not old_doc:
+                            next_id += 1
+                        paged = isinstance(content, PagedText)
+                        doc = {
+                            'id': doc_id, 'filename': filename,
+                            **(content.fields if paged else self._chunk_fields(content)),
+                            'file_path': file_path, 'fingerprint': fingerprint,
+                            'indexed_at': datetime.now().isoformat()
+                        }
+                        if paged and content.partial:
+                            # Páginas com erro: sem o hash, a próxima indexação relê o arquivo
+                            # (as páginas já extraídas vêm do cache de páginas)
+                            logger.warning(f"Extração parcial de {filename}; será refeita na próxima indexação.")
+                            doc['fingerprint'] = dict(fingerprint, hash=None)
+                            doc['partial'] = True
+                        documents.append(doc)
+                        texts[doc_id] = content
+                del contents
+
+                documents.sort(key=lambda d: d['id'])
+                store = self._build_store(documents, texts, snapshot) if content_changed else None
+                del texts
+            finally:
+                for content in spooled:
+                    content.discard()
+            if content_changed:
+                # Vetoriza à parte; o snapshot novo só é publicado no final
+                self._vectorize_documents(documents, store)
+            else:
+                # Só metadados (mtime) mudaram: vocabulário e matriz continuam válidos
+                self._snapshot = self._snapshot.replace(documents=documents)
+            if incremental:
+                self.answer_cache.invalidate_documents(stale_ids)
+            else:
+                self.answer_cache.clear()
             self.save_index()
+            if self.page_cache is not None:
+                for file_hash in filter(None, stale_hashes):
+                    self.page_cache.discard(file_hash)
             self.last_update = datetime.now().isoformat()
             logger.info(f"Indexação concluída. {len(self.documents)} documentos processados.")
 
-    def _chunk_text(self, text, chunk_size=2000, overlap=400):
-        """Divide o texto em chunks com sobreposição"""
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = start + chunk_size
-            chunks.append(text[start:end])
-            start += chunk_size - overlap
-        return chunks
-
-    def _vectorize_documents(self):
-        """Cria vetores TF-IDF para todos os chunks de documentos"""
-        all_chunks = [chunk for doc in self.documents for chunk in doc.get('chunks', [doc['content']])]
-        if all_chunks:
-            self.document_vectors = self.vectorizer.fit_transform(all_chunks)
-            logger.info(f"Vetorização concluída: {self.document_vectors.shape[0]} chunks vetorizados.")
+    @staticmethod
+    def _predates_pages(doc, file_path):
+        """Documento de um formato paginado (PDF) indexado sem ``chunk_pages``"""
+        if 'chunk_pages' in doc:
+            return False
+        reader = get_reader(file_path)
+        return reader is not None and reader.pages is not None
+
+    def _extract_documents(self, file_paths, file_hashes=None):
+        """Extrai o texto dos arquivos, em paralelo quando há mais de um worker.
+
+        A ordem do resultado segue a de ``file_paths``. Falhas e estouros de
+        tempo ficam isolados por arquivo e resultam em texto vazio. Com
+        ``file_hashes`` as páginas de PDF passam pelo cache de páginas.
+        Com ``extract_timeout`` a extração sempre roda em processos, mesmo
+        com um único arquivo ou worker: um worker que não responde no prazo
+        é encerrado.
+        """
+        file_hashes = file_hashes or [None] * len(file_paths)
+        timeout = self.extract_timeout
+        if not file_paths or (not timeout and min(self.extract_workers, len(file_paths)) <= 1):
+            return [self._read_document(path, file_hash, self.page_cache, self.chunker)
+                    for path, file_hash in zip(file_paths, file_hashes)]
+
+        # Um pool por classe de custo declarada pelo leitor
+        pool_sizes = {CHEAP: self.extract_workers, EXPENSIVE: self.heavy_extract_workers}
+        groups = {}
+        for i, path in enumerate(file_paths):
+            reader = get_reader(path)
+            groups.setdefault(reader.cost if reader else CHEAP, []).append(i)
+        executors, futures = [], [None] * len(file_paths)
+        hung = False
+        try:
+            for cost, indices in groups.items():
+                workers = max(1, min(pool_sizes.get(cost, self.extract_workers), len(indices)))
+                logger.info(f"Extraindo {len(indices)} arquivos ({cost}) com {workers} processos...")
+                executor = ProcessPoolExecutor(max_workers=workers)
+                executors.append(executor)
+                for i in indices:
+                    futures[i] = executor.submit(_extract_worker, file_paths[i], timeout, file_hashes[i],
+                                                 self.page_cache, self.chunker)
+            contents = []
+            for path, future in zip(file_paths, futures):
+                try:
+                    # Margem extra: o limite principal é aplicado dentro do worker
+                    contents.append(future.result(timeout=timeout + min(timeout, 30) if timeout else None))
+                except FuturesTimeoutError:
+                    logger.error(f"Tempo esgotado ao extrair {path}")
+                    contents.append("")
+                    hung = True
+                except Exception as e:
+                    logger.error(f"Erro ao extrair {path}: {e}")
+                    contents.append("")
+            return contents
+        finally:
+            for executor in executors:
+                if hung:
+                    self._terminate_workers(executor)
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _terminate_workers(executor):
+        """Encerra os processos do pool: ``shutdown`` não interrompe um worker travado"""
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            if process.is_alive():
+                logger.warning(f"Encerrando o processo de extração {process.pid}")
+                process.terminate()
+
+    def _file_fingerprint(self, file_path, previous=None):
+        """Calcula (tamanho, mtime, hash) do arquivo.
+
+        Se tamanho e mtime coincidem com a impressão digital anterior, o hash
+        é reaproveitado sem reler o arquivo.
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError as e:
+            logger.error(f"Erro ao acessar {file_path}: {e}")
+            return None
+        fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime}
+        # Sem hash anterior (extração parcial), o arquivo é relido
+        if previous and previous.get('hash') and previous.get('size') == stat.st_size \
+                and previous.get('mtime') == stat.st_mtime:
+            fingerprint['hash'] = previous.get('hash')
+            return fingerprint
+        digest = hashlib.sha256()
+        try:
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        except OSError as e:
+            logger.error(f"Erro ao ler {file_path}: {e}")
+            return None
+        fingerprint['hash'] = digest.hexdigest()
+        return fingerprint
+
+    @staticmethod
+    def _read_document(file_path, file_hash=None, page_cache=None, chunker=None):
+        """Extrai o texto de um arquivo com o leitor registrado para sua extensão.
+
+        Com ``chunker``, leitores que geram páginas devolvem um ``PagedText``
+        (texto em arquivo temporário, já chunkado) em vez de uma string.
+        """
+        reader = get_reader(file_path)
+        if reader is None:
+            return ""
+        if chunker is not None and reader.pages is not None:
+            try:
+                return _spool_pages(reader.pages(file_path, file_hash, page_cache), chunker)
+            except TimeoutError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro ao ler {file_path}: {e}")
+                return ""
+        if reader.paged:
+            return reader.read(file_path, file_hash, page_cache)
+        return reader.read(file_path)
+
+    def _chunk_text(self, text):
+        """Divide o texto em chunks (páginas, parágrafos e frases, limitados em tokens)"""
+        return [text[start:end] for start, end in self._chunk_spans(text)]
+
+    def _chunk_spans(self, text):
+        """Retorna os intervalos (início, fim) de cada chunk dentro do texto"""
+        return self.chunker.spans(text)
+
+    @STAGE_SECONDS.timed(stage='chunk')
+    def _chunk_fields(self, content):
+        """Campos de chunking de um documento: offsets, páginas e tokens (o texto fica no store)"""
+        chunks = self.chunker.chunk(content)
+        return {
+            'chunk_spans': [(chunk.start, chunk.end) for chunk in chunks],
+            'chunk_pages': [chunk.page for chunk in chunks],
+            'chunk_tokens': [chunk.tokens for chunk in chunks],
+            'chunker': self.chunker.signature,
+        }
+
+    def _build_store(self, documents, texts, snapshot):
+        """Store de texto na ordem de ``documents``: conteúdos de ``texts`` (id -> texto) e,
+        para os demais documentos, os bytes já guardados no store de ``snapshot``"""
+        builder = DocumentStoreBuilder()
+        for doc in documents:
+            text = texts.get(doc['id'])
+            if isinstance(text, PagedText):
+                builder.add_file(text.path, text.byte_spans)
+            elif text is not None:
+                builder.add(text, doc['chunk_spans'])
+            else:
+                builder.add_stored(snapshot.store, snapshot.doc_positions[doc['id']])
+        return builder.build()
+
+    @STAGE_SECONDS.timed(stage='vectorize')
+    def _vectorize_documents(self, documents=None, store=None):
+        """Cria vetores TF-IDF para todos os chunks e publica um snapshot novo.
+
+        O ajuste é feito num clone do vetorizador atual; as buscas continuam
+        usando o snapshot anterior até a troca. Os chunks são lidos de
+        ``store`` um a um, sem montar uma lista com todos os textos. O ajuste
+        é sempre completo (IDF e vocabulário dependem do corpus inteiro), mesmo
+        quando só alguns documentos mudaram.
+        """
+        from sklearn.base import clone
+
+        if documents is None:
+            documents, store = self.documents, self._snapshot.store
+        vectorizer = clone(self.vectorizer)
+        chunks = store.texts()
+        document_vectors = vectorizer.fit_transform(chunks) if len(chunks) else None
+        dense_index = self._build_dense_index(chunks) if len(chunks) and self._uses_dense() else None
+        bm25 = self._update_bm25(documents, store, self._snapshot.bm25) if self._uses_bm25() else None
+        self._snapshot = IndexSnapshot(documents, vectorizer, document_vectors, dense_index, bm25, store)
+        if document_vectors is not None:
+            logger.info(f"Vetorização concluída: {document_vectors.shape[0]} chunks vetorizados.")
+
+    def _uses_dense(self):
+        return self.retriever in ("dense", "hybrid_dense")
+
+    def _uses_bm25(self):
+        return self.retriever in ("hybrid", "hybrid_dense")
+
+    def _update_bm25(self, documents, store, base=None):
+        """Índice BM25 de ``documents``: ``base`` mais os chunks novos, menos os removidos.
+
+        ``base`` (o BM25 do snapshot publicado) não é alterado: a atualização
+        é feita numa cópia, que só passa a ser usada com o snapshot novo.
+        """
+        bm25 = base.copy() if base is not None else BM25Index(stop_words=self._get_portuguese_stop_words())
+        keys = {self._chunk_key(doc, i): chunk_index
+                for doc, first, last in zip(documents, store.doc_chunks[:-1].tolist(), store.doc_chunks[1:].tolist())
+                for i, chunk_index in enumerate(range(first, last))}
+        for key in [key for key in bm25.slot_of if key not in keys]:
+            bm25.remove(key)
+        for key, chunk_index in keys.items():
+            if key not in bm25.slot_of:
+                bm25.add(key, store.chunk(chunk_index))
+        if bm25.dead_ratio > 0.25:
+            # Índice novo: snapshots antigos continuam com o anterior
+            bm25 = bm25.compacted()
+        return bm25
+
+    def _get_embedder(self):
+        """Modelo de embeddings local, carregado só quando o retriever denso é usado"""
+        if self.embedder is None:
+            self.embedder = TransformersEmbedder.from_env()
+        return self.embedder
+
+    def _embed(self, texts):
+        """Embeddings de ``texts``, ou ``None`` se o modelo não puder ser usado.
+
+        Sem o modelo (ex.: fora do cache local com ``DOCIA_EMBEDDING_OFFLINE=1``)
+        o retriever denso é desligado e as buscas passam a usar o TF-IDF.
+        """
+        try:
+            return self._get_embedder()(texts)
+        except Exception as e:
+            fallback = "hybrid" if self.retriever == "hybrid_dense" else "tfidf"
+            logger.error(f"Modelo de embeddings indisponível ({e}); usando o retriever '{fallback}'.")
+            self.retriever = fallback
+            return None
+
+    def _build_dense_index(self, chunks):
+        """Gera os embeddings dos chunks e o índice ANN (``None`` sem o modelo)"""
+        logger.info(f"Gerando embeddings de {len(chunks)} chunks...")
+        vectors = self._embed(chunks)
+        if vectors is None:
+            return None
+        dense_index = DenseIndex.build(vectors, dtype=self.dense_dtype)
+        logger.info(f"Índice denso criado: {dense_index.size} vetores em {len(dense_index.centroids)} listas.")
+        return dense_index
+
+    def _index_path(self, suffix):
+        """Caminho de um arquivo auxiliar do índice (ex.: índice.text)"""
+        return os.path.splitext(self.index_file)[0] + suffix
 
     def save_index(self):
-        with open(self.index_file, 'w', encoding='utf-8') as f:
-            json.dump(self.documents, f, ensure_ascii=False, indent=4)
-
-    def load_index(self):
-        if os.path.exists(self.index_file):
-            with open(self.index_file, 'r', encoding='utf-8') as f:
-                self.documents = json.load(f)
-            if self.documents:
-                self.last_update = max(d.get("indexed_at") for d in self.documents)
-                self._vectorize_documents()
-            logger.info(f"Índice carregado: {len(self.documents)} documentos.")
-
-    def _semantic_search(self, query, max_results=5):
-        """Realiza busca semântica usando TF-IDF e similaridade de cosseno"""
-        if not self.documents or self.document_vectors is None: return []
-        query_vector = self.vectorizer.transform([query])
-        similarities = cosine_similarity(query_vector, self.document_vectors)[0]
-        chunk_similarities = sorted([(similarities[i], i) for i in range(len(similarities)) if similarities[i] > 0.01], reverse=True)
-        results, added_docs, chunk_to_doc_map = [], set(), {}
-        chunk_idx = 0
-        for doc in self.documents:
-            for chunk in doc.get('chunks', [doc['content']]):
-                chunk_to_doc_map[chunk_idx] = (doc, chunk)
-                chunk_idx += 1
-        for similarity, idx in chunk_similarities[:max_results * 2]:
-            if idx in chunk_to_doc_map:
-                doc, chunk = chunk_to_doc_map[idx]
-                if doc['id'] not in added_docs:
-                    results.append({'id': doc['id'], 'filename': doc['filename'], 'content': doc['content'], 'relevant_chunk': chunk, 'similarity_score': float(similarity)})
-                    added_docs.add(doc['id'])
-                    if len(results) >= max_results: break
-        return sorted(results, key=lambda x: x['similarity_score'], reverse=True)
-
-    def search(self, query, max_results=10):
-        """Realiza busca inteligente com compreensão de linguagem natural"""
+        """Grava o índice no formato compacto.
+
+        O texto de cada documento é gravado uma única vez em ``<índice>.text``
+        (UTF-8 concatenado) e os chunks viram intervalos dentro dele, com os
+        offsets em bytes em ``<índice>.chunks.npy``. O vocabulário/idf do
+        TF-IDF e a matriz CSR vão para arquivos ``.<nome>.<gravação>.npy``, que
+        o ``load_index`` abre com memory-map: cada gravação usa nomes novos e
+        o JSON, trocado por último, aponta para eles, de modo que quem lê no
+        meio de um save nunca junta metadados de uma gravação com vetores de
+        outra. O JSON guarda só metadados. Depois de gravar, o store em
+        memória do snapshot é trocado pelo memory-map do ``.text``.
+        """
+        snapshot = self._snapshot
+        store = snapshot.store
+        with open(self._index_path('.chunks.npy.tmp'), 'wb') as f:
+            np.save(f, store.chunk_offsets)
+        os.replace(self._index_path('.chunks.npy.tmp'), self._index_path('.chunks.npy'))
+        # Id desta gravação no fim do .text e no JSON: quem lê os dois no meio
+        # de outro save percebe que não são da mesma gravação
+        generation = os.urandom(16)
+        with open(self._index_path('.text.tmp'), 'wb') as f:
+            store.write(f)
+            f.write(TEXT_TRAILER_MAGIC + generation)
+        os.replace(self._index_path('.text.tmp'), self._index_path('.text'))
+        meta_docs = []
+        for position, doc in enumerate(snapshot.documents):
+            meta = dict(doc)
+            meta['text_offset'] = [int(store.doc_offsets[position]), int(store.doc_offsets[position + 1])]
+            meta['chunk_spans'] = [list(span) for span in doc['chunk_spans']]
+            meta_docs.append(meta)
+
+        vectors = None
+        if snapshot.document_vectors is not None and hasattr(snapshot.vectorizer, 'vocabulary_'):
+            matrix = snapshot.document_vectors.tocsr()
+            arrays = {'data': matrix.data, 'indices': matrix.indices, 'indptr': matrix.indptr, 'idf': snapshot.vectorizer.idf_}
+            for name, array in arrays.items():
+                path = self._vector_path(name, generation.hex())
+                with open(path + '.tmp', 'wb') as f:
+                    np.save(f, array)
+                os.replace(path + '.tmp', path)
+            vectors = {'shape': list(matrix.shape), 'generation': generation.hex(),
+                       'corpus_version': self._corpus_version(snapshot.documents, snapshot.vectorizer, store),
+                       'vocabulary': snapshot.vectorizer.get_feature_names_out().tolist()}
+
+        if snapshot.bm25 is not None:
+            snapshot.bm25.save(self._index_path('.bm25'), {
+                'corpus_version': self._corpus_version(snapshot.documents, snapshot.vectorizer, store),
+                'chunk_keys': CHUNK_KEY_VERSION,
+            })
+
+        if snapshot.dense_index is not None:
+            snapshot.dense_index.save(self._index_path('.dense'), {
+                'corpus_version': self._corpus_version(snapshot.documents, snapshot.vectorizer, store),
+                'model': self.embedding_model,
+            })
+
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'format': INDEX_FORMAT_VERSION, 'documents': meta_docs, 'vectors': vectors,
+                       'text_generation': generation.hex()}, f, ensure_ascii=False)
+        os.replace(tmp_file, self.index_file)
+        self._remove_old_vectors(generation.hex() if vectors else None)
+        if self._snapshot is snapshot and not isinstance(store.buffer, np.memmap):
+            self._snapshot = snapshot.replace(store=DocumentStore.open(
+                self._index_path('.text'), store.doc_offsets, store.doc_chunks, store.chunk_offsets))
+
+    VECTOR_ARRAYS = ('data', 'indices', 'indptr', 'idf')
+
+    def _vector_path(self, name, generation=None):
+        """Arquivo de um array do TF-IDF (``generation=None``: formato antigo, sem gravação no nome)"""
+        return self._index_path(f'.{name}.{generation}.npy' if generation else f'.{name}.npy')
+
+    def _remove_old_vectors(self, keep):
+        """Apaga os arrays do TF-IDF de gravações anteriores (quem já os abriu segue com o memory-map)"""
+        directory = os.path.dirname(self._index_path('')) or '.'
+        prefix = os.path.basename(self._index_path('.'))
+        pattern = re.compile(rf"({'|'.join(self.VECTOR_ARRAYS)})(\.[0-9a-f]+)?\.npy")
+        for name in os.listdir(directory):
+            if not name.startswith(prefix):
+                continue
+            match = pattern.fullmatch(name[len(prefix):])
+            if match and (match.group(2) or '')[1:] != keep:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def _doc_chunk_spans(self, doc):
+        """Intervalos dos chunks de um documento (recalcula para índices antigos)"""
+        if doc.get('chunk_spans'):
+            return doc['chunk_spans']
+        spans, start = [], 0
+        for chunk in doc.get('chunks', [doc['content']]):
+            pos = doc['content'].find(chunk, start)
+            if pos < 0:
+                pos = doc['content'].find(chunk)
+            spans.append((pos, pos + len(chunk)))
+            start = pos + 1
+        return spans
+
+    def load_index(self, refit=True):
+        """Carrega o índice gravado por ``save_index`` e publica o snapshot.
+
+        Com ``refit=False`` (processos que apenas seguem o índice gravado
+        pelo líder) a vetorização nunca é refeita: se os arquivos não
+        estiverem consistentes, o snapshot atual é mantido. Retorna se um
+        snapshot novo foi publicado.
+        """
+        if not os.path.exists(self.index_file):
+            return False
+        with open(self.index_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            # Formato antigo: JSON com conteúdo e chunks completos
+            if not refit:
+                return False
+            self._vectorize_documents(*self._split_legacy_documents(data))
+        else:
+            loaded = self._load_documents(data['documents'], data.get('text_generation'))
+            if loaded is None:
+                # Nunca troca o índice carregado por um vazio por causa disso
+                logger.warning("Índice em disco inconsistente; mantendo o snapshot atual.")
+                return False
+            documents, store = loaded
+            snapshot = self._load_vectors(documents, store, data.get('vectors'))
+            if snapshot is not None:
+                if self._uses_dense():
+                    snapshot = snapshot.replace(dense_index=self._load_dense_index(snapshot))
+                if self._uses_bm25():
+                    snapshot = snapshot.replace(bm25=self._load_bm25(snapshot))
+                self._snapshot = snapshot
+            elif refit or not data['documents']:
+                self._vectorize_documents(documents, store)
+            else:
+                logger.warning("Índice em disco inconsistente; mantendo o snapshot atual.")
+                return False
+        if self.documents:
+            self.last_update = max(d.get("indexed_at") for d in self.documents)
+        logger.info(f"Índice carregado: {len(self.documents)} documentos.")
+        return True
+
+    def _corpus_version(self, documents, vectorizer, store):
+        """Identifica o corpus vetorizado: parâmetros do TF-IDF e conteúdo dos chunks"""
+        digest = hashlib.sha256()
+        params = vectorizer.get_params()
+        digest.update(repr(sorted((k, repr(v)) for k, v in params.items())).encode('utf-8'))
+        for position, doc in enumerate(documents):
+            content_hash = doc.get('fingerprint', {}).get('hash') or hashlib.sha256(
+                bytes(store.buffer[store.doc_offsets[position]:store.doc_offsets[position + 1]])).hexdigest()
+            digest.update(f"{doc['id']}:{content_hash}:{list(map(list, self._doc_chunk_spans(doc)))};".encode('utf-8'))
+        return digest.hexdigest()
+
+    def is_ready(self):
+        """Indica se o índice carregado pode responder buscas"""
+        snapshot = self._snapshot
+        if not snapshot.documents:
+            return True
+        if snapshot.document_vectors is None or not hasattr(snapshot.vectorizer, 'vocabulary_'):
+            return False
+        return snapshot.document_vectors.shape == (snapshot.n_chunks, len(snapshot.vectorizer.vocabulary_))
+
+    def _load_dense_index(self, snapshot):
+        """Abre o índice denso persistido ou o reconstrói se estiver desatualizado"""
+        try:
+            dense_index, meta = DenseIndex.load(self._index_path('.dense'))
+            if (meta.get('corpus_version') == self._corpus_version(snapshot.documents, snapshot.vectorizer, snapshot.store)
+                    and meta.get('model') == self.embedding_model
+                    and dense_index.size == snapshot.n_chunks):
+                logger.info(f"Índice denso carregado do disco: {dense_index.size} vetores.")
+                return dense_index
+            logger.info("Índice denso desatualizado; reconstruindo.")
+        except (OSError, ValueError, KeyError) as e:
+            logger.info(f"Índice denso indisponível ({e}); reconstruindo.")
+        chunks = snapshot.store.texts()
+        return self._build_dense_index(chunks) if len(chunks) else None
+
+    def _load_bm25(self, snapshot):
+        """Abre o índice BM25 persistido ou o reconstrói se estiver desatualizado"""
+        try:
+            bm25, meta = BM25Index.load(self._index_path('.bm25'), stop_words=self._get_portuguese_stop_words())
+            if (meta.get('corpus_version') == self._corpus_version(snapshot.documents, snapshot.vectorizer, snapshot.store)
+                    and meta.get('chunk_keys') == CHUNK_KEY_VERSION):
+                logger.info(f"Índice BM25 carregado do disco: {bm25.n_alive} chunks.")
+                return bm25
+            logger.info("Índice BM25 desatualizado; reconstruindo.")
+        except (OSError, ValueError, KeyError) as e:
+            logger.info(f"Índice BM25 indisponível ({e}); reconstruindo.")
+        return self._update_bm25(snapshot.documents, snapshot.store)
+
+    def _load_documents(self, meta_docs, generation=None):
+        """Reconstrói os documentos (metadados) e o store de texto sobre o arquivo ``.text``.
+
+        Retorna ``None`` se o ``.text`` faltar ou for de outra gravação
+        (``generation`` diferente da marca no fim do arquivo).
+        """
+        if not meta_docs:
+            return [], DocumentStore()
+        if not os.path.exists(self._index_path('.text')):
+            logger.error(f"Arquivo de texto do índice ausente: {self._index_path('.text')}")
+            return None
+        size = os.path.getsize(self._index_path('.text'))
+        if not self._text_matches(meta_docs[-1]['text_offset'][1], size, generation):
+            # Arquivo de texto de outra gravação (ex.: lido durante um save de outro processo)
+            logger.error("Arquivo de texto do índice não corresponde aos metadados.")
+            return None
+        documents, doc_offsets = [], [0]
+        for meta in meta_docs:
+            _start, end = meta.pop('text_offset')
+            doc = dict(meta)
+            doc['chunk_spans'] = [tuple(span) for span in meta['chunk_spans']]
+            documents.append(doc)
+            doc_offsets.append(end)
+        doc_offsets = np.asarray(doc_offsets, dtype=np.int64)
+        doc_chunks = np.concatenate(([0], np.cumsum([len(doc['chunk_spans']) for doc in documents]))).astype(np.int64)
+        chunk_offsets = self._load_chunk_offsets(doc_offsets, doc_chunks)
+        if chunk_offsets is None:
+            # Índice do formato anterior (sem .chunks.npy): offsets calculados a partir do texto
+            text = np.memmap(self._index_path('.text'), dtype=np.uint8, mode='r') if size else b''
+            chunk_offsets = np.concatenate([
+                byte_spans(bytes(text[doc_offsets[i]:doc_offsets[i + 1]]).decode('utf-8'), doc['chunk_spans'])
+                + doc_offsets[i] for i, doc in enumerate(documents)]).astype(np.int64)
+        return documents, DocumentStore.open(self._index_path('.text'), doc_offsets, doc_chunks, chunk_offsets)
+
+    def _text_matches(self, text_bytes, size, generation):
+        """O ``.text`` (``size`` bytes) é o da gravação ``generation`` com ``text_bytes`` de texto"""
+        if generation is None:
+            # Gravado antes da marca no fim do arquivo: só dá para conferir o tamanho
+            return text_bytes <= size
+        if size != text_bytes + TEXT_TRAILER_SIZE:
+            return False
+        with open(self._index_path('.text'), 'rb') as f:
+            f.seek(text_bytes)
+            trailer = f.read(TEXT_TRAILER_SIZE)
+        return trailer == TEXT_TRAILER_MAGIC + bytes.fromhex(generation)
+
+    def _load_chunk_offsets(self, doc_offsets, doc_chunks):
+        """Offsets em bytes dos chunks gravados em ``.chunks.npy``, ou ``None`` se ausentes/inconsistentes"""
+        try:
+            offsets = np.load(self._index_path('.chunks.npy'))
+        except (OSError, ValueError):
+            return None
+        owners = np.repeat(np.arange(len(doc_chunks) - 1), np.diff(doc_chunks))
+        if (offsets.shape != (int(doc_chunks[-1]), 2) or np.any(offsets[:, 0] < doc_offsets[owners])
+                or np.any(offsets[:, 1] > doc_offsets[owners + 1])):
+            logger.warning("Offsets dos chunks não correspondem aos documentos; recalculando.")
+            return None
+        return offsets
+
+    def _split_legacy_documents(self, legacy_docs):
+        """Separa os documentos do JSON antigo (com ``content`` e ``chunks``) em metadados e store"""
+        builder, documents = DocumentStoreBuilder(), []
+        for doc in legacy_docs:
+            spans = [tuple(span) for span in self._doc_chunk_spans(doc)]
+            builder.add(doc['content'], spans)
+            documents.append(dict({k: v for k, v in doc.items() if k not in ('content', 'chunks')}, chunk_spans=spans))
+        return documents, builder.build()
+
+    def _load_vectors(self, documents, store, vectors):
+        """Restaura vocabulário, idf e matriz TF-IDF persistidos (memory-map).
+
+        Retorna o snapshot pronto ou ``None`` quando é preciso refazer a vetorização.
+        """
+        if not documents or not vectors:
+            return None
+        from scipy.sparse import csr_matrix
+        from sklearn.base import clone
+
+        vectorizer = clone(self.vectorizer)
+        if vectors.get('corpus_version') != self._corpus_version(documents, vectorizer, store):
+            logger.info("Versão do corpus mudou desde a última vetorização; refazendo vetorização.")
+            return None
+        try:
+            # Arquivos com o id da gravação do JSON: se outra gravação já os
+            # substituiu, faltam e o índice é recusado
+            arrays = {name: np.load(self._vector_path(name, vectors.get('generation')), mmap_mode='r')
+                      for name in self.VECTOR_ARRAYS}
+            shape = tuple(vectors['shape'])
+            if shape != (store.n_chunks, len(vectors['vocabulary'])) or len(arrays['idf']) != shape[1]:
+                logger.warning("Vetores persistidos não correspondem aos documentos; refazendo vetorização.")
+                return None
+            vectorizer.vocabulary_ = {term: i for i, term in enumerate(vectors['vocabulary'])}
+            vectorizer.idf_ = np.asarray(arrays['idf'])
+            document_vectors = csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape)
+        except Exception as e:
+            logger.warning(f"Não foi possível carregar os vetores persistidos: {e}")
+            return None
+        logger.info(f"Vetores carregados do disco: {shape[0]} chunks.")
+        return IndexSnapshot(documents, vectorizer, document_vectors, store=store)
+
+    @STAGE_SECONDS.timed(stage='retrieve')
+    def _semantic_search(self, query, max_results=5, retriever=None):
+        """Realiza busca semântica usando TF-IDF e similaridade de cosseno.
+
+        ``retriever`` ("tfidf", "dense", "hybrid" ou "hybrid_dense") escolhe o
+        backend; o padrão é ``self.retriever``. O denso cai para TF-IDF se o
+        índice ANN não existir, e os híbridos caem para o vetorial sem BM25.
+        """
+        snapshot = self._snapshot  # Uma leitura só: o índice pode ser trocado durante a busca
+        if not snapshot.documents or snapshot.document_vectors is None: return []
+        retriever = retriever or self.retriever
+        hybrid = retriever in ("hybrid", "hybrid_dense") and snapshot.bm25 is not None
+        depth = max(50, max_results * 4) if hybrid else max_results * 2
+        query_vectors = None
+        if retriever in ("dense", "hybrid_dense") and snapshot.dense_index is not None:
+            query_vectors = self._embed([query])
+        if query_vectors is not None:
+            ids, scores = snapshot.dense_index.search(query_vectors, depth)[0]
+        else:
+            query_vector = snapshot.vectorizer.transform([query])
+            # Os vetores TF-IDF já saem normalizados (norma L2): o produto escalar é o cosseno
+            similarities = np.asarray(snapshot.document_vectors.dot(query_vector.T).todense()).ravel()
+            ids = self._top_k(similarities, depth)
+            scores = similarities[ids]
+        if hybrid:
+            return self._hybrid_results(snapshot, query, ids, scores, depth, max_results)
+        return self._results_from_candidates(snapshot, ids, scores, max_results)
+
+    def _hybrid_results(self, snapshot, query, ids, scores, depth, max_results):
+        """Funde o ranking vetorial com o do BM25 por Reciprocal Rank Fusion"""
+        vector_ranking = [int(i) for i, score in zip(ids, scores) if score > 0.01]
+        lexical = snapshot.bm25.scores(query)
+        slots = self._top_k(lexical, depth)
+        slots = slots[(lexical[slots] > 0) & (slots < len(snapshot.bm25_positions))]
+        positions = snapshot.bm25_positions[slots]
+        lexical_ranking = positions[positions >= 0].tolist()
+        fused, fused_scores = reciprocal_rank_fusion([lexical_ranking, vector_ranking])
+        return self._results_from_candidates(snapshot, fused, fused_scores, max_results, min_score=0.0)
+
+    def _results_from_candidates(self, snapshot, chunk_ids, scores, max_results, min_score=0.01):
+        """Monta os resultados (um por documento) a partir de chunks já ordenados por score.
+
+        Cada resultado leva só o chunk encontrado (``relevant_chunk``) e referências
+        a ele; o conteúdo completo do documento fica no store (``document_content``).
+        """
+        results, added_docs = [], set()
+        for idx, similarity in zip(chunk_ids, scores):
+            if similarity <= min_score:
+                break
+            doc = snapshot.documents[snapshot.chunk_doc_index[idx]]
+            if doc['id'] not in added_docs:
+                local_idx = int(snapshot.chunk_local_index[idx])
+                results.append({'id': doc['id'], 'filename': doc['filename'], 'relevant_chunk': snapshot.store.chunk(idx),
+                                'chunk_key': self._chunk_key(doc, local_idx), 'chunk_index': local_idx,
+                                'similarity_score': float(similarity),
+                                'chunk_span': list(doc['chunk_spans'][local_idx]),
+                                'page': doc['chunk_pages'][local_idx] if doc.get('chunk_pages') else None})
+                added_docs.add(doc['id'])
+                if len(results) >= max_results: break
+        return results
+
+    @STAGE_SECONDS.timed(stage='retrieve')
+    def _semantic_search_batch(self, queries, max_results=5, block_size=256, retriever=None):
+        """Busca semântica de várias perguntas: um ``transform`` e um produto esparso por bloco"""
+        snapshot = self._snapshot
+        if not snapshot.documents or snapshot.document_vectors is None:
+            return [[] for _ in queries]
+        retriever = retriever or self.retriever
+        hybrid = retriever in ("hybrid", "hybrid_dense") and snapshot.bm25 is not None
+        depth = max(50, max_results * 4) if hybrid else max_results * 2
+
+        def finish(query, ids, scores):
+            if hybrid:
+                return self._hybrid_results(snapshot, query, ids, scores, depth, max_results)
+            return self._results_from_candidates(snapshot, ids, scores, max_results)
+
+        query_vectors = None
+        if retriever in ("dense", "hybrid_dense") and snapshot.dense_index is not None:
+            query_vectors = self._embed(list(queries))
+        if query_vectors is not None:
+            neighbours = snapshot.dense_index.search(query_vectors, depth)
+            return [finish(query, ids, scores) for query, (ids, scores) in zip(queries, neighbours)]
+        all_results = []
+        for start in range(0, len(queries), block_size):
+            block = queries[start:start + block_size]
+            scores = snapshot.document_vectors.dot(snapshot.vectorizer.transform(block).T).tocsc()
+            for j, query in enumerate(block):
+                similarities = scores[:, j].toarray().ravel()
+                ids = self._top_k(similarities, depth)
+                all_results.append(finish(query, ids, similarities[ids]))
+        return all_results
+
+    @staticmethod
+    def _chunk_key(doc, local_idx):
+        """Identificador estável de um chunk: versão do documento + configuração do chunker + posição.
+
+        Com a assinatura do chunker na chave, um documento rechunkado ganha
+        chaves novas: BM25 e cache de respostas não reaproveitam os chunks antigos.
+        """
+        version = doc.get('fingerprint', {}).get('hash') or f"{doc['id']}@{doc.get('indexed_at')}"
+        return f"{version}/{doc.get('chunker', '')}:{local_idx}"
+
+    @staticmethod
+    def _top_k(scores, k):
+        """Índices dos ``k`` maiores valores, em ordem decrescente (seleção parcial)"""
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top], kind='stable')]
+
+    @STAGE_SECONDS.timed(stage='total')
+    def search(self, query, max_results=10, per_result_answers=False):
+        """Realiza busca inteligente com compreensão de linguagem natural.
+
+        Por padrão faz uma única geração por pergunta: os chunks dos melhores
+        resultados são deduplicados e juntados, em ordem de relevância, num
+        só contexto, e a resposta vai no primeiro resultado. Com
+        ``per_result_answers=True`` cada resultado recebe sua própria
+        resposta (uma geração por resultado); ``answer_result`` calcula essa
+        resposta sob demanda para um único documento.
+        """
         semantic_results = self._semantic_search(query, max_results)
         if not semantic_results: 
             return [{'ai_answer': 'Não encontrei informações relacionadas à sua pergunta.', 'confidence': 0.1}]
         
-        enhanced_results = []
+        if per_result_answers:
+            return [self._answer_result(query, result, semantic_results) for result in semantic_results]
+
+        return self._answer_query(query, semantic_results)
+
+    def _answer_query(self, query, semantic_results):
+        """Uma única geração para a pergunta, com o contexto combinado dos resultados"""
+        results = [result.copy() for result in semantic_results]
+        # PRIORIZA SEMPRE O MODELO DE IA (Mistral/Ollama)
+        packed = self._pack_context(self._query_context_results(semantic_results))
+        answer = self._cached_answer(query, packed)
+        if not answer:
+            # Só usa sistema interno se o modelo de IA falhar
+            answer = self._generate_natural_answer(query, packed.text)
+        results[0]['ai_answer'] = answer['answer']
+        results[0]['confidence'] = answer['confidence']
+        return results
+
+    def search_batch(self, queries, max_results=1, concurrency=None):
+        """Responde várias perguntas de uma vez.
+
+        A recuperação é vetorizada (um ``transform`` e um produto esparso
+        para todas as perguntas) e as gerações do LLM rodam com no máximo
+        ``concurrency`` chamadas simultâneas (limitado a
+        ``batch_concurrency``). Retorna, na ordem das perguntas,
+        ``{'query', 'results', 'timings'}`` com os tempos em segundos; o tempo
+        de recuperação é o do lote dividido entre as perguntas. Uma pergunta
+        que falhar vem com ``results`` vazio e ``error``, sem derrubar as demais.
+        """
+        if not queries:
+            return []
+        concurrency = min(concurrency or self.batch_concurrency, self.batch_concurrency)
+        started = time.perf_counter()
+        semantic_batch = self._semantic_search_batch(queries, max_results)
+        retrieve_time = (time.perf_counter() - started) / len(queries)
+
+        def answer(query, semantic_results):
+            answer_started = time.perf_counter()
+            try:
+                results = self._answer_query(query, semantic_results) if semantic_results else None
+            except Exception as e:
+                return self._batch_item(query, None, retrieve_time, answer_started, error=e)
+            return self._batch_item(query, results, retrieve_time, answer_started)
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="docia-batch") as executor:
+            items = list(executor.map(answer, queries, semantic_batch))
+        logger.info(f"Lote de {len(queries)} perguntas respondido em {time.perf_counter() - started:.2f}s")
+        return items
+
+    @staticmethod
+    def _batch_item(query, results, retrieve_time, answer_started, error=None):
+        """Item de ``search_batch``: ``results=None`` sem resultados; ``error`` se a pergunta falhou"""
+        item = {'query': query}
+        if error is not None:
+            logger.error(f"Erro ao responder '{query}' no lote: {error}")
+            item.update(results=[], error=str(error))
+        elif results is None:
+            item['results'] = [{'ai_answer': 'Não encontrei informações relacionadas à sua pergunta.', 'confidence': 0.1}]
+        else:
+            item['results'] = results
+        answer_time = time.perf_counter() - answer_started
+        item['timings'] = {'retrieve': retrieve_time, 'answer': answer_time, 'total': retrieve_time + answer_time}
+        return item
+
+    def answer_result(self, query, doc_id, max_results=10):
+        """Gera (sob demanda) a resposta de um resultado específico da busca"""
+        semantic_results = self._semantic_search(query, max_results)
+        for result in semantic_results:
+            if result['id'] == doc_id:
+                return self._answer_result(query, result, semantic_results)
+        return None
+
+    def _answer_result(self, query, result, semantic_results):
+        """Resposta individual de um resultado, com chunks extras do mesmo documento"""
+        enhanced_result = result.copy()
+        packed = self._pack_context(self._context_results(result, semantic_results))
+        answer = self._cached_answer(query, packed)
+        
+        if answer:
+            enhanced_result['ai_answer'] = answer['answer']
+            enhanced_result['confidence'] = answer['confidence']
+        else:
+            # Só usa sistema interno se o modelo de IA falhar
+            fallback_answer = self._generate_natural_answer(query, packed.text)
+            enhanced_result['ai_answer'] = fallback_answer['answer']
+            enhanced_result['confidence'] = fallback_answer['confidence']
+        return enhanced_result
+
+    def _query_context_results(self, semantic_results):
+        """Chunks dos resultados em ordem de relevância, sem repetições"""
+        context_results, seen = [], set()
         for result in semantic_results:
-            enhanced_result = result.copy()
-            # Usa múltiplos chunks para contexto mais rico
-            context_chunks = [result['relevant_chunk']]
-            
-            # Adiciona chunks adjacentes do mesmo documento para mais contexto
-            if len(semantic_results) > 1:
-                for other_result in semantic_results[1:3]:  # Adiciona até 2 chunks extras
-                    if other_result['id'] == result['id']:  # Mesmo documento
-                        context_chunks.append(other_result['relevant_chunk'])
-            
-            # PRIORIZA SEMPRE O MODELO DE IA (Mistral/Ollama)
-            combined_context = " ".join(context_chunks)
-            answer = self._answer_question(query, [combined_context])
-            
-            if answer:
-                enhanced_result['ai_answer'] = answer['answer']
-                enhanced_result['confidence'] = answer['confidence']
-            else:
-                # Só usa sistema interno se o modelo de IA falhar
-                fallback_answer = self._generate_natural_answer(query, combined_context)
-                enhanced_result['ai_answer'] = fallback_answer['answer']
-                enhanced_result['confidence'] = fallback_answer['confidence']
-            
-            enhanced_results.append(enhanced_result)
-        return enhanced_results
+            if result['chunk_key'] in seen or result['relevant_chunk'] in seen:
+                continue
+            seen.update((result['chunk_key'], result['relevant_chunk']))
+            context_results.append(result)
+        return context_results
 
-    def _answer_question(self, question, context_chunks):
-        context = " ".join(context_chunks)[:3000]  # Aumenta o contexto para 3000 caracteres
+    def _context_results(self, result, semantic_results):
+        """Resultado principal mais chunks extras do mesmo documento"""
+        # Usa múltiplos chunks para contexto mais rico
+        context_results = [result]
+        
+        # Adiciona chunks adjacentes do mesmo documento para mais contexto
+        if len(semantic_results) > 1:
+            for other_result in semantic_results[1:3]:  # Adiciona até 2 chunks extras
+                if other_result['id'] == result['id']:  # Mesmo documento
+                    context_results.append(other_result)
+        return context_results
+
+    def _build_context(self, result, semantic_results):
+        """Junta o chunk do resultado com chunks extras do mesmo documento"""
+        return self._pack_context(self._context_results(result, semantic_results)).text
+
+    @STAGE_SECONDS.timed(stage='prompt_build')
+    def _pack_context(self, context_results):
+        """Contexto do prompt: chunks dos resultados e vizinhos, sem repetição, no orçamento de tokens.
+
+        De cada documento só é lido do store o trecho entre o primeiro e o último chunk usados.
+        """
+        snapshot = self._snapshot
+        # (id, posição no snapshot, chunk local, chave, texto), em ordem de prioridade
+        wanted = []
+        for r in context_results:
+            position = snapshot.doc_positions.get(r['id'])
+            if position is not None and self._chunk_key(snapshot.documents[position], r['chunk_index']) != r['chunk_key']:
+                position = None  # Documento reindexado depois da busca: fica só o chunk do resultado
+            wanted.append((r['id'], position, r['chunk_index'], r['chunk_key'], r['relevant_chunk']))
+        # Vizinhos entram depois de todos os resultados, só para completar o orçamento
+        for distance in range(1, self.context_packer.neighbours + 1):
+            for doc_id, position, local_idx, _key, _text in wanted[:len(context_results)]:
+                if position is None:
+                    continue
+                doc = snapshot.documents[position]
+                for idx in (local_idx - distance, local_idx + distance):
+                    if 0 <= idx < len(doc['chunk_spans']):
+                        wanted.append((doc_id, position, idx, self._chunk_key(doc, idx), None))
+
+        windows = {}
+        for _id, position, idx, _key, _text in wanted:
+            if position is not None:
+                first, last = windows.get(position, (idx, idx))
+                windows[position] = (min(first, idx), max(last, idx))
+        texts = {position: snapshot.store.window(position, first, last) for position, (first, last) in windows.items()}
+        pieces = []
+        for doc_id, position, idx, key, text in wanted:
+            if position is None:
+                pieces.append({'id': doc_id, 'content': text, 'start': 0, 'end': len(text), 'chunk_key': key})
+                continue
+            spans = snapshot.documents[position]['chunk_spans']
+            base = spans[windows[position][0]][0]
+            pieces.append({'id': doc_id, 'content': texts[position], 'start': spans[idx][0] - base,
+                           'end': spans[idx][1] - base, 'chunk_key': key})
+        return self.context_packer.pack(pieces)
+
+    def _cached_answer(self, query, packed):
+        """Resposta do cache (pergunta normalizada + chunks) ou gerada pelo LLM"""
+        key = self.answer_cache.make_key(query, packed.chunk_keys)
+        answer = self.answer_cache.get(key)
+        if answer is not None:
+            logger.info("Resposta encontrada no cache.")
+            return answer
+        answer = self._answer_question(query, [packed.text])
+        # Respostas do sistema de fallback são baratas e não vão para o cache,
+        # para que o LLM volte a ser usado assim que estiver disponível
+        if answer and answer.get('model') not in FALLBACK_MODELS:
+            self.answer_cache.put(key, answer, packed.doc_ids)
+        return answer
+
+    @STAGE_SECONDS.timed(stage='total')
+    def search_stream(self, query, max_results=1):
+        """Versão em streaming de ``search`` para o melhor resultado.
+
+        Gera eventos (dicts) na ordem: ``context`` com os metadados dos
+        trechos recuperados, vários ``token`` com o texto da resposta à
+        medida que o Ollama o produz e, por fim, ``done`` com a confiança.
+        Se o Ollama não estiver disponível, a resposta do sistema de
+        fallback é enviada como um único ``token``. Se o stream cair no meio,
+        ``done`` sai com ``partial: True`` e confiança menor, e a resposta
+        não vai para o cache.
+        """
+        semantic_results = self._semantic_search(query, max_results)
+        yield {'type': 'context', 'results': [
+            {'id': r['id'], 'filename': r['filename'], 'similarity_score': r['similarity_score']}
+            for r in semantic_results
+        ]}
+        if not semantic_results:
+            yield {'type': 'token', 'text': 'Não encontrei informações relacionadas à sua pergunta.'}
+            yield {'type': 'done', 'confidence': 0.1}
+            return
+
+        packed = self._pack_context(self._query_context_results(semantic_results))
+        context = packed.text
+        cache_key = self.answer_cache.make_key(query, packed.chunk_keys)
+        cached = self.answer_cache.get(cache_key)
+        if cached is not None:
+            yield {'type': 'token', 'text': cached['answer']}
+            yield {'type': 'done', 'confidence': cached['confidence'], 'model': cached.get('model'), 'cached': True}
+            return
+
+        tokens = []
+        deadline = self.generation_queue.deadline()
+        shed = interrupted = False
+        if self.llm_client.is_available():
+            try:
+                with self.generation_queue.slot(deadline):
+                    self.model_name = "mistral"
+                    logger.info(f">>> Streaming de resposta do Ollama com modelo: {self.model_name}")
+                    for token in self.llm_client.generate_stream(self.model_name, self._build_prompt(query, context),
+                                                                 options=OLLAMA_OPTIONS,
+                                                                 timeout=self._generation_timeout(deadline)):
+                        tokens.append(token)
+                        yield {'type': 'token', 'text': token}
+            except AdmissionRejected as e:
+                logger.warning(f"Geração recusada ({e.reason}); respondendo com o sistema aprimorado")
+                shed = True
+            except StreamInterrupted as e:
+                logger.warning(f"Stream do Ollama interrompido ({e}); resposta parcial fora do cache")
+                interrupted = True
+        if tokens:
+            yield self._stream_done(cache_key, tokens, packed.doc_ids, interrupted)
+            return
+
+        answer = self._fallback_answer(query, context, not shed)
+        yield {'type': 'token', 'text': answer['answer']}
+        yield {'type': 'done', 'confidence': answer['confidence'], 'model': answer.get('model')}
+
+    def _stream_done(self, cache_key, tokens, doc_ids, interrupted):
+        """Evento ``done`` de uma resposta em stream; só a resposta completa vai para o cache"""
+        if interrupted:
+            return {'type': 'done', 'confidence': PARTIAL_ANSWER_CONFIDENCE, 'model': self.model_name,
+                    'partial': True}
+        answer = "".join(tokens).strip()
+        if len(answer) > 10:
+            self.answer_cache.put(cache_key, {'answer': answer, 'confidence': 0.95, 'model': self.model_name},
+                                  doc_ids)
+        return {'type': 'done', 'confidence': 0.95, 'model': self.model_name}
+
+    # ---- Caminho asyncio ---------------------------------------------------
+
+    def _run_blocking(self, func, *args):
+        """Roda ``func`` no pool de busca, sem bloquear o event loop"""
+        if self._search_executor is None:
+            # Criado sob demanda: threads não sobrevivem ao fork dos workers
+            self._search_executor = ThreadPoolExecutor(max_workers=max(1, self.search_threads),
+                                                       thread_name_prefix="docia-search")
+        return asyncio.get_running_loop().run_in_executor(self._search_executor, functools.partial(func, *args))
+
+    @STAGE_SECONDS.timed(stage='total')
+    async def asearch(self, query, max_results=10, per_result_answers=False):
+        """Versão asyncio de ``search``.
+
+        A recuperação (TF-IDF/BM25/ANN), a montagem do contexto e o sistema
+        de fallback rodam no pool de threads ``DOCIA_SEARCH_THREADS``; a
+        geração usa o cliente ``aiohttp`` do Ollama e espera na fila por uma
+        das ``DOCIA_MAX_GENERATIONS`` vagas, de modo que um processo segura
+        centenas de perguntas pendentes sem prender uma thread por pergunta.
+        """
+        semantic_results = await self._run_blocking(self._semantic_search, query, max_results)
+        if not semantic_results:
+            return [{'ai_answer': 'Não encontrei informações relacionadas à sua pergunta.', 'confidence': 0.1}]
+
+        if per_result_answers:
+            answers = await asyncio.gather(*(self._aanswer_context(query, self._context_results(result, semantic_results))
+                                             for result in semantic_results))
+            return [dict(result, ai_answer=answer['answer'], confidence=answer['confidence'])
+                    for result, answer in zip(semantic_results, answers)]
+
+        answer = await self._aanswer_context(query, self._query_context_results(semantic_results))
+        results = [result.copy() for result in semantic_results]
+        results[0]['ai_answer'] = answer['answer']
+        results[0]['confidence'] = answer['confidence']
+        return results
+
+    async def asearch_batch(self, queries, max_results=1, concurrency=None):
+        """Versão asyncio de ``search_batch`` (mesmo formato dos itens).
+
+        Só a recuperação vetorizada passa pelo pool de busca; as gerações
+        seguem o caminho asyncio (vaga em ``aslot`` e ``agenerate``), no
+        máximo ``concurrency`` de cada vez, sem prender threads do pool.
+        """
+        if not queries:
+            return []
+        concurrency = min(concurrency or self.batch_concurrency, self.batch_concurrency)
+        started = time.perf_counter()
+        semantic_batch = await self._run_blocking(self._semantic_search_batch, queries, max_results)
+        retrieve_time = (time.perf_counter() - started) / len(queries)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def answer(query, semantic_results):
+            async with semaphore:
+                answer_started = time.perf_counter()
+                if not semantic_results:
+                    return self._batch_item(query, None, retrieve_time, answer_started)
+                try:
+                    answer = await self._aanswer_context(query, self._query_context_results(semantic_results))
+                except Exception as e:
+                    return self._batch_item(query, None, retrieve_time, answer_started, error=e)
+                results = [result.copy() for result in semantic_results]
+                results[0].update(ai_answer=answer['answer'], confidence=answer['confidence'])
+                return self._batch_item(query, results, retrieve_time, answer_started)
+
+        items = await asyncio.gather(*(answer(query, results) for query, results in zip(queries, semantic_batch)))
+        logger.info(f"Lote de {len(queries)} perguntas respondido em {time.perf_counter() - started:.2f}s")
+        return items
+
+    async def aanswer_result(self, query, doc_id, max_results=10):
+        """Versão asyncio de ``answer_result`` (geração pelo caminho asyncio)"""
+        semantic_results = await self._run_blocking(self._semantic_search, query, max_results)
+        for result in semantic_results:
+            if result['id'] == doc_id:
+                answer = await self._aanswer_context(query, self._context_results(result, semantic_results))
+                return dict(result, ai_answer=answer['answer'], confidence=answer['confidence'])
+        return None
+
+    async def _aanswer_context(self, query, context_results):
+        """Resposta para os trechos dados: cache, LLM e, se tudo falhar, sistema interno"""
+        packed = await self._run_blocking(self._pack_context, context_results)
+        key = self.answer_cache.make_key(query, packed.chunk_keys)
+        answer = await self._run_blocking(self.answer_cache.get, key)
+        if answer is not None:
+            logger.info("Resposta encontrada no cache.")
+            return answer
+        answer = await self._aanswer_question(query, packed.text)
+        if answer and answer.get('model') not in FALLBACK_MODELS:
+            await self._run_blocking(self.answer_cache.put, key, answer, packed.doc_ids)
+        return answer or await self._run_blocking(self._generate_natural_answer, query, packed.text)
+
+    async def _aanswer_question(self, question, context, deadline=None):
+        """Versão asyncio de ``_answer_question`` (mesma ordem de tentativas e mesmo prazo)"""
+        context = self.context_packer.fit(context, self.context_packer.max_tokens)
+        if deadline is None:
+            deadline = self.generation_queue.deadline()
+        try:
+            for attempt in range(3):
+                if not self._can_generate(deadline):
+                    break
+                if attempt:
+                    LLM_RETRIES.inc()
+                ollama_answer = await self._aanswer_with_ollama(question, context, deadline)
+                if ollama_answer:
+                    return ollama_answer
+                logger.warning(f"Tentativa {attempt + 1} do Ollama falhou")
+        except AdmissionRejected as e:
+            logger.warning(f"Geração recusada ({e.reason}); respondendo com o sistema aprimorado")
+            return await self._run_blocking(self._fallback_answer, question, context, False)
+        return await self._run_blocking(self._fallback_answer, question, context)
+
+    async def _aanswer_with_ollama(self, question, context, deadline=None):
+        """Versão asyncio de ``_answer_with_ollama``: espera uma vaga de geração antes de chamar o Ollama"""
+        async with self.generation_queue.aslot(deadline):
+            if not self.llm_client.is_available():
+                return None
+            self.model_name = "mistral"
+            answer = await self.llm_client.agenerate(self.model_name, self._build_prompt(question, context),
+                                                     options=OLLAMA_OPTIONS, timeout=self._generation_timeout(deadline))
+        return self._ollama_answer(answer)
+
+    @STAGE_SECONDS.timed(stage='total')
+    async def asearch_stream(self, query, max_results=1):
+        """Versão asyncio de ``search_stream`` (mesmos eventos, gerador assíncrono)"""
+        semantic_results = await self._run_blocking(self._semantic_search, query, max_results)
+        yield {'type': 'context', 'results': [
+            {'id': r['id'], 'filename': r['filename'], 'similarity_score': r['similarity_score']}
+            for r in semantic_results
+        ]}
+        if not semantic_results:
+            yield {'type': 'token', 'text': 'Não encontrei informações relacionadas à sua pergunta.'}
+            yield {'type': 'done', 'confidence': 0.1}
+            return
+
+        packed = await self._run_blocking(self._pack_context, self._query_context_results(semantic_results))
+        cache_key = self.answer_cache.make_key(query, packed.chunk_keys)
+        cached = await self._run_blocking(self.answer_cache.get, cache_key)
+        if cached is not None:
+            yield {'type': 'token', 'text': cached['answer']}
+            yield {'type': 'done', 'confidence': cached['confidence'], 'model': cached.get('model'), 'cached': True}
+            return
+
+        tokens = []
+        deadline = self.generation_queue.deadline()
+        shed = interrupted = False
+        if self.llm_client.is_available():
+            try:
+                async with self.generation_queue.aslot(deadline):
+                    self.model_name = "mistral"
+                    async for token in self.llm_client.agenerate_stream(
+                            self.model_name, self._build_prompt(query, packed.text), options=OLLAMA_OPTIONS,
+                            timeout=self._generation_timeout(deadline)):
+                        tokens.append(token)
+                        yield {'type': 'token', 'text': token}
+            except AdmissionRejected as e:
+                logger.warning(f"Geração recusada ({e.reason}); respondendo com o sistema aprimorado")
+                shed = True
+            except StreamInterrupted as e:
+                logger.warning(f"Stream do Ollama interrompido ({e}); resposta parcial fora do cache")
+                interrupted = True
+        if tokens:
+            yield await self._run_blocking(self._stream_done, cache_key, tokens, packed.doc_ids, interrupted)
+            return
+
+        answer = await self._run_blocking(self._fallback_answer, query, packed.text, not shed)
+        yield {'type': 'token', 'text': answer['answer']}
+        yield {'type': 'done', 'confidence': answer['confidence'], 'model': answer.get('model')}
+
+    @property
+    def max_generations(self):
+        return self.generation_queue.max_concurrency
+
+    @max_generations.setter
+    def max_generations(self, value):
+        self.generation_queue.resize(value)
+
+    def generation_stats(self):
+        return self.generation_queue.stats()
+
+    def _can_generate(self, deadline):
+        """Vale a pena (mais) uma tentativa no Ollama: ele está no ar e ainda há prazo"""
+        if not self.llm_client.is_available():
+            logger.warning("Ollama indisponível (health check/circuit breaker); pulando tentativas")
+            return False
+        if deadline is not None and self.generation_queue.remaining(deadline) <= 0:
+            logger.warning("Prazo da pergunta esgotado; pulando novas tentativas no Ollama")
+            return False
+        return True
+
+    @staticmethod
+    def _generation_timeout(deadline):
+        """Timeout da chamada ao Ollama: 2 minutos, ou o que resta do prazo da pergunta"""
+        remaining = GenerationQueue.remaining(deadline)
+        return 120 if remaining is None else min(120, max(remaining, 1))
+
+    def _build_prompt(self, question, context):
+        """Prompt enviado ao Ollama/Mistral"""
+        return f"""Com base EXCLUSIVAMENTE nos documentos fornecidos, responda em português de forma clara e objetiva.
+
+IMPORTANTE: 
+- Use APENAS as informações dos documentos
+- NÃO invente ou adicione informações
+- Se a resposta não estiver nos documentos, diga: "Não encontrei essa informação nos documentos fornecidos"
+- Seja específico e cite detalhes como datas, nomes e valores quando disponíveis
+
+DOCUMENTOS:
+{context}
+
+PERGUNTA: {question}
+
+RESPOSTA (baseada apenas nos documentos):"""
+
+    def _answer_question(self, question, context_chunks, deadline=None):
+        # Corta no orçamento de tokens do contexto, no fim de uma frase
+        context = self.context_packer.fit(" ".join(context_chunks), self.context_packer.max_tokens)
+        # Prazo da pergunta: vale para a fila, as tentativas e o timeout de cada chamada
+        if deadline is None:
+            deadline = self.generation_queue.deadline()
         
         # SEMPRE TENTA OLLAMA/MISTRAL PRIMEIRO - MÚLTIPLAS TENTATIVAS
         logger.info("===== INICIANDO BUSCA POR RESPOSTA =====")
         logger.info(f"Pergunta: {question}")
         logger.info(f"Tipo IA detectado: {getattr(self, 'llm_type', 'unknown')}")
         
-        # Tenta Ollama até 3 vezes
-        for attempt in range(3):
-            logger.info(f"Tentativa {attempt + 1}/3 de usar Ollama/Mistral...")
-            ollama_answer = self._answer_with_ollama(question, context)
-            if ollama_answer:
-                logger.info("SUCESSO: Resposta gerada pelo Mistral!")
-                return ollama_answer
-            else:
-                logger.warning(f"Tentativa {attempt + 1} do Ollama falhou")
-        
+        # Tenta Ollama até 3 vezes (desiste na hora se o Ollama estiver fora do ar
+        # ou o prazo acabar); sem vaga na fila, responde com o sistema aprimorado
+        try:
+            for attempt in range(3):
+                if not self._can_generate(deadline):
+                    break
+                if attempt:
+                    LLM_RETRIES.inc()
+                logger.info(f"Tentativa {attempt + 1}/3 de usar Ollama/Mistral...")
+                ollama_answer = self._answer_with_ollama(question, context, deadline)
+                if ollama_answer:
+                    logger.info("SUCESSO: Resposta gerada pelo Mistral!")
+                    return ollama_answer
+                else:
+                    logger.warning(f"Tentativa {attempt + 1} do Ollama falhou")
+        except AdmissionRejected as e:
+            logger.warning(f"Geração recusada ({e.reason}); respondendo com o sistema aprimorado")
+            return self._fallback_answer(question, context, use_huggingface=False)
+
         logger.warning("FALHA: Ollama não respondeu após 3 tentativas")
-        
+        return self._fallback_answer(question, context)
+
+    def _fallback_answer(self, question, context, use_huggingface=True):
+        """Resposta sem o Ollama: Hugging Face (se escolhido) ou sistema aprimorado.
+
+        Com ``use_huggingface=False`` (geração recusada por carga) vai direto
+        ao sistema aprimorado, que não disputa CPU com as gerações.
+        """
+        answer = None
         # Se Ollama falhar, tenta Hugging Face
-        if hasattr(self, 'llm_type') and self.llm_type == "huggingface":
+        if use_huggingface and getattr(self, 'llm_type', None) == "huggingface":
             logger.info("Tentando Hugging Face como fallback...")
-            hf_answer = self._answer_with_huggingface(question, context)
-            if hf_answer:
+            answer = self._answer_with_huggingface(question, context)
+            if answer:
                 logger.info("Resposta gerada pelo Hugging Face")
-                return hf_answer
-        
-        logger.warning("FALLBACK: Usando sistema aprimorado")
-        # Usa sistema aprimorado que cria respostas mais inteligentes
-        return self._answer_with_enhanced_system(question, context)
+        if not answer:
+            logger.warning("FALLBACK: Usando sistema aprimorado")
+            # Usa sistema aprimorado que cria respostas mais inteligentes
+            answer = self._answer_with_enhanced_system(question, context)
+        LLM_FALLBACKS.inc(backend=answer.get('model', 'desconhecido'))
+        return answer
 
-    def _answer_with_ollama(self, question, context):
-        """Resposta usando Ollama/Mistral"""
+    def _answer_with_ollama(self, question, context, deadline=None):
+        """Resposta usando Ollama/Mistral, numa vaga da fila de gerações.
+
+        Levanta ``AdmissionRejected`` se não houver vaga até ``deadline``.
+        """
+        with self.generation_queue.slot(deadline):
+            return self._generate_with_ollama(question, context, deadline)
+
+    def _generate_with_ollama(self, question, context, deadline):
         try:
-            import requests
             logger.info(">>> Tentando usar Ollama/Mistral para resposta...")
             
-            # Verifica se o Ollama está rodando
-            try:
-                health_check = requests.get("http://localhost:11434/api/tags", timeout=5)
-                if health_check.status_code != 200:
-                    logger.error(">>> OLLAMA NÃO ESTÁ RODANDO! Execute: docker run -d -p 11434:11434 ollama/ollama")
-                    return None
-            except requests.exceptions.RequestException:
+            # Saúde em cache: não faz um GET em /api/tags a cada geração
+            if not self.llm_client.is_available():
                 logger.error(">>> OLLAMA NÃO ESTÁ ACESSÍVEL! Verifique se está rodando na porta 11434")
                 return None
             
@@ -252,53 +1701,16 @@ class SmartDocumentIndexer:
             self.model_name = "mistral"
             logger.info(f">>> Usando modelo forcado: {self.model_name}")
             
-            prompt = f"""Com base EXCLUSIVAMENTE nos documentos fornecidos, responda em português de forma clara e objetiva.
-
-IMPORTANTE: 
-- Use APENAS as informações dos documentos
-- NÃO invente ou adicione informações
-- Se a resposta não estiver nos documentos, diga: "Não encontrei essa informação nos documentos fornecidos"
-- Seja específico e cite detalhes como datas, nomes e valores quando disponíveis
-
-DOCUMENTOS:
-{context}
-
-PERGUNTA: {question}
-
-RESPOSTA (baseada apenas nos documentos):"""
+            prompt = self._build_prompt(question, context)
 
             logger.info(f">>> Enviando requisicao para Ollama com modelo: {self.model_name}")
-            response = requests.post(
-                "http://localhost:11434/api/generate", 
-                json={
-                    "model": self.model_name, 
-                    "prompt": prompt, 
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.3,  # Diminui criatividade
-                        "num_predict": 300,  # Respostas mais concisas
-                        "top_p": 0.8,
-                        "repeat_penalty": 1.1,
-                        "top_k": 20
-                    }
-                }, 
-                timeout=120  # Aumenta timeout para 2 minutos
+            answer = self.llm_client.generate(
+                self.model_name,
+                prompt,
+                options=OLLAMA_OPTIONS,
+                timeout=self._generation_timeout(deadline)  # Até 2 minutos, dentro do prazo da pergunta
             )
-            
-            logger.info(f">>> Status da resposta Ollama: {response.status_code}")
-            if response.status_code == 200:
-                response_data = response.json()
-                answer = response_data.get('response', '').strip()
-                logger.info(f">>> Resposta do Mistral recebida: {len(answer)} caracteres")
-                logger.info(f">>> Conteúdo da resposta: {answer[:100]}...")
-                
-                if answer and len(answer) > 10:  # Garante resposta mínima
-                    logger.info(">>> RETORNANDO RESPOSTA DO MISTRAL!")
-                    return {'answer': answer, 'confidence': 0.95}
-                else:
-                    logger.warning(">>> Resposta do Mistral muito curta ou vazia")
-            else:
-                logger.error(f">>> Erro HTTP do Ollama: {response.status_code} - {response.text}")
+            return self._ollama_answer(answer)
                     
         except Exception as e:
             logger.error(f">>> ERRO NO OLLAMA: {e}")
@@ -306,14 +1718,46 @@ RESPOSTA (baseada apenas nos documentos):"""
         
         return None
 
+    def _ollama_answer(self, answer):
+        """Resposta do Mistral no formato do app, ou ``None`` se vazia/curta demais"""
+        if answer is None:
+            return None
+        answer = answer.strip()
+        logger.info(f">>> Resposta do Mistral recebida: {len(answer)} caracteres")
+        logger.info(f">>> Conteúdo da resposta: {answer[:100]}...")
+        if answer and len(answer) > 10:  # Garante resposta mínima
+            logger.info(">>> RETORNANDO RESPOSTA DO MISTRAL!")
+            return {'answer': answer, 'confidence': 0.95, 'model': self.model_name}
+        logger.warning(">>> Resposta do Mistral muito curta ou vazia")
+        return None
+
+    def _get_qa_pipeline(self):
+        """Carrega o modelo Hugging Face na primeira chamada; em caso de erro passa ao sistema interno"""
+        with self._qa_pipeline_lock:
+            if self.qa_pipeline is None and self.llm_type == "huggingface":
+                try:
+                    from transformers import pipeline
+
+                    started = time.perf_counter()
+                    self.qa_pipeline = pipeline("text-generation", model=self.hf_model)
+                    self.startup_timings['hf_model_load'] = time.perf_counter() - started
+                    logger.info("✅ Modelo Hugging Face carregado")
+                except Exception as e:
+                    logger.warning(f"Hugging Face não disponível: {e}")
+                    self.llm_type = "internal"
+            return self.qa_pipeline
+
     def _answer_with_huggingface(self, question, context):
         """Resposta usando Hugging Face"""
         try:
+            qa_pipeline = self._get_qa_pipeline()
+            if qa_pipeline is None:
+                return None
             prompt = f"Responda APENAS com a informação solicitada, curta, direta e natural, em português. Se não souber, diga: 'Não encontrei essa informação.'\n\nContexto: {context}\n\nPergunta: {question}\nResposta:"
-            result = self.qa_pipeline(prompt, max_length=len(prompt) + 80, num_return_sequences=1, temperature=0.2, pad_token_id=50256)
+            result = qa_pipeline(prompt, max_length=len(prompt) + 80, num_return_sequences=1, temperature=0.2, pad_token_id=50256)
             if result and result[0]['generated_text']:
                 answer = result[0]['generated_text'][len(prompt):].strip()
-                if answer: return {'answer': answer, 'confidence': 0.9}
+                if answer: return {'answer': answer, 'confidence': 0.9, 'model': 'huggingface'}
         except Exception as e: logger.error(f"Erro no Hugging Face: {e}")
         return None
 
@@ -468,20 +1912,67 @@ RESPOSTA (baseada apenas nos documentos):"""
         # Resposta padrão mais natural
         return {'answer': "Não encontrei informações específicas sobre essa questão nas atas disponíveis.", 'confidence': 0.3}
 
-    def _read_pdf(self, file_path):
+    @staticmethod
+    def _read_pdf(file_path, file_hash=None, page_cache=None):
         try:
-            with open(file_path, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                return "".join((page.extract_text() or "") for page in reader.pages)
+            # Páginas separadas por PAGE_BREAK: o chunker não mistura páginas
+            return PAGE_BREAK.join(page or "" for page in
+                                   SmartDocumentIndexer._iter_pdf_pages(file_path, file_hash, page_cache))
         except Exception as e: logger.error(f"Erro ao ler PDF {file_path}: {e}"); return ""
 
-    def _read_docx(self, file_path):
+    @staticmethod
+    def _iter_pdf_pages(file_path, file_hash=None, page_cache=None):
+        """Gera o texto de cada página do PDF, uma por vez.
+
+        Com ``page_cache`` e ``file_hash``, cada página extraída é gravada no
+        cache assim que fica pronta; páginas já em cache não são reextraídas
+        e, se todas estiverem lá, o PDF nem é aberto. Uma página com erro
+        gera ``None`` (e fica fora do cache para a próxima tentativa).
+        """
+        import PyPDF2
+
+        cache = page_cache if file_hash else None
+        count = cache.page_count(file_hash) if cache else None
+        handle = reader = None
+        try:
+            if count is None:
+                handle = open(file_path, 'rb')
+                reader = PyPDF2.PdfReader(handle)
+                count = len(reader.pages)
+            failed = False
+            for page_number in range(count):
+                text = cache.get(file_hash, page_number) if cache else None
+                if text is None:
+                    if reader is None:
+                        handle = open(file_path, 'rb')
+                        reader = PyPDF2.PdfReader(handle)
+                    try:
+                        text = reader.pages[page_number].extract_text() or ""
+                    except Exception as e:
+                        logger.error(f"Erro ao ler a página {page_number + 1} de {file_path}: {e}")
+                        failed = True
+                        yield None
+                        continue
+                    if cache:
+                        cache.put(file_hash, page_number, text)
+                yield text
+            if cache and not failed:
+                cache.complete(file_hash, count)
+        finally:
+            if handle is not None:
+                handle.close()
+
+    @staticmethod
+    def _read_docx(file_path):
         try:
+            from docx import Document
+
             doc = Document(file_path)
-            return "\n".join(para.text for para in doc.paragraphs)
+            return "\n\n".join(para.text for para in doc.paragraphs)
         except Exception as e: logger.error(f"Erro ao ler DOCX {file_path}: {e}"); return ""
 
-    def _read_txt(self, file_path):
+    @staticmethod
+    def _read_txt(file_path):
         try:
             with open(file_path, 'r', encoding='utf-8') as f: return f.read()
         except Exception as e: logger.error(f"Erro ao ler TXT {file_path}: {e}"); return ""
@@ -589,13 +2080,28 @@ RESPOSTA (baseada apenas nos documentos):"""
                 model_status = "Hugging Face"
             else:
                 model_status = "Sistema Interno"
+        elif not self.initialized.is_set():
+            model_status = "Inicializando"
         else:
             model_status = "Não detectado"
         
         return {
             'total_documents': len(self.documents),
+            'total_chunks': self._snapshot.n_chunks,
+            'text_bytes': self._snapshot.store.nbytes,
             'last_update': self.last_update,
             'has_ai_model': hasattr(self, 'llm_type') and self.llm_type != "internal",
             'model_status': model_status,
-            'model_type': getattr(self, 'llm_type', 'unknown')
+            'model_type': getattr(self, 'llm_type', 'unknown'),
+            'answer_cache': self.answer_cache.stats(),
+            'startup': dict(self.startup_timings, initialized=self.initialized.is_set())
         }
+
+
+# Leitores nativos; chamam os métodos pelo nome para que possam ser trocados na classe
+register_reader((".pdf",), lambda path, file_hash=None, page_cache=None:
+                SmartDocumentIndexer._read_pdf(path, file_hash, page_cache), cost=EXPENSIVE, paged=True, name="pdf",
+                pages=lambda path, file_hash=None, page_cache=None:
+                SmartDocumentIndexer._iter_pdf_pages(path, file_hash, page_cache))
+register_reader((".docx",), lambda path: SmartDocumentIndexer._read_docx(path), name="docx")
+register_reader((".txt",), lambda path: SmartDocumentIndexer._read_txt(path), name="txt")
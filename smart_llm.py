@@ -0,0 +1,361 @@
+import os
+import json
+import time
+import logging
+import threading
+import weakref
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from smart_metrics import LLM_ERRORS, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+
+
+class StreamInterrupted(Exception):
+    """O stream do Ollama falhou depois de já ter produzido tokens (resposta parcial)"""
+
+
+class _Admission:
+    """Chamada liberada pelo circuit breaker (``trial``: é a chamada de teste do estado meio-aberto)"""
+    __slots__ = ('trial',)
+
+    def __init__(self, trial=False):
+        self.trial = trial
+
+
+class CircuitBreaker:
+    """Circuit breaker simples: abre após falhas seguidas e testa de novo após um tempo.
+
+    No estado meio-aberto uma única chamada de teste passa. ``allow_request``
+    devolve um token (verdadeiro) para cada chamada liberada; se a chamada
+    de teste terminar sem ``record_success``/``record_failure`` (stream
+    abandonado, tarefa cancelada, exceção inesperada), ``release_trial``
+    com o token dela a libera. Chamadas liberadas antes, com o circuito
+    fechado, não mexem no teste em andamento. Uma chamada de teste que passe
+    de ``trial_timeout`` segundos é dada como perdida, de modo que o
+    circuito nunca fica preso.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0, trial_timeout=120.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.trial_timeout = trial_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = None
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self):
+        """Token da chamada liberada, ou ``None``; no estado meio-aberto só uma chamada de teste passa"""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return _Admission()
+            if state == self.HALF_OPEN and not self._trial_in_flight():
+                self._trial = _Admission(trial=True)
+                self._trial_started = time.monotonic()
+                return self._trial
+            return None
+
+    def _trial_in_flight(self):
+        return (self._trial_started is not None
+                and time.monotonic() - self._trial_started < self.trial_timeout)
+
+    def release_trial(self, admission):
+        """Libera a chamada de teste ``admission`` se ela terminou sem sucesso nem falha registrados"""
+        with self._lock:
+            if admission is not None and admission is self._trial:
+                self._trial = self._trial_started = None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = self._trial_started = None
+
+    def record_failure(self):
+        LLM_ERRORS.inc()
+        with self._lock:
+            self._failures += 1
+            trial = self._trial_started is not None
+            if trial or self._failures >= self.failure_threshold:
+                if self._opened_at is None or trial:
+                    logger.warning(f"Circuit breaker do Ollama aberto por {self.reset_timeout}s")
+                self._opened_at = time.monotonic()
+            self._trial = self._trial_started = None
+
+
+class OllamaClient:
+    """Cliente Ollama com conexões persistentes, saúde em cache e circuit breaker.
+
+    A mesma instância atende chamadas síncronas (``generate``, via
+    ``requests.Session`` com pool keep-alive) e assíncronas (``agenerate``
+    e ``agenerate_stream``, via ``aiohttp``). A saúde do servidor é consultada em ``/api/tags`` por
+    uma thread em segundo plano, nunca a cada geração.
+    """
+
+    def __init__(self, host=None, health_interval=None, connect_timeout=3.0, read_timeout=120.0, pool_size=10,
+                 breaker=None):
+        self.host = (host or OLLAMA_HOST).rstrip('/')
+        self.health_interval = float(health_interval or os.getenv("OLLAMA_HEALTH_INTERVAL", "15"))
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=int(os.getenv("OLLAMA_BREAKER_FAILURES", "3")),
+            reset_timeout=float(os.getenv("OLLAMA_BREAKER_RESET", "30")),
+            trial_timeout=connect_timeout + read_timeout,
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.health = {'available': False, 'models': [], 'checked_at': None}
+        self._health_thread = None
+        self._stop = threading.Event()
+        self._async_sessions = weakref.WeakKeyDictionary()
+
+    # ---- Saúde -------------------------------------------------------------
+
+    def refresh_health(self):
+        """Consulta ``/api/tags`` uma vez e atualiza o estado em cache"""
+        try:
+            response = self.session.get(f"{self.host}/api/tags", timeout=(self.connect_timeout, 5))
+            available = response.status_code == 200
+            models = [m['name'] for m in response.json().get('models', [])] if available else []
+        except (requests.exceptions.RequestException, ValueError):
+            available, models = False, []
+        if available and not self.health['available']:
+            logger.info(f"Ollama disponível em {self.host}")
+        elif not available and self.health['available']:
+            logger.warning(f"Ollama indisponível em {self.host}")
+        self.health = {'available': available, 'models': models, 'checked_at': time.time()}
+        return self.health
+
+    def start_health_monitor(self):
+        """Inicia a thread que atualiza a saúde do Ollama periodicamente"""
+        if self._health_thread and self._health_thread.is_alive():
+            return
+        self._stop.clear()
+        self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+        self._health_thread.start()
+
+    def stop_health_monitor(self):
+        self._stop.set()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.refresh_health()
+
+    def is_available(self):
+        """Ollama respondeu ao último health check e o circuito não está aberto"""
+        return self.health['available'] and self.breaker.state != CircuitBreaker.OPEN
+
+    # ---- Geração -----------------------------------------------------------
+
+    def _payload(self, model, prompt, options, stream=False):
+        return {"model": model, "prompt": prompt, "stream": stream, "options": options or {}}
+
+    def generate(self, model, prompt, options=None, timeout=None):
+        """Gera uma resposta completa; retorna ``None`` se o Ollama falhar ou estiver indisponível"""
+        admission = self.breaker.allow_request() if self.health['available'] else None
+        if not admission:
+            return None
+        started = time.perf_counter()
+        try:
+            response = self.session.post(
+                f"{self.host}/api/generate", json=self._payload(model, prompt, options),
+                timeout=(self.connect_timeout, timeout or self.read_timeout),
+            )
+            if response.status_code != 200:
+                logger.error(f">>> Erro HTTP do Ollama: {response.status_code} - {response.text}")
+                self.breaker.record_failure()
+                return None
+            answer = response.json().get('response', '')
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f">>> ERRO NO OLLAMA: {e}")
+            self.breaker.record_failure()
+            return None
+        else:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='llm_generation')
+            self.breaker.record_success()
+            return answer
+        finally:
+            self.breaker.release_trial(admission)
+
+    def generate_stream(self, model, prompt, options=None, timeout=None):
+        """Gera a resposta em modo stream, produzindo os tokens conforme chegam.
+
+        Se o Ollama falhar antes do primeiro token o gerador só termina vazio;
+        depois dele, levanta ``StreamInterrupted``.
+        """
+        admission = self.breaker.allow_request() if self.health['available'] else None
+        if not admission:
+            return
+        started = time.perf_counter()
+        try:
+            with self.session.post(
+                f"{self.host}/api/generate", json=self._payload(model, prompt, options, stream=True),
+                timeout=(self.connect_timeout, timeout or self.read_timeout), stream=True,
+            ) as response:
+                if response.status_code != 200:
+                    logger.error(f">>> Erro HTTP do Ollama: {response.status_code} - {response.text}")
+                    self.breaker.record_failure()
+                    return
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get('response'):
+                        if started is not None:
+                            STAGE_SECONDS.observe(time.perf_counter() - started, stage='llm_ttft')
+                            started = None
+                        yield data['response']
+                    if data.get('done'):
+                        break
+                else:
+                    raise ValueError("stream encerrado antes do fim da resposta")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f">>> ERRO NO STREAM DO OLLAMA: {e}")
+            self.breaker.record_failure()
+            if started is None:
+                # Tokens já enviados: o chamador precisa saber que a resposta ficou pela metade
+                raise StreamInterrupted(str(e)) from e
+            return
+        else:
+            self.breaker.record_success()
+        finally:
+            # Stream abandonado pelo consumidor (GeneratorExit) ou erro inesperado
+            self.breaker.release_trial(admission)
+
+    def _get_async_session(self):
+        import asyncio
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            session = aiohttp.ClientSession(connector=connector)
+            self._async_sessions[loop] = session
+        return session
+
+    async def agenerate(self, model, prompt, options=None, timeout=None):
+        """Versão asyncio de ``generate`` (conexões mantidas por event loop)"""
+        import aiohttp
+
+        admission = self.breaker.allow_request() if self.health['available'] else None
+        if not admission:
+            return None
+        session = self._get_async_session()
+        client_timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, total=timeout or self.read_timeout)
+        started = time.perf_counter()
+        try:
+            async with session.post(f"{self.host}/api/generate", json=self._payload(model, prompt, options),
+                                    timeout=client_timeout) as response:
+                if response.status != 200:
+                    logger.error(f">>> Erro HTTP do Ollama: {response.status} - {await response.text()}")
+                    self.breaker.record_failure()
+                    return None
+                answer = (await response.json()).get('response', '')
+        except (aiohttp.ClientError, TimeoutError, ValueError) as e:
+            logger.error(f">>> ERRO NO OLLAMA: {e}")
+            self.breaker.record_failure()
+            return None
+        else:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='llm_generation')
+            self.breaker.record_success()
+            return answer
+        finally:
+            # Cancelamento (CancelledError) ou erro inesperado: não deixa o teste preso
+            self.breaker.release_trial(admission)
+
+    async def agenerate_stream(self, model, prompt, options=None, timeout=None):
+        """Versão asyncio de ``generate_stream`` (gerador assíncrono de tokens)"""
+        import aiohttp
+
+        admission = self.breaker.allow_request() if self.health['available'] else None
+        if not admission:
+            return
+        session = self._get_async_session()
+        client_timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, total=timeout or self.read_timeout)
+        started = time.perf_counter()
+        try:
+            async with session.post(f"{self.host}/api/generate",
+                                    json=self._payload(model, prompt, options, stream=True),
+                                    timeout=client_timeout) as response:
+                if response.status != 200:
+                    logger.error(f">>> Erro HTTP do Ollama: {response.status} - {await response.text()}")
+                    self.breaker.record_failure()
+                    return
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if data.get('response'):
+                        if started is not None:
+                            STAGE_SECONDS.observe(time.perf_counter() - started, stage='llm_ttft')
+                            started = None
+                        yield data['response']
+                    if data.get('done'):
+                        break
+                else:
+                    raise ValueError("stream encerrado antes do fim da resposta")
+        except (aiohttp.ClientError, TimeoutError, ValueError) as e:
+            logger.error(f">>> ERRO NO STREAM DO OLLAMA: {e}")
+            self.breaker.record_failure()
+            if started is None:
+                raise StreamInterrupted(str(e)) from e
+            return
+        else:
+            self.breaker.record_success()
+        finally:
+            self.breaker.release_trial(admission)
+
+    async def aclose(self):
+        """Fecha a sessão aiohttp do event loop atual"""
+        import asyncio
+
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    def after_fork(self):
+        """Recria conexões e a thread de saúde num processo filho (ex.: worker pré-fork).
+
+        Sockets do pool herdados do processo pai não podem ser usados pelos
+        dois processos, e threads não sobrevivem ao ``fork``.
+        """
+        monitor_was_running = self._health_thread is not None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._async_sessions = weakref.WeakKeyDictionary()
+        self._stop = threading.Event()
+        self._health_thread = None
+        if monitor_was_running:
+            self.start_health_monitor()
+
+    def close(self):
+        self.stop_health_monitor()
+        self.session.close()
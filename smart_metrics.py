@@ -0,0 +1,432 @@
+import os
+import json
+import time
+import bisect
+import inspect
+import logging
+import functools
+import threading
+from contextlib import aclosing, contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Limites (s) dos histogramas: de etapas de milissegundos a gerações de 2 minutos
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames) or set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: rótulos esperados {self.labelnames}, recebidos {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """``{valores dos rótulos: valor}`` (cópia)"""
+        with self._lock:
+            return dict(self._values)
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        if amount < 0:
+            raise ValueError("Contadores só aumentam")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Valor instantâneo. ``aggregate`` diz como juntar os processos: ``sum`` ou ``max``
+    (ex.: documentos no índice, que é o mesmo em todos os workers)."""
+
+    TYPE = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), aggregate="sum"):
+        super().__init__(name, documentation, labelnames)
+        self.aggregate = aggregate
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def set_function(self, function):
+        """Lê o valor de ``function()`` na hora da coleta (só para gauges sem rótulos)"""
+        self._function = function
+
+    def samples(self):
+        if self._function is None:
+            return super().samples()
+        try:
+            return {(): float(self._function())}
+        except Exception as e:
+            logger.debug(f"Gauge {self.name} indisponível: {e}")
+            return {}
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Contagem por faixa (a última é +Inf), soma e total
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mede a duração do bloco"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def timed(self, **labels):
+        """Decorador que mede cada chamada de funções, corrotinas e geradores (síncronos ou assíncronos).
+
+        Nos geradores a medida vai da primeira iteração até o fim (ou o abandono) do gerador.
+        """
+        def decorator(func):
+            if inspect.isasyncgenfunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    with self.time(**labels):
+                        async with aclosing(func(*args, **kwargs)) as items:
+                            async for item in items:
+                                yield item
+            elif inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    with self.time(**labels):
+                        return await func(*args, **kwargs)
+            elif inspect.isgeneratorfunction(func):
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    with self.time(**labels):
+                        return (yield from func(*args, **kwargs))
+            else:
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    with self.time(**labels):
+                        return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def samples(self):
+        with self._lock:
+            return {key: [list(counts), total, count] for key, (counts, total, count) in self._values.items()}
+
+
+class MetricsRegistry:
+    """Métricas do processo no formato de exposição do Prometheus.
+
+    Com vários workers (gunicorn), ``enable_multiprocess`` faz cada
+    processo gravar periodicamente suas métricas em ``directory``; a coleta
+    soma as de todos os processos. Contadores e histogramas de processos
+    que já terminaram continuam somando; gauges só contam processos vivos.
+
+    Cada processo grava em ``<pid>-<id aleatório>.json``: um PID reutilizado
+    gera outro arquivo em vez de sobrescrever o do processo morto. Os
+    arquivos de processos mortos são somados a ``AGGREGATE_FILE`` e
+    apagados a cada ``flush``.
+    """
+
+    AGGREGATE_FILE = "aggregate.json"
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.directory = None
+        self.flush_interval = 5.0
+        self._flush_thread = None
+        self._worker_pid = None
+        self._worker_file = None
+
+    def _register(self, cls, name, documentation, labelnames=(), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Métrica {name} já registrada com outro tipo ou rótulos")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=(), aggregate="sum"):
+        return self._register(Gauge, name, documentation, labelnames, aggregate=aggregate)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def snapshot(self):
+        """Estado serializável das métricas deste processo"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        data = {}
+        for metric in metrics:
+            entry = {'type': metric.TYPE, 'help': metric.documentation, 'labelnames': list(metric.labelnames),
+                     'samples': [[list(key), value] for key, value in metric.samples().items()]}
+            if isinstance(metric, Histogram):
+                entry['buckets'] = list(metric.buckets)
+            elif isinstance(metric, Gauge):
+                entry['aggregate'] = metric.aggregate
+            data[metric.name] = entry
+        return data
+
+    # ---- Vários processos --------------------------------------------------
+
+    def enable_multiprocess(self, directory, flush_interval=5.0):
+        """Grava as métricas deste processo em ``directory`` a cada ``flush_interval`` s"""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        if self._flush_thread is None or not self._flush_thread.is_alive():
+            def run():
+                while True:
+                    time.sleep(self.flush_interval)
+                    self.flush()
+
+            self._flush_thread = threading.Thread(target=run, name="docia-metrics-flush", daemon=True)
+            self._flush_thread.start()
+
+    def worker_file(self):
+        """Nome do arquivo deste processo (id novo a cada processo, inclusive após ``fork``)"""
+        if self._worker_pid != os.getpid():
+            self._worker_pid = os.getpid()
+            self._worker_file = f"{self._worker_pid}-{os.urandom(4).hex()}.json"
+        return self._worker_file
+
+    def flush(self):
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, self.worker_file())
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar as métricas em {path}: {e}")
+        self.fold_dead_workers()
+
+    def _worker_files(self):
+        """``{nome: vivo}`` dos arquivos de outros processos.
+
+        Vivo: o PID existe e o arquivo é o mais recente desse PID (os mais
+        antigos são de processos mortos cujo PID foi reutilizado).
+        """
+        if not self.directory or not os.path.isdir(self.directory):
+            return {}
+        newest = {}
+        files = []
+        for name in os.listdir(self.directory):
+            pid_text, ext = os.path.splitext(name)
+            pid_text = pid_text.split('-', 1)[0]
+            if ext != '.json' or not pid_text.isdigit() or name == self.worker_file():
+                continue
+            try:
+                mtime = os.stat(os.path.join(self.directory, name)).st_mtime
+            except OSError:
+                continue
+            pid = int(pid_text)
+            files.append((name, pid))
+            if pid not in newest or mtime > newest[pid][0]:
+                newest[pid] = (mtime, name)
+        return {name: _pid_alive(pid) and newest[pid][1] == name for name, pid in files}
+
+    def _read(self, name):
+        try:
+            with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _other_snapshots(self):
+        """``(nome, snapshot, vivo)`` dos outros processos, mais o agregado dos que terminaram"""
+        snapshots = []
+        for name, alive in self._worker_files().items():
+            snapshot = self._read(name)
+            if snapshot is not None:
+                snapshots.append((name, snapshot, alive))
+        aggregate = self._read(self.AGGREGATE_FILE) if self.directory else None
+        if aggregate is not None:
+            snapshots.append((self.AGGREGATE_FILE, aggregate['metrics'], False))
+        return snapshots
+
+    def fold_dead_workers(self):
+        """Soma contadores e histogramas dos processos mortos ao agregado e apaga seus arquivos.
+
+        Feito sob um ``flock``; os nomes já somados ficam registrados no
+        agregado, então um arquivo que não chegou a ser apagado não é
+        somado duas vezes.
+        """
+        dead = [name for name, alive in self._worker_files().items() if not alive]
+        if not dead:
+            return
+        import fcntl
+
+        try:
+            fd = os.open(os.path.join(self.directory, "aggregate.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            logger.warning(f"Não foi possível agregar as métricas de processos encerrados: {e}")
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            aggregate = self._read(self.AGGREGATE_FILE) or {'folded': [], 'metrics': {}}
+            existing = set(os.listdir(self.directory))
+            folded = {name for name in aggregate['folded'] if name in existing}
+            for name in dead:
+                if name in folded or name not in existing:
+                    continue
+                snapshot = self._read(name)
+                if snapshot is not None:
+                    _merge(aggregate['metrics'], snapshot, gauges=False)
+                folded.add(name)
+            aggregate['folded'] = sorted(folded)
+            path = os.path.join(self.directory, self.AGGREGATE_FILE)
+            with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump(aggregate, f)
+            os.replace(f"{path}.tmp", path)
+            for name in dead:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        except OSError as e:
+            logger.warning(f"Não foi possível agregar as métricas de processos encerrados: {e}")
+        finally:
+            os.close(fd)  # Fechar o descritor libera o flock
+
+    def collect(self):
+        """Métricas deste processo somadas às dos demais (modo multiprocesso)"""
+        merged = self.snapshot()
+        for _name, snapshot, alive in self._other_snapshots():
+            _merge(merged, snapshot, gauges=alive)
+        return merged
+
+    def render(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)"""
+        lines = []
+        for name, entry in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {_escape_help(entry['help'])}")
+            lines.append(f"# TYPE {name} {entry['type']}")
+            labelnames = entry['labelnames']
+            for key, value in sorted(entry['samples']):
+                if entry['type'] != 'histogram':
+                    lines.append(f"{name}{_labels(labelnames, key)} {_number(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(entry['buckets'] + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    le = bound if bound == '+Inf' else _number(bound)
+                    lines.append(f"{name}_bucket{_labels(labelnames, key, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labelnames, key)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labelnames, key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge(merged, snapshot, gauges=True):
+    """Soma ``snapshot`` a ``merged`` (gauges ``max`` pelo máximo; sem gauges se ``gauges=False``)"""
+    for name, entry in snapshot.items():
+        if entry['type'] == 'gauge' and not gauges:
+            continue
+        target = merged.setdefault(name, dict(entry, samples=[]))
+        if target['type'] != entry['type'] or target.get('buckets') != entry.get('buckets'):
+            continue
+        by_key = {tuple(key): value for key, value in target['samples']}
+        combine = max if entry.get('aggregate') == 'max' else _add
+        for key, value in entry['samples']:
+            key = tuple(key)
+            by_key[key] = combine(by_key[key], value) if key in by_key else value
+        target['samples'] = [[list(key), value] for key, value in by_key.items()]
+
+
+def _add(left, right):
+    if isinstance(left, list):
+        return [[a + b for a, b in zip(left[0], right[0])], left[1] + right[1], left[2] + right[2]]
+    return left + right
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape_help(text):
+    return text.replace('\\', r'\\').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+REGISTRY = MetricsRegistry()
+
+# Métricas do caminho de busca e indexação
+STAGE_SECONDS = REGISTRY.histogram(
+    "doc_ia_stage_duration_seconds",
+    "Duração de cada etapa: extract, chunk, vectorize, retrieve, prompt_build, llm_ttft, llm_generation, total",
+    ("stage",))
+LLM_RETRIES = REGISTRY.counter("doc_ia_llm_retries_total", "Novas tentativas de geração no Ollama")
+LLM_FALLBACKS = REGISTRY.counter("doc_ia_llm_fallbacks_total",
+                                 "Respostas dadas por um backend de fallback em vez do Ollama", ("backend",))
+LLM_ERRORS = REGISTRY.counter("doc_ia_llm_errors_total", "Gerações do Ollama que falharam")
+GENERATION_REJECTIONS = REGISTRY.counter("doc_ia_generation_rejections_total",
+                                         "Gerações recusadas pelo controle de admissão (queue_full, deadline)",
+                                         ("reason",))
+GENERATION_QUEUE_SECONDS = REGISTRY.histogram("doc_ia_generation_queue_wait_seconds",
+                                              "Espera na fila por uma vaga de geração")
+CACHE_HITS = REGISTRY.counter("doc_ia_cache_hits_total", "Acertos nos caches", ("cache",))
+CACHE_MISSES = REGISTRY.counter("doc_ia_cache_misses_total", "Faltas nos caches", ("cache",))
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "Requisições HTTP atendidas",
+                                 ("method", "endpoint", "status"))
+HTTP_SECONDS = REGISTRY.histogram("http_request_duration_seconds", "Duração das requisições HTTP",
+                                  ("method", "endpoint"))
+
+
+def configure_from_env():
+    """Ativa o modo multiprocesso se ``DOCIA_METRICS_DIR`` estiver definido"""
+    directory = os.getenv("DOCIA_METRICS_DIR")
+    if directory:
+        REGISTRY.enable_multiprocess(directory, float(os.getenv("DOCIA_METRICS_FLUSH_INTERVAL", "5")))
@@ -0,0 +1,249 @@
+import os
+import re
+import fnmatch
+import logging
+import zipfile
+from html.parser import HTMLParser
+from xml.etree import ElementTree
+
+logger = logging.getLogger(__name__)
+
+# Classes de custo: formatos caros (ex.: PDF) são extraídos num pool separado
+CHEAP, EXPENSIVE = "cheap", "expensive"
+
+# Arquivos ignorados por padrão: ocultos e travas temporárias do Office/LibreOffice
+DEFAULT_EXCLUDE = (".*", "~$*", ".~lock.*")
+
+
+class ReaderSpec:
+    """Leitor registrado para uma ou mais extensões"""
+
+    __slots__ = ('name', 'read', 'cost', 'paged', 'pages')
+
+    def __init__(self, name, read, cost=CHEAP, paged=False, pages=None):
+        self.name = name
+        self.read = read
+        self.cost = cost
+        # Leitores paginados recebem (file_hash, page_cache) para o cache de páginas
+        self.paged = paged
+        # ``pages(file_path, file_hash, page_cache)``: gera o texto de cada página
+        # (``None`` para uma página que falhou), para chunkar sem montar o documento
+        self.pages = pages
+
+
+_READERS = {}
+
+
+def register_reader(extensions, read, cost=CHEAP, paged=False, name=None, pages=None):
+    """Registra ``read(file_path)`` para as extensões informadas (ex.: ``(".md",)``).
+
+    Um registro posterior para a mesma extensão substitui o anterior.
+    """
+    spec = ReaderSpec(name or getattr(read, '__name__', 'reader'), read, cost, paged, pages)
+    for extension in extensions:
+        _READERS[extension.lower()] = spec
+    return spec
+
+
+def get_reader(file_path):
+    """Leitor para o arquivo (pela extensão) ou ``None`` se o formato não é suportado"""
+    return _READERS.get(os.path.splitext(file_path)[1].lower())
+
+
+def supported_extensions():
+    return sorted(_READERS)
+
+
+def _matches(rel_path, name, patterns):
+    return any(fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def walk_documents(root, include=None, exclude=DEFAULT_EXCLUDE):
+    """Percorre ``root`` recursivamente com ``os.scandir``, gerando ``(caminho_relativo, caminho)``.
+
+    Só aparecem arquivos com leitor registrado. ``include`` e ``exclude``
+    são globs comparados com o caminho relativo (com ``/``) e com o nome;
+    um diretório excluído não é percorrido. Em cada diretório os arquivos
+    vêm em ordem alfabética, antes das subpastas.
+    """
+    stack = [("", root)]
+    while stack:
+        rel_dir, directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            logger.error(f"Erro ao listar {directory}: {e}")
+            continue
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if exclude and _matches(rel_path, entry.name, exclude):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append((rel_path, entry.path))
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if get_reader(entry.name) is None:
+                continue
+            if include and not _matches(rel_path, entry.name, include):
+                continue
+            yield rel_path, entry.path
+        stack.extend(reversed(subdirs))
+
+
+def globs_from_env(name, default=()):
+    """Lista de globs de uma variável de ambiente separada por vírgulas"""
+    value = os.getenv(name)
+    if value is None:
+        return tuple(default)
+    return tuple(pattern.strip() for pattern in value.split(',') if pattern.strip())
+
+
+# ---- Leitores de formatos adicionais --------------------------------------
+
+def read_markdown(file_path):
+    """Markdown como texto: remove marcações de título, ênfase, links e código"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except Exception as e:
+        logger.error(f"Erro ao ler Markdown {file_path}: {e}")
+        return ""
+    text = re.sub(r"^```.*?$", "", text, flags=re.MULTILINE)
+    text = re.sub(r"!\[([^\]]*)\]\([^)]*\)", r"\1", text)
+    text = re.sub(r"\[([^\]]+)\]\([^)]*\)", r"\1", text)
+    text = re.sub(r"^\s{0,3}(#{1,6}|>|[-*+]|\d+\.)\s+", "", text, flags=re.MULTILINE)
+    return re.sub(r"(\*\*|__|\*|_|`)(\S.*?\S|\S)\1", r"\2", text)
+
+
+class _HTMLText(HTMLParser):
+    BLOCKS = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'section', 'article', 'table'}
+    SKIP = {'script', 'style', 'head', 'noscript'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag in self.BLOCKS:
+            self.parts.append("\n\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif tag in self.BLOCKS:
+            self.parts.append("\n\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def read_html(file_path):
+    """Texto visível do HTML, com blocos (parágrafos, títulos, itens) separados por linha em branco"""
+    try:
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            parser = _HTMLText()
+            parser.feed(f.read())
+            parser.close()
+    except Exception as e:
+        logger.error(f"Erro ao ler HTML {file_path}: {e}")
+        return ""
+    text = re.sub(r"[ \t\r\f\v]+", " ", "".join(parser.parts))
+    return re.sub(r"\s*\n\s*\n\s*", "\n\n", text).strip()
+
+
+_ODT_TEXT = "{urn:oasis:names:tc:opendocument:xmlns:text:1.0}"
+
+
+def read_odt(file_path):
+    """Parágrafos e títulos de um documento OpenDocument (content.xml)"""
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            root = ElementTree.fromstring(archive.read('content.xml'))
+    except Exception as e:
+        logger.error(f"Erro ao ler ODT {file_path}: {e}")
+        return ""
+    paragraphs = []
+    for element in root.iter():
+        if element.tag in (_ODT_TEXT + 'p', _ODT_TEXT + 'h'):
+            paragraphs.append("".join(_odt_text(element)))
+    return "\n\n".join(p for p in paragraphs if p.strip())
+
+
+def _odt_text(element):
+    if element.text:
+        yield element.text
+    for child in element:
+        if child.tag == _ODT_TEXT + 's':
+            yield " " * int(child.get(_ODT_TEXT + 'c', '1'))
+        elif child.tag in (_ODT_TEXT + 'tab', _ODT_TEXT + 'line-break'):
+            yield " "
+        elif child.tag not in (_ODT_TEXT + 'p', _ODT_TEXT + 'h'):
+            yield from _odt_text(child)
+        if child.tail:
+            yield child.tail
+
+
+_RTF_DESTINATIONS = {'fonttbl', 'colortbl', 'stylesheet', 'info', 'pict', 'header', 'footer', 'object', 'themedata'}
+_RTF_TOKEN = re.compile(r"\\([a-z]+)(-?\d+)? ?|\\'([0-9a-f]{2})|\\(.)|([{}])|([^\\{}]+)", re.IGNORECASE | re.DOTALL)
+
+
+def read_rtf(file_path):
+    """Texto de um RTF: ignora tabelas de fonte/cor e grupos ``\\*``, converte ``\\par`` em parágrafo"""
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read().decode('latin-1')
+    except Exception as e:
+        logger.error(f"Erro ao ler RTF {file_path}: {e}")
+        return ""
+    out, stack, skip, fallback = [], [], False, 0
+    for word, arg, hex_char, symbol, brace, text in _RTF_TOKEN.findall(data):
+        if brace == '{':
+            stack.append(skip)
+        elif brace == '}':
+            skip = stack.pop() if stack else False
+        elif skip:
+            continue
+        elif word:
+            if word in _RTF_DESTINATIONS:
+                skip = True
+            elif word == 'par':
+                out.append("\n\n")
+            elif word in ('line', 'tab'):
+                out.append(" ")
+            elif word == 'u' and arg:
+                # Caractere Unicode seguido de um caractere substituto, que é descartado
+                out.append(chr(int(arg) % 65536))
+                fallback = 1
+        elif hex_char:
+            if fallback:
+                fallback = 0
+                continue
+            out.append(bytes([int(hex_char, 16)]).decode('cp1252', errors='replace'))
+        elif symbol:
+            if symbol == '*':
+                skip = True
+            elif symbol in '\\{}':
+                out.append(symbol)
+            elif symbol == '~':
+                out.append(" ")
+        elif text:
+            text = text.replace("\r", "").replace("\n", "")
+            out.append(text[fallback:])
+            fallback = 0
+    return re.sub(r"\n\s*\n\s*", "\n\n", "".join(out)).strip()
+
+
+register_reader((".md", ".markdown"), read_markdown)
+register_reader((".html", ".htm"), read_html)
+register_reader((".odt",), read_odt)
+register_reader((".rtf",), read_rtf)
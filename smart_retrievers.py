@@ -0,0 +1,387 @@
+import os
+import re
+import json
+import logging
+from array import array
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+class TransformersEmbedder:
+    """Embeddings de sentenças em CPU com ``transformers`` (mean pooling + norma L2).
+
+    O modelo é carregado só na primeira chamada e, por padrão, apenas do
+    cache local (``local_files_only``), para que a indexação nunca dependa
+    de rede. Baixe o modelo uma vez para ``TRANSFORMERS_CACHE`` antes de
+    ativar o retriever denso.
+    """
+
+    def __init__(self, model_name, batch_size=32, max_length=256, local_files_only=True):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.local_files_only = local_files_only
+        self._tokenizer = None
+        self._model = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv("DOCIA_EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL),
+            batch_size=int(os.getenv("DOCIA_EMBEDDING_BATCH", "32")),
+            local_files_only=os.getenv("DOCIA_EMBEDDING_OFFLINE", "1") == "1",
+        )
+
+    def _load(self):
+        if self._model is None:
+            from transformers import AutoModel, AutoTokenizer
+
+            logger.info(f"Carregando modelo de embeddings: {self.model_name}")
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name, local_files_only=self.local_files_only)
+            self._model = AutoModel.from_pretrained(self.model_name, local_files_only=self.local_files_only)
+            self._model.eval()
+
+    def __call__(self, texts):
+        """Retorna uma matriz float32 (len(texts) x dim) com linhas normalizadas"""
+        import torch
+
+        self._load()
+        batches = []
+        with torch.no_grad():
+            for start in range(0, len(texts), self.batch_size):
+                encoded = self._tokenizer(list(texts[start:start + self.batch_size]), padding=True, truncation=True,
+                                          max_length=self.max_length, return_tensors='pt')
+                output = self._model(**encoded).last_hidden_state
+                mask = encoded['attention_mask'].unsqueeze(-1).to(output.dtype)
+                pooled = (output * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                batches.append(pooled.cpu().numpy())
+        return _normalize_rows(np.concatenate(batches)) if batches else np.empty((0, 0), dtype=np.float32)
+
+
+class DenseIndex:
+    """Índice ANN (IVF) sobre embeddings normalizados, guardados em int8 ou float16.
+
+    Os vetores são agrupados por k-means esférico em ``nlist`` listas; a
+    busca compara a pergunta com os centróides, visita as ``nprobe`` listas
+    mais próximas e calcula o cosseno exato só dos vetores dessas listas.
+    Com poucos vetores (``nlist == 1``) a busca é exaustiva. Tudo em numpy,
+    sem rede nem dependências extras.
+    """
+
+    ARRAYS = ('codes', 'scales', 'centroids', 'order', 'list_offsets')
+
+    def __init__(self, codes, scales, centroids, order, list_offsets, dtype='int8', nprobe=8):
+        self.codes = codes
+        self.scales = scales
+        self.centroids = centroids
+        self.order = order
+        self.list_offsets = list_offsets
+        self.dtype = dtype
+        self.nprobe = nprobe
+
+    @property
+    def size(self):
+        return len(self.codes)
+
+    @classmethod
+    def build(cls, vectors, dtype='int8', nlist=None, nprobe=8, iterations=10, seed=0):
+        """Constrói o índice a partir de vetores (n x dim)"""
+        vectors = _normalize_rows(vectors)
+        n = len(vectors)
+        if nlist is None:
+            nlist = 1 if n < 1024 else int(np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        centroids = cls._kmeans(vectors, nlist, iterations, seed)
+        assignments = np.argmax(vectors @ centroids.T, axis=1) if n else np.empty(0, dtype=np.int64)
+        order = np.argsort(assignments, kind='stable').astype(np.int32)
+        counts = np.bincount(assignments, minlength=nlist)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        codes, scales = cls._quantize(vectors[order], dtype)
+        return cls(codes, scales, centroids.astype(np.float32), order, list_offsets, dtype=dtype, nprobe=nprobe)
+
+    @staticmethod
+    def _kmeans(vectors, nlist, iterations, seed):
+        if nlist == 1 or len(vectors) == 0:
+            dim = vectors.shape[1] if vectors.ndim == 2 else 0
+            return _normalize_rows(vectors.mean(axis=0, keepdims=True)) if len(vectors) else np.zeros((1, dim), np.float32)
+        rng = np.random.default_rng(seed)
+        sample = vectors if len(vectors) <= 50 * nlist else vectors[rng.choice(len(vectors), 50 * nlist, replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignments == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize_rows(centroids)
+        return centroids
+
+    @staticmethod
+    def _quantize(vectors, dtype):
+        if dtype == 'float16':
+            return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.empty(0, np.float32)
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def search(self, queries, k, nprobe=None):
+        """Para cada pergunta, retorna ``(ids, scores)`` dos ``k`` vizinhos mais próximos"""
+        queries = _normalize_rows(queries)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        results = []
+        for query in queries:
+            if self.size == 0:
+                results.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+                continue
+            centroid_scores = self.centroids @ query
+            lists = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe] if nprobe < len(self.centroids) else range(len(self.centroids))
+            positions = np.concatenate([np.arange(self.list_offsets[c], self.list_offsets[c + 1]) for c in lists])
+            scores = (self.codes[positions].astype(np.float32) @ query) * self.scales[positions]
+            top = min(k, len(positions))
+            best = np.argpartition(-scores, top - 1)[:top] if top else np.empty(0, dtype=np.int64)
+            best = best[np.argsort(-scores[best], kind='stable')]
+            results.append((self.order[positions[best]].astype(np.int64), scores[best]))
+        return results
+
+    def save(self, prefix, meta):
+        """Grava os arrays em ``<prefix>.<nome>.npy`` e os metadados em ``<prefix>.json``"""
+        for name in self.ARRAYS:
+            with open(f"{prefix}.{name}.npy.tmp", 'wb') as f:
+                np.save(f, getattr(self, name))
+            os.replace(f"{prefix}.{name}.npy.tmp", f"{prefix}.{name}.npy")
+        with open(f"{prefix}.json.tmp", 'w', encoding='utf-8') as f:
+            json.dump(dict(meta, dtype=self.dtype, nprobe=self.nprobe), f)
+        os.replace(f"{prefix}.json.tmp", f"{prefix}.json")
+
+    @classmethod
+    def load(cls, prefix):
+        """Abre um índice gravado por ``save`` (arrays com memory-map); retorna ``(índice, metadados)``"""
+        with open(f"{prefix}.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(f"{prefix}.{name}.npy", mmap_mode='r') for name in cls.ARRAYS}
+        return cls(dtype=meta['dtype'], nprobe=meta['nprobe'], **arrays), meta
+
+
+_BM25_TOKEN_RE = re.compile(r"r\$|\d+(?:[.,]\d+)*|\w+")
+
+
+class BM25Index:
+    """Índice invertido com ranking BM25, atualizável sem reprocessar o corpus.
+
+    Cada chunk é identificado por uma chave estável (hash do documento +
+    posição) e ocupa um *slot*. As postings ficam numa base compacta em
+    arrays (a que é gravada e aberta com memory-map) mais um delta em
+    listas Python para os chunks adicionados depois. ``add`` e ``remove``
+    alteram o índice, então quem publica um snapshot novo atualiza uma
+    ``copy`` (que compartilha a base, só leitura) e o snapshot antigo
+    continua com o seu. ``compacted`` gera um índice novo sem os removidos.
+    O tokenizador preserva números e valores como ``R$ 1.000,00``, que nas
+    atas importam tanto quanto o significado.
+    """
+
+    ARRAYS = ('offsets', 'slots', 'tfs', 'doc_len', 'alive')
+
+    def __init__(self, k1=1.5, b=0.75, stop_words=()):
+        self.k1 = k1
+        self.b = b
+        self.stop_words = frozenset(stop_words)
+        self.keys = []
+        self.slot_of = {}
+        self.doc_len = array('i')
+        self.alive = bytearray()
+        self.total_len = 0
+        self.n_alive = 0
+        self._base_terms = {}
+        self._base_offsets = np.zeros(1, dtype=np.int64)
+        self._base_slots = np.empty(0, dtype=np.int32)
+        self._base_tfs = np.empty(0, dtype=np.int32)
+        self._delta = {}
+
+    @property
+    def n_slots(self):
+        return len(self.keys)
+
+    @property
+    def dead_ratio(self):
+        return 1 - self.n_alive / self.n_slots if self.n_slots else 0.0
+
+    def tokenize(self, text):
+        return [t for t in _BM25_TOKEN_RE.findall(text.lower()) if t not in self.stop_words]
+
+    def add(self, key, text):
+        """Indexa um chunk; chaves já presentes são ignoradas"""
+        if key in self.slot_of and self.alive[self.slot_of[key]]:
+            return self.slot_of[key]
+        slot = len(self.keys)
+        tokens = self.tokenize(text)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, tf in counts.items():
+            slots, tfs = self._delta.setdefault(term, (array('i'), array('i')))
+            slots.append(slot)
+            tfs.append(tf)
+        self.keys.append(key)
+        self.slot_of[key] = slot
+        self.doc_len.append(len(tokens))
+        self.alive.append(1)
+        self.total_len += len(tokens)
+        self.n_alive += 1
+        return slot
+
+    def remove(self, key):
+        slot = self.slot_of.pop(key, None)
+        if slot is not None and self.alive[slot]:
+            self.alive[slot] = 0
+            self.total_len -= self.doc_len[slot]
+            self.n_alive -= 1
+
+    def _postings(self, term):
+        parts_slots, parts_tfs = [], []
+        idx = self._base_terms.get(term)
+        if idx is not None:
+            start, end = self._base_offsets[idx], self._base_offsets[idx + 1]
+            parts_slots.append(self._base_slots[start:end])
+            parts_tfs.append(self._base_tfs[start:end])
+        if term in self._delta:
+            slots, tfs = self._delta[term]
+            # Cópias (``[:]``): um ``add`` concorrente não pode redimensionar um buffer exportado
+            parts_slots.append(np.frombuffer(slots[:], dtype=np.int32) if len(slots) else np.empty(0, np.int32))
+            parts_tfs.append(np.frombuffer(tfs[:], dtype=np.int32) if len(tfs) else np.empty(0, np.int32))
+        if not parts_slots:
+            return None, None
+        return np.concatenate(parts_slots), np.concatenate(parts_tfs)
+
+    def scores(self, query):
+        """Scores BM25 de todos os slots (slots removidos ficam com 0)"""
+        n_slots = self.n_slots
+        scores = np.zeros(n_slots, dtype=np.float32)
+        if not self.n_alive:
+            return scores
+        alive = np.frombuffer(bytes(self.alive), dtype=np.uint8)[:n_slots].astype(bool)
+        doc_len = np.frombuffer(self.doc_len[:n_slots], dtype=np.int32).astype(np.float32)
+        avgdl = self.total_len / self.n_alive or 1.0
+        for term in set(self.tokenize(query)):
+            slots, tfs = self._postings(term)
+            if slots is None:
+                continue
+            slots, tfs = slots[slots < n_slots], tfs[slots < n_slots]
+            live = alive[slots]
+            slots, tfs = slots[live], tfs[live].astype(np.float32)
+            if not len(slots):
+                continue
+            df = len(slots)
+            idf = np.log(1 + (self.n_alive - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_len[slots] / avgdl)
+            np.add.at(scores, slots, idf * tfs * (self.k1 + 1) / (tfs + norm))
+        return scores
+
+    def _flatten(self, renumber):
+        """Postings de base + delta em arrays contíguos (sem alterar o índice)"""
+        alive = np.frombuffer(bytes(self.alive), dtype=np.uint8).astype(bool)
+        if renumber:
+            remap = np.full(self.n_slots, -1, dtype=np.int64)
+            remap[alive] = np.arange(int(alive.sum()))
+        terms, offsets, all_slots, all_tfs = [], [0], [], []
+        for term in sorted(set(self._base_terms) | set(self._delta)):
+            slots, tfs = self._postings(term)
+            if renumber:
+                keep = remap[slots] >= 0
+                slots, tfs = remap[slots[keep]], tfs[keep]
+            if not len(slots):
+                continue
+            terms.append(term)
+            all_slots.append(np.asarray(slots, dtype=np.int32))
+            all_tfs.append(np.asarray(tfs, dtype=np.int32))
+            offsets.append(offsets[-1] + len(slots))
+        doc_len = np.frombuffer(self.doc_len[:], dtype=np.int32)
+        keys = self.keys
+        if renumber:
+            doc_len, keys, alive = doc_len[alive], [k for k, live in zip(keys, alive) if live], alive[alive]
+        return {
+            'terms': terms, 'keys': list(keys),
+            'offsets': np.asarray(offsets, dtype=np.int64),
+            'slots': np.concatenate(all_slots) if all_slots else np.empty(0, dtype=np.int32),
+            'tfs': np.concatenate(all_tfs) if all_tfs else np.empty(0, dtype=np.int32),
+            'doc_len': np.array(doc_len, dtype=np.int32),
+            'alive': alive.astype(np.uint8),
+        }
+
+    @classmethod
+    def _from_arrays(cls, data, k1, b, stop_words):
+        index = cls(k1=k1, b=b, stop_words=stop_words)
+        alive = np.asarray(data['alive']).astype(bool)
+        index.keys = list(data['keys'])
+        index.slot_of = {key: slot for slot, key in enumerate(index.keys) if alive[slot]}
+        index.doc_len = array('i', np.asarray(data['doc_len']).tolist())
+        index.alive = bytearray(alive.astype(np.uint8).tobytes())
+        index.n_alive = int(alive.sum())
+        index.total_len = int(np.asarray(data['doc_len'])[alive].sum())
+        index._base_terms = {term: i for i, term in enumerate(data['terms'])}
+        index._base_offsets = data['offsets']
+        index._base_slots = data['slots']
+        index._base_tfs = data['tfs']
+        return index
+
+    def copy(self):
+        """Índice independente para atualizar: a base é compartilhada, o resto é copiado"""
+        index = BM25Index(k1=self.k1, b=self.b, stop_words=self.stop_words)
+        index.keys = list(self.keys)
+        index.slot_of = dict(self.slot_of)
+        index.doc_len = array('i', self.doc_len)
+        index.alive = bytearray(self.alive)
+        index.total_len = self.total_len
+        index.n_alive = self.n_alive
+        index._base_terms = self._base_terms
+        index._base_offsets = self._base_offsets
+        index._base_slots = self._base_slots
+        index._base_tfs = self._base_tfs
+        index._delta = {term: (array('i', slots), array('i', tfs)) for term, (slots, tfs) in self._delta.items()}
+        return index
+
+    def compacted(self):
+        """Novo índice sem os slots removidos (o atual continua válido para quem o usa)"""
+        return self._from_arrays(self._flatten(renumber=True), self.k1, self.b, self.stop_words)
+
+    def save(self, prefix, meta):
+        """Grava em ``<prefix>.<nome>.npy`` + ``<prefix>.json`` (delta incluído na base)"""
+        data = self._flatten(renumber=False)
+        for name in self.ARRAYS:
+            with open(f"{prefix}.{name}.npy.tmp", 'wb') as f:
+                np.save(f, data[name])
+            os.replace(f"{prefix}.{name}.npy.tmp", f"{prefix}.{name}.npy")
+        with open(f"{prefix}.json.tmp", 'w', encoding='utf-8') as f:
+            json.dump(dict(meta, k1=self.k1, b=self.b, keys=data['keys'], terms=data['terms']), f, ensure_ascii=False)
+        os.replace(f"{prefix}.json.tmp", f"{prefix}.json")
+
+    @classmethod
+    def load(cls, prefix, stop_words=()):
+        """Abre um índice gravado por ``save`` (postings com memory-map)"""
+        with open(f"{prefix}.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        data = {name: np.load(f"{prefix}.{name}.npy", mmap_mode='r') for name in cls.ARRAYS}
+        data.update(keys=meta['keys'], terms=meta['terms'])
+        return cls._from_arrays(data, meta['k1'], meta['b'], stop_words), meta
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Funde listas ranqueadas de ids: score = soma de 1 / (k + posição)"""
+    fused = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank + 1)
+    ordered = sorted(fused.items(), key=lambda pair: pair[1], reverse=True)
+    return [item for item, _ in ordered], [score for _, score in ordered]
@@ -0,0 +1,236 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ReindexScheduler:
+    """Agenda reindexações com debounce e coalescência de eventos.
+
+    Cada evento do sistema de arquivos só acrescenta o caminho tocado a um
+    único job pendente. O job roda quando os eventos param de chegar por
+    ``debounce`` segundos (ou, numa rajada contínua, após ``max_delay``
+    segundos desde o primeiro evento). Há no máximo uma reindexação em
+    andamento; eventos que chegam durante ela formam o próximo job.
+
+    ``build`` recebe ``(touched_paths, full)``: o conjunto de caminhos
+    tocados (``None`` quando não se sabe quais mudaram) e se a
+    reindexação deve ser completa.
+    """
+
+    def __init__(self, build, debounce=2.0, max_delay=30.0):
+        self.build = build
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._paths = set()
+        self._pending = False
+        self._scan_all = False
+        self._full = False
+        self._first_event = None
+        self._last_event = None
+        self._building = False
+        self._thread = None
+        self.events_total = 0
+        self.builds_total = 0
+        self.last_build_duration = None
+        self.last_build_at = None
+        self.last_error = None
+
+    @classmethod
+    def from_env(cls, build):
+        return cls(build, debounce=float(os.getenv("DOCIA_REINDEX_DEBOUNCE", "2")),
+                   max_delay=float(os.getenv("DOCIA_REINDEX_MAX_DELAY", "30")))
+
+    def notify(self, path):
+        """Registra um arquivo alterado (chamado pelo watcher)"""
+        with self._cond:
+            self.events_total += 1
+            self._paths.add(os.path.abspath(path))
+            self._schedule(time.monotonic())
+
+    def request_reindex(self, full=False):
+        """Pede uma reindexação imediata de todo o diretório (ex.: endpoint /index)"""
+        with self._cond:
+            self._scan_all = True
+            self._full = self._full or full
+            # Sem debounce: o job fica elegível agora
+            now = time.monotonic() - self.debounce
+            self._schedule(now)
+
+    def _schedule(self, now):
+        if not self._pending:
+            self._first_event = now
+        self._pending = True
+        self._last_event = now
+        self._ensure_worker()
+        self._cond.notify_all()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="docia-reindex", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                while True:
+                    now = time.monotonic()
+                    ready_at = min(self._last_event + self.debounce, self._first_event + self.max_delay)
+                    if now >= ready_at:
+                        break
+                    self._cond.wait(ready_at - now)
+                paths = None if self._scan_all else set(self._paths)
+                full = self._full
+                self._paths, self._pending, self._scan_all, self._full = set(), False, False, False
+                self._building = True
+
+            started = time.monotonic()
+            described = "diretório completo" if paths is None else f"{len(paths)} arquivos alterados"
+            logger.info(f"Reindexação agendada iniciada ({described}).")
+            try:
+                self.build(paths, full)
+                self.last_error = None
+            except Exception as e:
+                logger.error(f"Erro na reindexação agendada: {e}")
+                self.last_error = str(e)
+            with self._cond:
+                self._building = False
+                self.builds_total += 1
+                self.last_build_duration = time.monotonic() - started
+                self.last_build_at = time.time()
+                self._cond.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """Espera até não haver job pendente nem em andamento"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._building:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self):
+        with self._cond:
+            return {
+                'queue_depth': len(self._paths) + int(self._scan_all) if self._pending else 0,
+                'pending': self._pending,
+                'building': self._building,
+                'events_total': self.events_total,
+                'builds_total': self.builds_total,
+                'last_build_duration': self.last_build_duration,
+                'last_build_at': self.last_build_at,
+                'last_error': self.last_error,
+            }
+
+
+class LeaderElection:
+    """Elege um único processo entre os workers por meio de um ``flock`` exclusivo.
+
+    O lock é liberado pelo sistema operacional quando o processo morre;
+    os demais tentam de novo a cada ``retry_interval`` segundos e um deles
+    assume o papel de líder.
+    """
+
+    def __init__(self, lock_path, retry_interval=5.0):
+        self.lock_path = lock_path
+        self.retry_interval = retry_interval
+        self.is_leader = False
+        self._fd = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def try_acquire(self):
+        import fcntl
+
+        if self.is_leader:
+            return True
+        if self._fd is None:
+            self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        os.ftruncate(self._fd, 0)
+        os.write(self._fd, str(os.getpid()).encode())
+        self.is_leader = True
+        return True
+
+    def start(self, on_elected):
+        """Tenta a eleição em segundo plano até conseguir; então chama ``on_elected``"""
+        def run():
+            while not self._stop.is_set():
+                if self.try_acquire():
+                    on_elected()
+                    return
+                self._stop.wait(self.retry_interval)
+
+        self._thread = threading.Thread(target=run, name="docia-leader-election", daemon=True)
+        self._thread.start()
+
+    def release(self):
+        self._stop.set()
+        if self._fd is not None:
+            os.close(self._fd)  # Fechar o descritor libera o flock
+            self._fd = None
+        self.is_leader = False
+
+
+class FileWatch:
+    """Chama ``callback`` quando o mtime de um arquivo muda (verificado a cada ``interval`` s).
+
+    Usado entre processos: os workers seguidores acompanham o índice
+    gravado pelo líder, e o líder acompanha pedidos de reindexação
+    deixados pelos seguidores.
+    """
+
+    def __init__(self, path, callback, interval=2.0):
+        self.path = path
+        self.callback = callback
+        self.interval = interval
+        self._last = self._mtime()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def check(self):
+        """Verifica o arquivo uma vez; retorna se ``callback`` foi chamado"""
+        mtime = self._mtime()
+        if mtime is None or mtime == self._last:
+            return False
+        try:
+            if self.callback() is False:
+                return False  # Tenta de novo na próxima verificação
+        except Exception as e:
+            logger.error(f"Erro ao processar alteração de {self.path}: {e}")
+            return False
+        self._last = mtime
+        return True
+
+    def start(self):
+        def run():
+            while not self._stop.wait(self.interval):
+                self.check()
+
+        self._thread = threading.Thread(target=run, name="docia-file-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def touch(path):
+    """Atualiza o mtime de ``path`` (criando o arquivo se preciso)"""
+    with open(path, 'a'):
+        os.utime(path, None)
@@ -0,0 +1,161 @@
+"""Armazenamento compacto do texto indexado.
+
+O texto de todos os documentos fica num único buffer UTF-8 — um
+``bytearray`` logo depois de uma indexação, ou um memory-map do
+``<índice>.text`` depois de gravado/carregado — e documentos e chunks são
+só offsets em bytes guardados em arrays numpy. Conteúdo e chunks são
+decodificados sob demanda: a memória do processo não cresce com o tamanho
+dos documentos, e as páginas do memory-map ficam no cache do sistema, que
+pode descartá-las.
+"""
+import numpy as np
+
+
+def byte_spans(content, spans):
+    """Converte intervalos em caracteres de ``content`` para intervalos em bytes UTF-8"""
+    if content.isascii():
+        return np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+    result = np.empty((len(spans), 2), dtype=np.int64)
+    pos = offset = 0
+    for i, (start, end) in enumerate(spans):
+        if start < pos:
+            # Chunks sobrepostos (índices antigos): recomeça a contagem do início
+            pos = offset = 0
+        offset += len(content[pos:start].encode('utf-8'))
+        result[i, 0] = offset
+        offset += len(content[start:end].encode('utf-8'))
+        result[i, 1] = offset
+        pos = end
+    return result
+
+
+class DocumentStore:
+    """Texto dos documentos e dos chunks, na ordem do snapshot.
+
+    ``doc_offsets`` e ``doc_chunks`` têm ``n_documentos + 1`` posições
+    (offsets em bytes e primeiro chunk de cada documento); ``chunk_offsets``
+    tem o intervalo em bytes de cada chunk no buffer, na ordem global dos
+    chunks (a mesma das linhas da matriz TF-IDF).
+    """
+
+    __slots__ = ('buffer', 'doc_offsets', 'doc_chunks', 'chunk_offsets')
+
+    def __init__(self, buffer=b'', doc_offsets=None, doc_chunks=None, chunk_offsets=None):
+        self.buffer = buffer
+        self.doc_offsets = np.zeros(1, dtype=np.int64) if doc_offsets is None else doc_offsets
+        self.doc_chunks = np.zeros(1, dtype=np.int64) if doc_chunks is None else doc_chunks
+        self.chunk_offsets = np.zeros((0, 2), dtype=np.int64) if chunk_offsets is None else chunk_offsets
+
+    @classmethod
+    def open(cls, path, doc_offsets, doc_chunks, chunk_offsets):
+        """Store sobre o arquivo de texto do índice (memory-map, só leitura)"""
+        size = int(doc_offsets[-1])
+        buffer = np.memmap(path, dtype=np.uint8, mode='r', shape=(size,)) if size else b''
+        return cls(buffer, doc_offsets, doc_chunks, chunk_offsets)
+
+    @property
+    def n_documents(self):
+        return len(self.doc_offsets) - 1
+
+    @property
+    def n_chunks(self):
+        return len(self.chunk_offsets)
+
+    @property
+    def nbytes(self):
+        return int(self.doc_offsets[-1])
+
+    def chunk_counts(self):
+        return np.diff(self.doc_chunks)
+
+    def _decode(self, start, end):
+        return bytes(self.buffer[start:end]).decode('utf-8')
+
+    def content(self, position):
+        """Conteúdo completo do documento na posição ``position``"""
+        return self._decode(self.doc_offsets[position], self.doc_offsets[position + 1])
+
+    def chunk(self, index):
+        """Texto do chunk de índice global ``index``"""
+        start, end = self.chunk_offsets[index]
+        return self._decode(start, end)
+
+    def document_chunks(self, position):
+        return [self.chunk(i) for i in range(self.doc_chunks[position], self.doc_chunks[position + 1])]
+
+    def window(self, position, first, last):
+        """Trecho do documento do início do chunk local ``first`` ao fim do ``last``"""
+        base = self.doc_chunks[position]
+        return self._decode(self.chunk_offsets[base + first][0], self.chunk_offsets[base + last][1])
+
+    def texts(self):
+        """Sequência (lazy) com o texto de todos os chunks"""
+        return ChunkTexts(self)
+
+    def write(self, f, block_size=1 << 24):
+        """Grava o buffer num arquivo aberto em modo binário, em blocos"""
+        for start in range(0, self.nbytes, block_size):
+            f.write(bytes(self.buffer[start:start + block_size]))
+
+
+class ChunkTexts:
+    """Visão de sequência dos chunks de um store (para o TF-IDF, BM25 e embeddings)"""
+
+    __slots__ = ('store',)
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return self.store.n_chunks
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.store.chunk(i) for i in range(*index.indices(len(self)))]
+        return self.store.chunk(index)
+
+    def __iter__(self):
+        return (self.store.chunk(i) for i in range(len(self)))
+
+
+class DocumentStoreBuilder:
+    """Monta um ``DocumentStore`` em memória, um documento por vez"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._doc_offsets = [0]
+        self._doc_chunks = [0]
+        self._chunk_offsets = []
+
+    def add(self, content, spans):
+        """Acrescenta um documento a partir do texto e dos intervalos (em caracteres) dos chunks"""
+        base = len(self._buffer)
+        self._buffer += content.encode('utf-8')
+        self._finish_document(byte_spans(content, spans) + base)
+
+    def add_file(self, path, spans):
+        """Acrescenta um documento já codificado em UTF-8 num arquivo, com os intervalos em bytes"""
+        base = len(self._buffer)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                self._buffer += block
+        self._finish_document(np.asarray(spans, dtype=np.int64).reshape(-1, 2) + base)
+
+    def add_stored(self, store, position):
+        """Copia um documento de outro store (sem decodificar o texto)"""
+        start, end = int(store.doc_offsets[position]), int(store.doc_offsets[position + 1])
+        base = len(self._buffer)
+        self._buffer += bytes(store.buffer[start:end])
+        chunks = store.chunk_offsets[store.doc_chunks[position]:store.doc_chunks[position + 1]]
+        self._finish_document(chunks - start + base)
+
+    def _finish_document(self, chunk_offsets):
+        self._chunk_offsets.append(chunk_offsets)
+        self._doc_offsets.append(len(self._buffer))
+        self._doc_chunks.append(self._doc_chunks[-1] + len(chunk_offsets))
+
+    def build(self):
+        chunk_offsets = (np.concatenate(self._chunk_offsets) if self._chunk_offsets
+                         else np.zeros((0, 2), dtype=np.int64))
+        return DocumentStore(self._buffer, np.asarray(self._doc_offsets, dtype=np.int64),
+                             np.asarray(self._doc_chunks, dtype=np.int64), chunk_offsets)
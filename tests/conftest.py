@@ -0,0 +1,18 @@
+import zlib
+
+import numpy as np
+import pytest
+
+
+def _fake_embedder(texts, dim=64):
+    """Embedding determinístico (bag of words com hash) para testes sem modelo"""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[i, zlib.crc32(word.encode()) % dim] += 1.0
+    return vectors
+
+
+@pytest.fixture
+def fake_embedder():
+    return _fake_embedder
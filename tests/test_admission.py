@@ -0,0 +1,134 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from smart_admission import AdmissionRejected, GenerationQueue
+
+
+def test_threads_wait_in_fifo_order_for_a_slot():
+    queue = GenerationQueue(max_concurrency=1, max_waiting=4, timeout=5)
+    order, release = [], threading.Event()
+
+    def generate(name):
+        with queue.slot(queue.deadline()):
+            order.append(name)
+            release.wait(1)
+
+    first = threading.Thread(target=generate, args=('a',))
+    first.start()
+    while queue.active == 0:
+        time.sleep(0.001)
+    threads = []
+    for name in ('b', 'c'):
+        threads.append(threading.Thread(target=generate, args=(name,)))
+        threads[-1].start()
+        while queue.waiting < len(threads):
+            time.sleep(0.001)
+    release.set()
+    for thread in [first] + threads:
+        thread.join(2)
+    assert order == ['a', 'b', 'c']
+    stats = queue.stats()
+    assert (stats['active'], stats['waiting'], stats['admitted']) == (0, 0, 3)
+
+
+def _hold(queue, release, deadline=None, errors=None):
+    """Thread que segura uma vaga até ``release`` (ou anota a recusa em ``errors``)"""
+    def run():
+        try:
+            with queue.slot(deadline):
+                release.wait(2)
+        except AdmissionRejected as e:
+            errors.append(e.reason)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_until(condition):
+    for _ in range(2000):
+        if condition():
+            return
+        time.sleep(0.001)
+    raise AssertionError("condição não atingida")
+
+
+def test_full_queue_and_expired_deadline_are_rejected():
+    queue = GenerationQueue(max_concurrency=1, max_waiting=1, timeout=5)
+    release, errors = threading.Event(), []
+    holder = _hold(queue, release)
+    _wait_until(lambda: queue.active == 1)
+    waiter = _hold(queue, release, queue.deadline(0.2), errors)
+    _wait_until(lambda: queue.waiting == 1)
+    # Fila cheia: recusa na hora, sem esperar
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as excinfo:
+        with queue.slot(queue.deadline()):
+            pass
+    assert excinfo.value.reason == 'queue_full'
+    assert time.monotonic() - started < 0.1
+    # O pedido na fila desiste no prazo e sai dela
+    waiter.join(2)
+    assert errors == ['deadline'] and queue.waiting == 0
+    with pytest.raises(AdmissionRejected) as excinfo:
+        with queue.slot(time.monotonic() - 1):
+            pass
+    assert excinfo.value.reason == 'deadline'
+    release.set()
+    holder.join(2)
+    assert queue.stats()['rejected'] == {'queue_full': 1, 'deadline': 2}
+    assert (queue.active, queue.admitted) == (0, 1)
+
+
+def test_coroutines_share_the_slots_with_threads():
+    queue = GenerationQueue(max_concurrency=1, max_waiting=8, timeout=5)
+    release = threading.Event()
+    holder = _hold(queue, release)
+    _wait_until(lambda: queue.active == 1)
+
+    async def generate():
+        async with queue.aslot(queue.deadline()):
+            await asyncio.sleep(0)
+
+    async def run():
+        tasks = [asyncio.ensure_future(generate()) for _ in range(3)]
+        while queue.waiting < 3:
+            await asyncio.sleep(0.001)
+        # Cancelada na fila: sai dela sem ocupar vaga
+        tasks[0].cancel()
+        await asyncio.sleep(0.01)
+        assert queue.waiting == 2
+        # A thread libera a vaga; o event loop é acordado de fora
+        release.set()
+        await asyncio.gather(*tasks[1:])
+        return tasks[0].cancelled()
+
+    assert asyncio.run(run())
+    holder.join(2)
+    assert (queue.active, queue.waiting, queue.admitted) == (0, 0, 3)
+
+
+def test_resize_admits_waiting_requests():
+    queue = GenerationQueue(max_concurrency=1, max_waiting=2, timeout=None)
+    assert queue.deadline() is None and queue.remaining(None) is None
+    release = threading.Event()
+    threads = [_hold(queue, release) for _ in range(2)]
+    _wait_until(lambda: queue.active == 1 and queue.waiting == 1)
+    queue.resize(2)
+    assert (queue.active, queue.waiting) == (2, 0)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+    assert queue.active == 0
+
+
+def test_split_divides_the_pod_budget_among_workers():
+    queue = GenerationQueue(max_concurrency=4, max_waiting=2, timeout=None)
+    assert queue.split(3) == 1 and queue.max_concurrency == 1
+    assert queue.stats()['workers'] == 3
+    assert GenerationQueue(max_concurrency=4).split(2) == 2
+    # Menos vagas que workers: cada um fica com uma
+    assert GenerationQueue(max_concurrency=1).split(4) == 1
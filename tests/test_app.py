@@ -1,4 +1,8 @@
+import os
+import sys
+import subprocess
 import importlib
+import json
 from unittest.mock import patch
 import pytest
 
@@ -28,6 +32,15 @@ def test_stats_endpoint(app_client):
     data = resp.get_json()
     assert data['success'] is True
     assert data['total_documents'] == 1
+    assert 'queue_depth' in data['reindex']
+
+
+def test_document_endpoint_returns_content_on_demand(app_client):
+    client, idx = app_client
+    data = client.get('/documents/1').get_json()
+    assert data['document']['content'] == 'conteudo para busca de testes'
+    assert data['document']['filename'] == 'doc.txt'
+    assert client.get('/documents/99').status_code == 404
 
 
 def test_search_endpoint(app_client):
@@ -41,9 +54,110 @@ def test_search_endpoint(app_client):
 
 def test_index_endpoint(app_client):
     client, idx = app_client
+    import smart_app
     with patch.object(idx, 'index_directory') as mock_index:
         resp = client.post('/index')
+        assert smart_app.scheduler.wait_idle(timeout=5)
     assert resp.status_code == 200
     data = resp.get_json()
     assert data['success'] is True
     mock_index.assert_called()
+
+
+def test_index_endpoint_on_follower_leaves_request_for_leader(app_client, monkeypatch):
+    client, idx = app_client
+    import smart_app
+    monkeypatch.setattr(smart_app, 'process_role', 'follower')
+    with patch.object(smart_app.scheduler, 'request_reindex') as mock_request:
+        resp = client.post('/index')
+    assert resp.status_code == 200
+    mock_request.assert_not_called()
+    assert os.path.exists(smart_app._reindex_request_path())
+    assert client.get('/stats').get_json()['process']['role'] == 'follower'
+
+
+def test_startup_waits_for_usable_index(app_client, tmp_path, monkeypatch):
+    client, idx = app_client
+    import smart_app
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'documents').mkdir()
+    smart_app.app.config['STARTUP_COMPLETE'] = True
+    try:
+        assert client.get('/startup').status_code == 200
+        idx.document_vectors = None
+        assert client.get('/startup').status_code == 503
+    finally:
+        smart_app.app.config['STARTUP_COMPLETE'] = False
+
+
+def test_search_stream_endpoint(app_client):
+    client, idx = app_client
+    events = [{'type': 'context', 'results': [{'id': 1, 'filename': 'doc.txt', 'similarity_score': 0.5}]},
+              {'type': 'token', 'text': 'Olá'},
+              {'type': 'done', 'confidence': 0.95}]
+    with patch.object(idx, 'search_stream', return_value=iter(events)):
+        resp = client.post('/search/stream', json={'query': 'teste'})
+        body = resp.get_data(as_text=True)
+    assert resp.mimetype == 'text/event-stream'
+    assert [json.loads(line[6:]) for line in body.split('\n\n') if line] == events
+
+
+def test_search_answer_endpoint(app_client):
+    client, idx = app_client
+    with patch.object(idx, 'answer_result', return_value={'id': 1, 'ai_answer': 'ok'}) as mock_answer:
+        resp = client.post('/search/answer', json={'query': 'teste', 'id': 1})
+    assert resp.get_json()['result']['ai_answer'] == 'ok'
+    mock_answer.assert_called_once_with('teste', 1, max_results=10)
+
+
+def test_search_batch_endpoint(app_client):
+    client, idx = app_client
+    items = [{'query': 'a', 'results': [], 'timings': {}}]
+    with patch.object(idx, 'search_batch', return_value=items) as mock_batch:
+        resp = client.post('/search/batch', json={'queries': ['a', ' ']})
+    assert resp.get_json()['items'] == items
+    mock_batch.assert_called_once_with(['a'], max_results=1, concurrency=None)
+
+
+def test_import_is_fast_and_defers_heavy_work():
+    code = ("import sys, smart_app; "
+            "print(smart_app.indexer.initialized.is_set(), "
+            "sorted(m for m in ('sklearn', 'scipy', 'PyPDF2', 'docx', 'transformers') if m in sys.modules))")
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         env=dict(os.environ, OLLAMA_HOST='http://127.0.0.1:9'))
+    assert out.stdout.strip() == 'False []'
+
+
+def test_health_answers_during_initialization(app_client, monkeypatch):
+    client, idx = app_client
+    monkeypatch.setattr(idx, 'initialized', __import__('threading').Event())
+    resp = client.get('/health')
+    assert resp.status_code == 200
+    assert resp.get_json()['initialized'] is False
+    assert client.get('/stats').get_json()['startup']['initialized'] is False
+
+
+def test_metrics_endpoint_exposes_stage_histograms(app_client):
+    client, idx = app_client
+    client.post('/search', json={'query': 'conteudo busca'})
+    resp = client.get('/metrics')
+    assert resp.status_code == 200
+    assert resp.content_type.startswith('text/plain')
+    text = resp.get_data(as_text=True)
+    assert 'doc_ia_stage_duration_seconds_count{stage="retrieve"}' in text
+    assert 'doc_ia_stage_duration_seconds_count{stage="total"}' in text
+    assert 'http_requests_total{method="POST",endpoint="/search",status="200"}' in text
+    assert 'doc_ia_documents_indexed_total 1' in text
+
+
+def test_search_endpoints_reject_invalid_ints(app_client):
+    client, idx = app_client
+    with patch.object(idx, 'search_batch') as mock_batch, patch.object(idx, 'search') as mock_search:
+        for body in ({'max_results': 0}, {'max_results': '5'}, {'concurrency': -1}, {'concurrency': True}):
+            resp = client.post('/search/batch', json=dict(body, queries=['a']))
+            assert resp.status_code == 400 and not resp.get_json()['success']
+        assert client.post('/search', json={'query': 'a', 'max_results': 1.5}).status_code == 400
+        assert client.post('/search/answer', json={'query': 'a', 'id': 1, 'max_results': -3}).status_code == 400
+    mock_batch.assert_not_called()
+    mock_search.assert_not_called()
@@ -0,0 +1,94 @@
+import asyncio
+import importlib
+from unittest.mock import patch
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from smart_indexer import SmartDocumentIndexer
+
+
+def _run(scenario, tmp_path, max_inflight=256):
+    with patch.object(SmartDocumentIndexer, '_init_qa_model', lambda self: setattr(self, 'llm_type', 'internal')):
+        smart_app = importlib.import_module('smart_app')
+        smart_async_app = importlib.import_module('smart_async_app')
+        my_indexer = SmartDocumentIndexer()
+    my_indexer.index_file = str(tmp_path / 'index.json')
+    my_indexer.vectorizer.max_df = 1.0
+    (tmp_path / 'doc.txt').write_text('conteudo para busca de testes')
+    my_indexer.index_directory(tmp_path)
+    smart_app.indexer = my_indexer
+
+    async def main():
+        async with TestClient(TestServer(smart_async_app.create_app(max_inflight=max_inflight))) as client:
+            return await scenario(client, my_indexer)
+
+    return asyncio.run(main())
+
+
+def test_async_search_endpoint(tmp_path):
+    async def scenario(client, idx):
+        resp = await client.post('/search', json={'query': 'conteudo busca'})
+        assert resp.status == 200
+        data = await resp.json()
+        assert data['success'] is True
+        assert data['results'][0]['filename'] == 'doc.txt'
+        assert data['results'][0]['ai_answer']
+
+        resp = await client.post('/search', json={'query': ' '})
+        assert (await resp.json())['error'] == 'Query vazia'
+
+        for path, body in (('/search', {'query': 'a', 'max_results': 0}),
+                           ('/search/batch', {'queries': ['a'], 'concurrency': 'muitas'}),
+                           ('/search/answer', {'query': 'a', 'id': 1, 'max_results': -1})):
+            resp = await client.post(path, json=body)
+            assert resp.status == 400 and not (await resp.json())['success']
+
+        resp = await client.post('/search/stream', json={'query': 'conteudo'})
+        body = await resp.text()
+        assert resp.headers['Content-Type'].startswith('text/event-stream')
+        assert '"type": "done"' in body
+
+        resp = await client.post('/search/batch', json={'queries': ['conteudo', 'busca']})
+        items = (await resp.json())['items']
+        assert [item['query'] for item in items] == ['conteudo', 'busca']
+        assert items[0]['results'][0]['ai_answer']
+
+        resp = await client.post('/search/answer', json={'query': 'conteudo busca', 'id': 1})
+        assert (await resp.json())['result']['ai_answer']
+
+        resp = await client.get('/documents/1')
+        assert (await resp.json())['document']['content'] == 'conteudo para busca de testes'
+        assert (await client.get('/documents/99')).status == 404
+
+        resp = await client.get('/stats')
+        data = await resp.json()
+        assert data['total_documents'] == 1
+        assert data['requests']['inflight'] == 0
+        assert data['generations']['active'] == 0
+
+    _run(scenario, tmp_path)
+
+
+def test_async_search_rejects_above_max_inflight(tmp_path):
+    async def scenario(client, idx):
+        limiter = client.app[importlib.import_module('smart_async_app').LIMITER]
+        release = asyncio.Event()
+
+        async def slow_asearch(query, max_results=1, per_result_answers=False):
+            await release.wait()
+            return [{'ai_answer': 'ok', 'confidence': 1.0}]
+
+        with patch.object(idx, 'asearch', side_effect=slow_asearch):
+            first = asyncio.ensure_future(client.post('/search', json={'query': 'a'}))
+            while limiter.inflight == 0:
+                await asyncio.sleep(0.01)
+            rejected = await client.post('/search', json={'query': 'b'})
+            assert rejected.status == 503
+            assert rejected.headers['Retry-After'] == '1'
+            health = await client.get('/health')  # fora do limite
+            assert health.status == 200
+            release.set()
+            assert (await first).status == 200
+        assert limiter.rejected == 1
+
+    _run(scenario, tmp_path, max_inflight=1)
@@ -0,0 +1,53 @@
+from benchmarks.compare import compare
+from benchmarks.corpus import generate_corpus
+from benchmarks.run import parse_size, run_size
+from benchmarks.stub_ollama import StubOllama
+from smart_indexer import SmartDocumentIndexer
+from smart_llm import OllamaClient
+
+
+def test_corpus_reaches_target_in_every_format(tmp_path):
+    info = generate_corpus(tmp_path, 30, formats=("txt", "docx", "pdf"))
+    assert info['chunks'] >= 30
+    files = sorted(p.name for p in tmp_path.iterdir())
+    assert {name.rsplit('.', 1)[1] for name in files} == {"txt", "docx", "pdf"}
+    text = SmartDocumentIndexer._read_pdf(str(tmp_path / next(n for n in files if n.endswith('.pdf'))))
+    assert "REUNIÃO ORDINÁRIA" in text
+    # Mesma semente, mesmo corpus
+    again = generate_corpus(tmp_path / "again", 30, formats=("txt", "docx", "pdf"))
+    assert again['chunks'] == info['chunks']
+    assert (tmp_path / "again" / files[0]).read_bytes() == (tmp_path / files[0]).read_bytes()
+
+
+def test_stub_ollama_serves_generate_and_stream():
+    with StubOllama(latency=0.0) as stub:
+        client = OllamaClient(host=stub.url)
+        assert client.refresh_health()['available']
+        assert "aprovada" in client.generate("mistral", "pergunta")
+        assert "aprovada" in "".join(client.generate_stream("mistral", "pergunta"))
+        client.close()
+    assert stub.requests == 2
+
+
+def test_run_size_reports_indexing_and_latency(tmp_path):
+    config = {'formats': ["txt", "docx"], 'queries': 6, 'concurrency': 2, 'llm_latency': 0.0,
+              'token_latency': 0.0, 'seed': 0, 'workdir': str(tmp_path), 'log_level': 'WARNING'}
+    result = run_size(20, config)
+    assert result['indexing']['chunks'] >= 20
+    assert result['indexing']['index_bytes'] > 0
+    assert 'vectorize' in result['indexing']['stages']
+    for mode in ('semantic_search', 'search', 'asearch'):
+        assert result['queries'][mode]['count'] == 6
+        assert result['queries'][mode]['p99_ms'] >= result['queries'][mode]['p50_ms']
+    # Cada pergunta foi ao LLM (sem cache de respostas)
+    assert result['queries']['llm_requests'] == 12
+
+
+def test_compare_flags_regressions():
+    assert parse_size("10k") == 10_000
+    before = {'results': [{'target_chunks': 1000, 'indexing': {'chunks_per_s': 100.0},
+                           'queries': {'search': {'p95_ms': 100.0}}}]}
+    after = {'results': [{'target_chunks': 1000, 'indexing': {'chunks_per_s': 105.0},
+                          'queries': {'search': {'p95_ms': 150.0}}}]}
+    rows = {metric: regressed for _size, metric, _a, _b, _change, regressed in compare(before, after)}
+    assert rows == {'indexing.chunks_per_s': False, 'queries.search.p95_ms': True}
@@ -0,0 +1,65 @@
+import os
+from unittest.mock import patch
+
+from smart_cache import AnswerCache, normalize_question
+
+
+def test_normalize_question():
+    assert normalize_question('Quando foi a ÚLTIMA reunião?') == normalize_question('quando foi a ultima  reuniao')
+
+
+def test_lru_ttl_and_invalidation():
+    cache = AnswerCache(max_entries=2, ttl=60)
+    k1, k2, k3 = (AnswerCache.make_key(q, ['h:0']) for q in ('a', 'b', 'c'))
+    cache.put(k1, {'answer': '1'}, [1])
+    cache.put(k2, {'answer': '2'}, [2])
+    assert cache.get(k1) == {'answer': '1'}
+    cache.put(k3, {'answer': '3'}, [1, 3])
+    assert cache.get(k2) is None  # menos usado recentemente
+    cache.invalidate_documents([1])
+    assert cache.get(k1) is None and cache.get(k3) is None
+
+    cache.put(k1, {'answer': '1'}, [1])
+    with patch('smart_cache.time.time', return_value=10 ** 12):
+        assert cache.get(k1) is None
+
+
+def test_disk_backend_is_shared(tmp_path):
+    key = AnswerCache.make_key('qual o orçamento', ['h:0', 'h:1'])
+    AnswerCache(directory=str(tmp_path)).put(key, {'answer': 'R$ 10'}, [7])
+    other_replica = AnswerCache(directory=str(tmp_path))
+    assert other_replica.get(key) == {'answer': 'R$ 10'}
+    other_replica.invalidate_documents([7])
+    assert AnswerCache(directory=str(tmp_path)).get(key) is None
+
+
+def test_disk_backend_is_bounded(tmp_path):
+    cache = AnswerCache(ttl=60, directory=str(tmp_path), max_disk_entries=10)
+    keys = [AnswerCache.make_key(f'pergunta {i}', ['h:0']) for i in range(40)]
+    for i, key in enumerate(keys):
+        with patch('smart_cache.time.time', return_value=1000.0 + i):
+            cache.put(key, {'answer': str(i)}, [1])
+        os.utime(cache._disk_path(key), (1000.0 + i, 1000.0 + i))
+    on_disk = {name[:-5] for _, _, names in os.walk(tmp_path) for name in names}
+    # Com limite 10 a limpeza roda a cada gravação: ficam só as 10 mais novas
+    assert len(on_disk) <= 10 and keys[-1] in on_disk and keys[0] not in on_disk
+
+    # Vencidas saem na próxima limpeza, mesmo abaixo do limite
+    with patch('smart_cache.time.time', return_value=1000.0 + 40 + 61):
+        cache._sweep_disk()
+    assert not any(names for _, _, names in os.walk(tmp_path))
+
+
+def test_sweep_ignores_temporary_files(tmp_path):
+    cache = AnswerCache(ttl=60, directory=str(tmp_path), max_disk_entries=1)
+    key = AnswerCache.make_key('pergunta', ['h:0'])
+    cache.put(key, {'answer': 'r'}, [1])
+    # Gravação em andamento de outra thread/réplica: não conta nem é apagada
+    in_flight = tmp_path / key[:2] / f"{key}.json.0123abcd.tmp"
+    in_flight.write_text('{"answer"')
+    cache._sweep_disk()
+    assert in_flight.exists() and os.path.exists(cache._disk_path(key))
+    # Temporário abandonado há mais que o TTL: removido
+    os.utime(in_flight, (0, 0))
+    cache._sweep_disk()
+    assert not in_flight.exists()
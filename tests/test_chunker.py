@@ -0,0 +1,46 @@
+from smart_chunker import PAGE_BREAK, StructuredChunker, TokenCounter
+
+
+def test_sentences_pages_and_offsets():
+    chunker = StructuredChunker(max_tokens=30, min_tokens=5)
+    text = ('Ata da reunião de 12 de março. Presentes: João Silva e Maria.\n\n'
+            'Foi aprovado o orçamento de R$ 1.500,00 para o projeto. O conselho votou a favor. '
+            'Outra frase longa aqui para encher o chunk com mais tokens do que cabe.'
+            + PAGE_BREAK + 'Página dois começa aqui. Fim.')
+    chunks = chunker.chunk(text)
+    pieces = [text[c.start:c.end] for c in chunks]
+    assert pieces == [
+        'Ata da reunião de 12 de março. Presentes: João Silva e Maria.',
+        'Foi aprovado o orçamento de R$ 1.500,00 para o projeto. O conselho votou a favor.',
+        'Outra frase longa aqui para encher o chunk com mais tokens do que cabe.',
+        'Página dois começa aqui. Fim.',
+    ]
+    assert [c.page for c in chunks] == [1, 1, 1, 2]
+    assert all(c.tokens <= 30 for c in chunks)
+
+
+def test_long_sentence_is_cut_between_words():
+    chunker = StructuredChunker(max_tokens=20, min_tokens=0)
+    text = ' '.join(['palavra'] * 25)
+    chunks = chunker.chunk(text)
+    assert [c.tokens for c in chunks] == [20, 20, 10]
+    assert all(text[c.start:c.end].split() == ['palavra'] * (c.tokens // 2) for c in chunks)
+
+
+def test_small_tail_is_merged_and_signature():
+    chunker = StructuredChunker(max_tokens=20, min_tokens=5)
+    chunks = chunker.chunk(' '.join(['palavra'] * 10) + '\n\nFim.')
+    assert len(chunks) == 1
+    assert StructuredChunker(max_tokens=20).signature != StructuredChunker(max_tokens=30).signature
+    assert TokenCounter()('orçamento R$ 1.500,00') == 10
+
+
+def test_chunk_page_matches_whole_text():
+    chunker = StructuredChunker(max_tokens=20, min_tokens=5)
+    pages = ['Primeira página. ' * 12, '', 'Terceira página com uma frase só.\n\nE um parágrafo.']
+    expected = [(c.start, c.end, c.page, c.tokens) for c in chunker.chunk(PAGE_BREAK.join(pages))]
+    stitched, base = [], 0
+    for number, page in enumerate(pages, start=1):
+        stitched.extend((c.start + base, c.end + base, c.page, c.tokens) for c in chunker.chunk_page(page, number))
+        base += len(page) + len(PAGE_BREAK)
+    assert stitched == expected
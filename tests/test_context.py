@@ -0,0 +1,30 @@
+from smart_context import ContextPacker
+
+
+def piece(doc_id, content, start, end, key):
+    return {'id': doc_id, 'content': content, 'start': start, 'end': end, 'chunk_key': key}
+
+
+def test_overlapping_and_adjacent_chunks_become_one_passage():
+    content = 'Primeira frase da ata. Segunda frase da ata. Terceira frase da ata.'
+    packer = ContextPacker(max_tokens=100, min_tokens=0)
+    # Chunks antigos com sobreposição e um chunk vizinho
+    packed = packer.pack([
+        piece(1, content, 0, 44, 'a:0'),
+        piece(1, content, 23, 44, 'a:1'),
+        piece(1, content, 45, len(content), 'a:2'),
+        piece(2, 'Outro documento.', 0, 16, 'b:0'),
+    ])
+    assert packed.text == content + '\n\nOutro documento.'
+    assert packed.chunk_keys == ['a:0', 'a:2', 'b:0']  # a:1 já estava coberto
+    assert packed.doc_ids == [1, 2]
+    assert packed.tokens == packer.counter(content) + packer.counter('Outro documento.')
+
+
+def test_budget_cuts_at_sentence_end():
+    content = 'Frase um aqui. Frase dois aqui. Frase três aqui.'
+    packer = ContextPacker(max_tokens=12, min_tokens=2)
+    packed = packer.pack([piece(1, content, 0, len(content), 'a:0'), piece(2, 'Nada cabe.', 0, 10, 'b:0')])
+    assert packed.text == 'Frase um aqui. Frase dois aqui.'
+    assert packed.doc_ids == [1]
+    assert packer.fit('palavra ' * 10, 5) == 'palavra palavra'
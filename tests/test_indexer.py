@@ -1,9 +1,14 @@
 import os
+import json
+import asyncio
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch
+import numpy as np
 import pytest
 
 from smart_indexer import SmartDocumentIndexer
+from smart_readers import get_reader
 
 
 @pytest.fixture
@@ -18,12 +23,15 @@ def indexer(tmp_path):
 
 
 def test_chunk_text(indexer):
-    text = 'a' * 4500
-    chunks = indexer._chunk_text(text, chunk_size=2000, overlap=400)
-    assert len(chunks) == 3
-    assert chunks[0] == text[:2000]
-    # Second chunk should overlap with first
-    assert chunks[1].startswith(text[1600:1610])
+    paragraph = 'Registro da ata com palavras repetidas. ' * 30
+    text = '\n\n'.join([paragraph.strip()] * 3)
+    chunks = indexer._chunk_text(text)
+    # Parágrafos inteiros, sem sobreposição
+    assert chunks == [paragraph.strip()] * 3
+    fields = indexer._chunk_fields('Página um.\fPágina dois.')
+    assert 'chunks' not in fields
+    assert fields['chunk_spans'] == [(0, 10), (11, 23)]
+    assert fields['chunk_pages'] == [1, 2]
 
 
 def test_index_and_search(indexer, tmp_path):
@@ -53,3 +61,772 @@ def test_get_stats(indexer, tmp_path):
     stats = indexer.get_stats()
     assert stats['total_documents'] == 1
     assert 'model_status' in stats
+
+
+def test_incremental_index_keeps_ids_and_skips_unchanged(indexer, tmp_path):
+    (tmp_path / 'a.txt').write_text('primeiro documento sobre orcamento')
+    (tmp_path / 'b.txt').write_text('segundo documento sobre reuniao')
+    indexer.index_directory(tmp_path)
+    ids = {d['filename']: d['id'] for d in indexer.documents}
+
+    (tmp_path / 'a.txt').unlink()
+    (tmp_path / 'c.txt').write_text('terceiro documento sobre projeto')
+    # Sem limite de tempo a extração roda no próprio processo, onde o mock vê as leituras
+    indexer.extract_timeout = 0
+    with patch.object(SmartDocumentIndexer, '_read_txt', wraps=SmartDocumentIndexer._read_txt) as mock_read:
+        indexer.index_directory(tmp_path)
+    read_files = [os.path.basename(call.args[0]) for call in mock_read.call_args_list]
+    assert read_files == ['c.txt']
+
+    new_ids = {d['filename']: d['id'] for d in indexer.documents}
+    assert set(new_ids) == {'b.txt', 'c.txt'}
+    assert new_ids['b.txt'] == ids['b.txt']
+    assert new_ids['c.txt'] not in ids.values()
+    assert indexer.document_vectors.shape[0] == 2
+
+
+def test_parallel_extraction_is_ordered_and_isolates_errors(indexer, tmp_path):
+    indexer.extract_workers = 2
+    for i in range(4):
+        (tmp_path / f'doc{i}.txt').write_text(f'documento numero {i} sobre atas')
+    (tmp_path / 'quebrado.pdf').write_bytes(b'isto nao e um pdf')
+    indexer.index_directory(tmp_path)
+    assert [d['filename'] for d in indexer.documents] == [f'doc{i}.txt' for i in range(4)]
+    assert [d['id'] for d in indexer.documents] == [1, 2, 3, 4]
+
+
+def _hanging_reader(file_path):
+    # Ignora o SIGALRM do worker, como um laço em C que não volta ao interpretador
+    import signal
+    import time
+    signal.signal(signal.SIGALRM, signal.SIG_IGN)
+    with open(file_path + '.pid', 'w') as f:
+        f.write(str(os.getpid()))
+    time.sleep(60)
+    return 'nunca'
+
+
+def _process_gone(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().split(')')[-1].split()[0] == 'Z'
+    except FileNotFoundError:
+        return True
+
+
+def test_single_file_extraction_is_time_limited(indexer, tmp_path):
+    import time
+    from smart_readers import register_reader, _READERS
+    register_reader(('.trava',), _hanging_reader)
+    try:
+        indexer.extract_workers = 1
+        indexer.extract_timeout = 0.5
+        (tmp_path / 'ata.trava').write_text('x')
+        started = time.monotonic()
+        assert indexer._extract_documents([str(tmp_path / 'ata.trava')]) == ['']
+        assert time.monotonic() - started < 5
+        pid = int((tmp_path / 'ata.trava.pid').read_text())
+        for _ in range(200):
+            if _process_gone(pid):
+                break
+            time.sleep(0.01)
+        assert _process_gone(pid)
+    finally:
+        _READERS.pop('.trava', None)
+
+
+def test_save_and_load_compact_index(indexer, tmp_path):
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    (docs / 'ata.txt').write_text(' '.join(f'Item {i} discutido na reunião.' for i in range(150)) + ' O orçamento aprovado foi de R$ 1.000,00.')
+    (docs / 'outra.txt').write_text('Outra ata sobre o projeto do mapa')
+    indexer.index_directory(docs)
+
+    with open(indexer.index_file, encoding='utf-8') as f:
+        meta = json.load(f)
+    assert 'content' not in meta['documents'][0] and 'chunks' not in meta['documents'][0]
+
+    with patch.object(SmartDocumentIndexer, '_init_qa_model', lambda self: setattr(self, 'llm_type', 'internal')):
+        reloaded = SmartDocumentIndexer()
+    reloaded.index_file = indexer.index_file
+    reloaded.vectorizer.max_df = 1.0
+    with patch.object(reloaded, '_vectorize_documents') as mock_vectorize:
+        reloaded.load_index()
+    mock_vectorize.assert_not_called()
+    assert [reloaded.document_content(d['id']) for d in reloaded.documents] == \
+        [indexer.document_content(d['id']) for d in indexer.documents]
+    assert [reloaded.document_chunks(d['id']) for d in reloaded.documents] == \
+        [indexer.document_chunks(d['id']) for d in indexer.documents]
+    assert (reloaded.document_vectors != indexer.document_vectors).nnz == 0
+    assert reloaded._semantic_search('orçamento')[0]['filename'] == 'ata.txt'
+
+
+def test_documents_keep_only_metadata_and_results_only_the_chunk(indexer, tmp_path):
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    paragraphs = [f'Parágrafo {i} da ata sobre assuntos gerais da reunião do conselho.' for i in range(40)]
+    paragraphs[25] = 'O orçamento da reforma da quadra foi aprovado por unanimidade.'
+    (docs / 'ata.txt').write_text('\n\n'.join(paragraphs))
+    indexer.chunker.max_tokens = 30
+    indexer.index_directory(docs)
+
+    doc = indexer.documents[0]
+    assert 'content' not in doc and 'chunks' not in doc
+    # Depois de gravado, o texto é lido do memory-map do arquivo do índice
+    assert isinstance(indexer._snapshot.store.buffer, np.memmap)
+    result = indexer._semantic_search('orçamento da quadra', max_results=1)[0]
+    assert 'content' not in result
+    assert 'orçamento da reforma da quadra' in result['relevant_chunk']
+    assert len(result['relevant_chunk']) < len(indexer.document_content(doc['id'])) / 4
+    assert indexer.get_document(doc['id'])['content'] == '\n\n'.join(paragraphs)
+
+    # Índice do formato anterior (sem offsets em bytes): recalculados na carga
+    os.remove(indexer._index_path('.chunks.npy'))
+    with patch.object(SmartDocumentIndexer, '_init_qa_model', lambda self: setattr(self, 'llm_type', 'internal')):
+        reloaded = SmartDocumentIndexer()
+    reloaded.index_file = indexer.index_file
+    reloaded.vectorizer.max_df = 1.0
+    reloaded.load_index()
+    assert reloaded.document_chunks(doc['id']) == indexer.document_chunks(doc['id'])
+    assert reloaded._semantic_search('orçamento da quadra', max_results=1)[0]['relevant_chunk'] == \
+        result['relevant_chunk']
+
+
+def test_load_legacy_json_index(indexer):
+    legacy = [{'id': 1, 'filename': 'a.txt', 'content': 'texto antigo', 'chunks': ['texto antigo'],
+               'file_path': 'a.txt', 'indexed_at': '2024-01-01T00:00:00'}]
+    with open(indexer.index_file, 'w', encoding='utf-8') as f:
+        json.dump(legacy, f)
+    indexer.load_index()
+    assert indexer.document_content(1) == 'texto antigo'
+    assert 'content' not in indexer.documents[0]
+    assert indexer.document_vectors.shape[0] == 1
+
+
+def test_stale_vectors_are_refitted(indexer, tmp_path):
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    (docs / 'ata.txt').write_text('ata sobre o projeto do mapa')
+    indexer.index_directory(docs)
+    with open(indexer.index_file, encoding='utf-8') as f:
+        meta = json.load(f)
+    meta['vectors']['corpus_version'] = 'outra-versao'
+    with open(indexer.index_file, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    indexer.document_vectors = None
+    with patch.object(indexer, '_vectorize_documents', wraps=indexer._vectorize_documents) as mock_vectorize:
+        indexer.load_index()
+    mock_vectorize.assert_called_once()
+    assert indexer.is_ready()
+
+
+def test_reading_the_vectorizer_does_not_replace_the_snapshot(indexer):
+    snapshot = indexer._snapshot
+    assert snapshot.vectorizer is None
+    assert indexer.vectorizer is indexer.vectorizer
+    assert indexer._snapshot is snapshot
+
+
+def test_chunk_map_and_top_k(indexer, tmp_path):
+    (tmp_path / 'a.txt').write_text('\n\n'.join(['palavra ' * 150] * 3))
+    (tmp_path / 'b.txt').write_text('orcamento aprovado pela diretoria')
+    indexer.index_directory(tmp_path)
+    assert indexer.chunk_doc_index.tolist() == [0, 0, 0, 1]
+    assert indexer.chunk_local_index.tolist() == [0, 1, 2, 0]
+
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.0])
+    assert SmartDocumentIndexer._top_k(scores, 3).tolist() == [1, 3, 2]
+    assert SmartDocumentIndexer._top_k(scores, 10).tolist() == [1, 3, 2, 0, 4]
+
+    results = indexer._semantic_search('orcamento aprovado')
+    assert results[0]['filename'] == 'b.txt'
+    assert results[0]['relevant_chunk'] == 'orcamento aprovado pela diretoria'
+
+
+def test_answer_question_fails_over_when_ollama_down(indexer):
+    indexer.llm_client.health['available'] = False
+    with patch.object(indexer.llm_client.session, 'post') as post:
+        answer = indexer._answer_question('Qual o orçamento?', ['O orçamento foi de R$ 10,00.'])
+    post.assert_not_called()
+    assert answer['model'] == 'sistema_aprimorado'
+
+
+def test_answer_question_sheds_load_when_no_generation_slot(indexer):
+    indexer.llm_client.health['available'] = True
+    indexer.max_generations = 1
+    queue = indexer.generation_queue
+    queue.max_waiting = 0
+    with queue.slot(), patch.object(indexer.llm_client, 'generate') as generate:
+        # Todas as vagas ocupadas e fila cheia: sistema aprimorado, sem tentar o Ollama
+        answer = indexer._answer_question('Qual o orçamento?', ['O orçamento foi de R$ 10,00.'])
+    generate.assert_not_called()
+    assert answer['model'] == 'sistema_aprimorado'
+    assert queue.stats()['rejected']['queue_full'] == 1
+
+    # O prazo da pergunta limita o timeout da chamada ao Ollama
+    with patch.object(indexer.llm_client, 'generate', return_value='O orçamento foi de dez reais.') as generate:
+        answer = indexer._answer_question('Qual o orçamento?', ['O orçamento foi de R$ 10,00.'],
+                                          deadline=queue.deadline(30))
+    assert answer['model'] == 'mistral'
+    assert 25 < generate.call_args.kwargs['timeout'] <= 30
+
+
+def test_search_stream_forwards_ollama_tokens(indexer, tmp_path):
+    (tmp_path / 'doc.txt').write_text('A reuniao aprovou o orcamento do projeto.')
+    indexer.index_directory(tmp_path)
+    indexer.llm_client.health['available'] = True
+    with patch.object(indexer.llm_client, 'generate_stream', return_value=iter(['O orçamento ', 'foi aprovado.'])):
+        events = list(indexer.search_stream('orcamento'))
+    assert events[0]['type'] == 'context'
+    assert events[0]['results'][0]['filename'] == 'doc.txt'
+    assert 'content' not in events[0]['results'][0]
+    assert ''.join(e['text'] for e in events if e['type'] == 'token') == 'O orçamento foi aprovado.'
+    assert events[-1] == {'type': 'done', 'confidence': 0.95, 'model': 'mistral'}
+
+
+def test_interrupted_stream_is_partial_and_not_cached(indexer, tmp_path):
+    from smart_llm import StreamInterrupted
+
+    (tmp_path / 'doc.txt').write_text('A reuniao aprovou o orcamento do projeto.')
+    indexer.index_directory(tmp_path)
+    indexer.llm_client.health['available'] = True
+
+    def broken_stream(*args, **kwargs):
+        yield 'O orçamento '
+        raise StreamInterrupted('conexão perdida')
+
+    with patch.object(indexer.llm_client, 'generate_stream', side_effect=broken_stream):
+        events = list(indexer.search_stream('orcamento'))
+    assert events[-1]['partial'] and events[-1]['confidence'] < 0.95
+
+    async def agen(*args, **kwargs):
+        yield 'O orçamento '
+        raise StreamInterrupted('conexão perdida')
+
+    async def run():
+        return [event async for event in indexer.asearch_stream('orcamento')]
+
+    with patch.object(indexer.llm_client, 'agenerate_stream', side_effect=agen):
+        events = asyncio.run(run())
+    assert events[-1]['partial'] and not events[-1].get('cached')
+    assert indexer.answer_cache.stats()['entries'] == 0
+
+
+def test_search_stream_falls_back_without_ollama(indexer, tmp_path):
+    (tmp_path / 'doc.txt').write_text('A reuniao aprovou o orcamento do projeto.')
+    indexer.index_directory(tmp_path)
+    events = list(indexer.search_stream('orcamento'))
+    assert [e['type'] for e in events] == ['context', 'token', 'done']
+    assert events[-1]['model'] == 'sistema_aprimorado'
+
+
+def test_asearch_caps_concurrent_generations(indexer, tmp_path):
+    for name in ('a', 'b', 'c', 'd'):
+        (tmp_path / f'{name}.txt').write_text(f'ata {name}: o orcamento {name} foi aprovado')
+    indexer.index_directory(tmp_path)
+    indexer.llm_client.health['available'] = True
+    indexer.max_generations = 2
+    running, peak = 0, 0
+
+    async def fake_agenerate(model, prompt, options=None, timeout=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return 'O orçamento foi aprovado.'
+
+    async def run():
+        return await asyncio.gather(*(indexer.asearch(f'orcamento {name}', max_results=1) for name in 'abcd'))
+
+    with patch.object(indexer.llm_client, 'agenerate', side_effect=fake_agenerate) as agenerate:
+        answers = asyncio.run(run())
+    assert agenerate.call_count == 4
+    assert peak == 2
+    assert all(results[0]['ai_answer'] == 'O orçamento foi aprovado.' for results in answers)
+    stats = indexer.generation_stats()
+    assert (stats['max_generations'], stats['active'], stats['waiting'], stats['admitted']) == (2, 0, 0, 4)
+
+
+def test_asearch_stream_falls_back_without_ollama(indexer, tmp_path):
+    (tmp_path / 'doc.txt').write_text('A reuniao aprovou o orcamento do projeto.')
+    indexer.index_directory(tmp_path)
+
+    async def collect():
+        return [event async for event in indexer.asearch_stream('orcamento')]
+
+    events = asyncio.run(collect())
+    assert [e['type'] for e in events] == ['context', 'token', 'done']
+    assert events[-1]['model'] == 'sistema_aprimorado'
+
+
+def test_search_reuses_cached_answer_until_reindex(indexer, tmp_path):
+    doc = tmp_path / 'doc.txt'
+    doc.write_text('O orcamento aprovado foi de R$ 5.000,00.')
+    indexer.index_directory(tmp_path)
+    answer = {'answer': 'R$ 5.000,00', 'confidence': 0.95, 'model': 'mistral'}
+    with patch.object(indexer, '_answer_question', return_value=answer) as mock_answer:
+        indexer.search('Qual o orçamento?')
+        indexer.search('qual o orcamento')
+        assert mock_answer.call_count == 1
+
+        doc.write_text('O orcamento revisado foi de R$ 7.000,00.')
+        indexer.index_directory(tmp_path)
+        indexer.search('qual o orcamento')
+        assert mock_answer.call_count == 2
+
+
+def test_search_makes_one_generation_per_query(indexer, tmp_path):
+    (tmp_path / 'a.txt').write_text('orcamento da reuniao de janeiro')
+    (tmp_path / 'b.txt').write_text('orcamento da reuniao de fevereiro')
+    (tmp_path / 'c.txt').write_text('orcamento da reuniao de janeiro')  # cópia de a.txt
+    indexer.index_directory(tmp_path)
+    answer = {'answer': 'resp', 'confidence': 0.9, 'model': 'mistral'}
+    with patch.object(indexer, '_answer_question', return_value=answer) as mock_answer:
+        results = indexer.search('orcamento reuniao')
+    assert len(results) == 3
+    assert mock_answer.call_count == 1
+    context = mock_answer.call_args.args[1][0]
+    assert context.count('janeiro') == 1 and context.count('fevereiro') == 1
+    assert results[0]['ai_answer'] == 'resp'
+    assert 'ai_answer' not in results[1]
+
+    with patch.object(indexer, '_answer_question', return_value=answer) as mock_answer:
+        lazy = indexer.answer_result('orcamento reuniao', results[1]['id'])
+    assert mock_answer.call_count == 1
+    assert lazy['id'] == results[1]['id'] and lazy['ai_answer'] == 'resp'
+
+
+def test_search_batch_matches_single_search(indexer, tmp_path):
+    (tmp_path / 'a.txt').write_text('orcamento aprovado de R$ 5.000,00')
+    (tmp_path / 'b.txt').write_text('reuniao realizada em 12/01/2024')
+    indexer.index_directory(tmp_path)
+    queries = ['qual o orcamento', 'quando foi a reuniao', 'assunto inexistente']
+    with patch.object(indexer, '_answer_question', return_value={'answer': 'resp', 'confidence': 0.9, 'model': 'mistral'}):
+        with patch.object(indexer.vectorizer, 'transform', wraps=indexer.vectorizer.transform) as mock_transform:
+            items = indexer.search_batch(queries, concurrency=2)
+        assert mock_transform.call_count == 1
+        single = [indexer.search(q, max_results=1) for q in queries]
+    assert [item['query'] for item in items] == queries
+    assert [item['results'] for item in items] == single
+    assert all(item['timings']['total'] >= item['timings']['answer'] for item in items)
+
+
+def test_asearch_batch_generates_on_the_event_loop(indexer, tmp_path):
+    (tmp_path / 'a.txt').write_text('orcamento aprovado de R$ 5.000,00')
+    (tmp_path / 'b.txt').write_text('reuniao realizada em 12/01/2024')
+    indexer.index_directory(tmp_path)
+    indexer.llm_client.health['available'] = True
+    queries = ['qual o orcamento', 'quando foi a reuniao', 'assunto inexistente']
+
+    async def agenerate(model, prompt, **kwargs):
+        return 'Resposta gerada pelo modelo.'
+
+    async def run():
+        return (await indexer.asearch_batch(queries, concurrency=2),
+                await indexer.aanswer_result('reuniao realizada em janeiro', 2))
+
+    with patch.object(indexer.llm_client, 'agenerate', side_effect=agenerate) as mock_agenerate, \
+            patch.object(indexer.llm_client, 'generate') as mock_generate:
+        items, result = asyncio.run(run())
+    mock_generate.assert_not_called()
+    assert mock_agenerate.call_count == 3
+    assert [item['query'] for item in items] == queries
+    assert items[0]['results'][0]['filename'] == 'a.txt'
+    assert items[0]['results'][0]['ai_answer'] == 'Resposta gerada pelo modelo.'
+    assert items[2]['results'][0]['confidence'] == 0.1
+    assert result['id'] == 2 and result['ai_answer'] == 'Resposta gerada pelo modelo.'
+
+
+def test_search_batch_reports_errors_per_query(indexer, tmp_path):
+    (tmp_path / 'a.txt').write_text('orcamento aprovado de R$ 5.000,00')
+    (tmp_path / 'b.txt').write_text('reuniao realizada em 12/01/2024')
+    indexer.index_directory(tmp_path)
+    indexer.batch_concurrency = 2
+
+    def answer(question, *args, **kwargs):
+        if 'reuniao' in question:
+            raise RuntimeError('falha na geração')
+        return {'answer': 'resp', 'confidence': 0.9, 'model': 'mistral'}
+
+    with patch.object(indexer, '_answer_question', side_effect=answer), \
+            patch('smart_indexer.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as pool:
+        items = indexer.search_batch(['qual o orcamento', 'quando foi a reuniao'], concurrency=64)
+    assert pool.call_args.kwargs['max_workers'] == 2
+    assert items[0]['results'][0]['ai_answer'] == 'resp' and 'error' not in items[0]
+    assert items[1]['results'] == [] and items[1]['error'] == 'falha na geração'
+    assert items[1]['timings']['total'] >= 0
+
+
+def test_index_directory_only_checks_touched_paths(indexer, tmp_path):
+    (tmp_path / 'a.txt').write_text('primeiro documento')
+    (tmp_path / 'b.txt').write_text('segundo documento')
+    indexer.index_directory(tmp_path)
+    (tmp_path / 'a.txt').write_text('primeiro documento alterado')
+    (tmp_path / 'b.txt').write_text('segundo documento alterado')
+    indexer.index_directory(tmp_path, touched_paths=[str(tmp_path / 'b.txt')])
+    contents = {d['filename']: indexer.document_content(d['id']) for d in indexer.documents}
+    assert contents == {'a.txt': 'primeiro documento', 'b.txt': 'segundo documento alterado'}
+
+
+def test_searches_use_old_snapshot_during_reindex(indexer, tmp_path):
+    (tmp_path / 'a.txt').write_text('orcamento aprovado pela diretoria')
+    indexer.index_directory(tmp_path)
+    old_snapshot = indexer._snapshot
+    (tmp_path / 'b.txt').write_text('ata sobre o projeto do mapa')
+
+    seen_during_build = []
+    real_extract = indexer._extract_documents
+
+    def slow_extract(paths, *args):
+        seen_during_build.append([r['filename'] for r in indexer._semantic_search('orcamento aprovado')])
+        assert indexer._snapshot is old_snapshot
+        return real_extract(paths, *args)
+
+    with patch.object(indexer, '_extract_documents', side_effect=slow_extract):
+        indexer.index_directory(tmp_path)
+    assert seen_during_build == [['a.txt']]
+    assert indexer._snapshot is not old_snapshot
+    assert [d['filename'] for d in old_snapshot.documents] == ['a.txt']
+    assert [d['filename'] for d in indexer.documents] == ['a.txt', 'b.txt']
+    with pytest.raises(AttributeError):
+        old_snapshot.documents = []
+    with pytest.raises(AttributeError):
+        indexer.documents = []
+
+
+def test_dense_retriever_alongside_tfidf(indexer, tmp_path, fake_embedder):
+    indexer.retriever = 'dense'
+    indexer.embedder = fake_embedder
+    (tmp_path / 'a.txt').write_text('orcamento anual aprovado')
+    (tmp_path / 'b.txt').write_text('ata sobre o projeto do mapa')
+    indexer.index_directory(tmp_path)
+    assert indexer._snapshot.dense_index.size == 2
+
+    assert indexer._semantic_search('projeto mapa')[0]['filename'] == 'b.txt'
+    assert indexer._semantic_search('projeto mapa', retriever='tfidf')[0]['filename'] == 'b.txt'
+    assert indexer._semantic_search_batch(['orcamento anual'])[0][0]['filename'] == 'a.txt'
+
+
+def test_dense_retriever_falls_back_to_tfidf_without_model(indexer, tmp_path, fake_embedder):
+    def missing_model(texts):
+        raise OSError("modelo fora do cache local")
+
+    indexer.retriever = 'hybrid_dense'
+    indexer.embedder = missing_model
+    (tmp_path / 'a.txt').write_text('orcamento anual aprovado')
+    (tmp_path / 'b.txt').write_text('ata sobre o projeto do mapa')
+    indexer.index_directory(tmp_path)
+    assert indexer.retriever == 'hybrid' and indexer._snapshot.dense_index is None
+    assert indexer._semantic_search('projeto mapa')[0]['filename'] == 'b.txt'
+
+    # Índice denso pronto, mas o modelo sumiu: salvar não carrega o embedder
+    # e a busca cai para o TF-IDF
+    indexer.retriever = 'dense'
+    indexer.embedder = fake_embedder
+    indexer._vectorize_documents(indexer.documents, indexer._snapshot.store)
+    indexer.embedder = missing_model
+    indexer.save_index()
+    assert os.path.exists(indexer._index_path('.dense.json'))
+    assert indexer._semantic_search('orcamento anual')[0]['filename'] == 'a.txt'
+    assert indexer.retriever == 'tfidf'
+
+
+def test_hybrid_retriever_finds_exact_values(indexer, tmp_path):
+    indexer.retriever = 'hybrid'
+    (tmp_path / 'a.txt').write_text('Foi aprovado o orçamento anual do projeto de pavimentação.')
+    (tmp_path / 'b.txt').write_text('Contrato 2023/117 assinado no valor de R$ 48.250,00 para a obra.')
+    indexer.index_directory(tmp_path)
+    assert indexer._snapshot.bm25.n_alive == 2
+    assert indexer._semantic_search('contrato 2023/117')[0]['filename'] == 'b.txt'
+    assert indexer._semantic_search_batch(['R$ 48.250,00'])[0][0]['filename'] == 'b.txt'
+
+    # Atualização incremental: só o documento alterado entra no BM25
+    (tmp_path / 'a.txt').write_text('Orçamento anual revisado: R$ 12.000,00 para pavimentação.')
+    indexer.index_directory(tmp_path)
+    assert indexer.bm25.n_alive == 2
+    assert indexer._semantic_search('R$ 12.000,00')[0]['filename'] == 'a.txt'
+
+    with patch.object(SmartDocumentIndexer, '_init_qa_model', lambda self: setattr(self, 'llm_type', 'internal')), \
+            patch.dict(os.environ, {'DOCIA_RETRIEVER': 'hybrid'}):
+        reloaded = SmartDocumentIndexer()
+    reloaded.index_file = indexer.index_file
+    reloaded.vectorizer.max_df = 1.0
+    with patch.object(reloaded, '_update_bm25') as mock_update:
+        reloaded.load_index()
+    mock_update.assert_not_called()
+    assert reloaded._semantic_search('R$ 12.000,00')[0]['filename'] == 'a.txt'
+
+
+def test_bm25_update_does_not_touch_published_snapshot(indexer, tmp_path):
+    from smart_retrievers import BM25Index
+    indexer.retriever = 'hybrid'
+    (tmp_path / 'a.txt').write_text('Foi aprovado o orçamento anual do projeto de pavimentação.')
+    (tmp_path / 'b.txt').write_text('Contrato 2023/117 assinado no valor de R$ 48.250,00 para a obra.')
+    indexer.index_directory(tmp_path)
+    old = indexer._snapshot
+    before = (old.bm25.n_alive, old.bm25.total_len, old.bm25.scores('contrato 2023/117').tolist())
+
+    during = []
+    original_add = BM25Index.add
+
+    def add_and_search(bm25, key, text):
+        # Busca no snapshot publicado no meio da atualização do BM25
+        during.append(indexer._semantic_search('contrato 2023/117')[0]['filename'])
+        assert (old.bm25.n_alive, old.bm25.total_len) == before[:2]
+        return original_add(bm25, key, text)
+
+    (tmp_path / 'b.txt').write_text('Contrato 2024/009 rescindido por descumprimento de prazo.')
+    with patch.object(BM25Index, 'add', add_and_search):
+        indexer.index_directory(tmp_path)
+    assert during == ['b.txt']
+    assert (old.bm25.n_alive, old.bm25.total_len, old.bm25.scores('contrato 2023/117').tolist()) == before
+    assert indexer._snapshot.bm25 is not old.bm25
+    assert indexer._semantic_search('contrato 2024/009')[0]['filename'] == 'b.txt'
+
+
+def test_documents_are_rechunked_when_chunker_changes(indexer, tmp_path):
+    (tmp_path / 'a.txt').write_text('Primeira frase da ata. Segunda frase da ata.')
+    indexer.index_directory(tmp_path)
+    assert indexer.document_chunks(1) == ['Primeira frase da ata. Segunda frase da ata.']
+
+    indexer.chunker.max_tokens = 8
+    indexer.chunker.min_tokens = 0
+    with patch.object(indexer, '_extract_documents', wraps=indexer._extract_documents) as mock_extract:
+        indexer.index_directory(tmp_path)
+    mock_extract.assert_called_once_with([], [])
+    assert indexer.document_chunks(1) == ['Primeira frase da ata.', 'Segunda frase da ata.']
+    assert indexer.documents[0]['chunker'] == indexer.chunker.signature
+
+
+def test_rechunked_documents_get_new_bm25_postings(indexer, tmp_path):
+    indexer.retriever = 'hybrid'
+    paragraphs = [f'Parágrafo {i} da ata com texto comum de reunião.' for i in range(6)]
+    (tmp_path / 'a.txt').write_text('\n\n'.join(paragraphs[:5] + ['A zebraquadra apareceu no fim.']))
+    (tmp_path / 'b.txt').write_text('Outro documento sobre orçamento.')
+    indexer.index_directory(tmp_path)
+    old_keys = set(indexer.bm25.slot_of)
+
+    indexer.chunker.max_tokens = 20
+    indexer.chunker.min_tokens = 0
+    indexer.index_directory(tmp_path)
+    snapshot = indexer._snapshot
+    assert snapshot.store.chunk_counts()[0] > 1
+    # Nenhuma chave da chunkagem anterior continua viva no BM25
+    assert not old_keys & set(snapshot.bm25.slot_of)
+    assert snapshot.bm25.n_alive == snapshot.n_chunks
+    # Cada slot com o termo aponta para um chunk que contém o termo
+    scores = snapshot.bm25.scores('zebraquadra')
+    positions = snapshot.bm25_positions[np.flatnonzero(scores > 0)]
+    assert len(positions) == 1
+    assert 'zebraquadra' in snapshot.store.chunk(int(positions[0]))
+
+
+def test_search_packs_neighbour_chunks_into_context(indexer, tmp_path):
+    indexer.chunker.max_tokens = 16
+    indexer.chunker.min_tokens = 0
+    (tmp_path / 'a.txt').write_text('A reunião começou às nove horas.\n\nO orçamento aprovado foi de R$ 5.000,00.'
+                                    '\n\nA sessão terminou ao meio-dia.')
+    indexer.index_directory(tmp_path)
+    assert len(indexer.document_chunks(1)) == 3
+
+    with patch.object(indexer, '_answer_question', return_value={'answer': 'resp', 'confidence': 0.9}) as mock_answer:
+        indexer.search('orçamento aprovado', max_results=1)
+    context = mock_answer.call_args[0][1][0]
+    # O chunk encontrado e seus vizinhos, numa passagem contínua e sem repetição
+    assert context == indexer.document_content(1)
+
+
+def test_pdf_pages_are_streamed_through_page_cache(tmp_path):
+    from unittest.mock import MagicMock
+    from smart_cache import PageTextCache
+
+    pdf = tmp_path / 'ata.pdf'
+    pdf.write_bytes(b'%PDF-1.4 fake')
+    cache = PageTextCache(str(tmp_path / 'pages'))
+    pages = [MagicMock(), MagicMock(), MagicMock()]
+    pages[0].extract_text.return_value = 'Página um.'
+    pages[1].extract_text.side_effect = ValueError('página corrompida')
+    pages[2].extract_text.return_value = 'Página três.'
+    reader = MagicMock(pages=pages)
+
+    with patch('PyPDF2.PdfReader', return_value=reader) as mock_reader:
+        assert SmartDocumentIndexer._read_pdf(str(pdf), 'abc123', cache) == 'Página um.\f\fPágina três.'
+        assert cache.page_count('abc123') is None  # Extração parcial
+
+        # Só a página que falhou é reextraída
+        pages[1].extract_text.side_effect = None
+        pages[1].extract_text.return_value = 'Página dois.'
+        assert SmartDocumentIndexer._read_pdf(str(pdf), 'abc123', cache) == 'Página um.\fPágina dois.\fPágina três.'
+        assert [p.extract_text.call_count for p in pages] == [1, 2, 1]
+        assert cache.page_count('abc123') == 3
+
+        # Extração completa em cache: o PDF nem é aberto
+        mock_reader.reset_mock()
+        assert SmartDocumentIndexer._read_pdf(str(pdf), 'abc123', cache) == 'Página um.\fPágina dois.\fPágina três.'
+        mock_reader.assert_not_called()
+
+    cache.discard('abc123')
+    assert cache.get('abc123', 0) is None
+
+
+def test_index_directory_walks_subfolders_and_new_formats(indexer, tmp_path):
+    docs = tmp_path / 'docs'
+    (docs / 'atas').mkdir(parents=True)
+    (docs / 'a.txt').write_text('Ata principal sobre pavimentação.')
+    (docs / 'atas' / 'b.md').write_text('# Ata de março\n\nAprovado o **orçamento** anual.')
+    (docs / 'atas' / 'ignorar.txt').write_text('rascunho')
+    indexer.exclude_globs = ('ignorar*',)
+    indexer.index_directory(str(docs))
+    assert [d['filename'] for d in indexer.documents] == ['a.txt', 'atas/b.md']
+    assert indexer._semantic_search('orçamento anual')[0]['filename'] == 'atas/b.md'
+    assert get_reader('x.pdf').cost == 'expensive'
+
+
+def test_pdf_pages_stream_to_chunker_and_partial_files_are_retried(indexer, tmp_path, monkeypatch):
+    import tempfile
+    from unittest.mock import MagicMock
+
+    spool = tmp_path / 'spool'
+    spool.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(spool))
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    (docs / 'ata.pdf').write_bytes(b'%PDF-1.4 fake')
+    pages = [MagicMock(), MagicMock(), MagicMock()]
+    pages[0].extract_text.return_value = 'Página um: ata da reunião.'
+    pages[1].extract_text.side_effect = ValueError('página corrompida')
+    pages[2].extract_text.return_value = 'Página três: orçamento aprovado.'
+
+    with patch('PyPDF2.PdfReader', return_value=MagicMock(pages=pages)):
+        indexer.index_directory(str(docs))
+        doc = indexer.documents[0]
+        # Página com erro: documento parcial, sem hash, e o texto das outras páginas já é buscável
+        assert doc['partial'] and doc['fingerprint']['hash'] is None
+        assert indexer.document_content(doc['id']) == 'Página um: ata da reunião.\f\fPágina três: orçamento aprovado.'
+        assert doc['chunk_pages'] == [1, 3]
+        assert indexer._semantic_search('orçamento aprovado')[0]['filename'] == 'ata.pdf'
+
+        # Mesmo arquivo, página recuperada: a próxima indexação relê o PDF
+        pages[1].extract_text.side_effect = None
+        pages[1].extract_text.return_value = 'Página dois: presença confirmada.'
+        indexer.index_directory(str(docs))
+    doc = indexer.documents[0]
+    assert 'partial' not in doc and doc['fingerprint']['hash']
+    assert indexer.document_chunks(doc['id']) == ['Página um: ata da reunião.', 'Página dois: presença confirmada.',
+                                                  'Página três: orçamento aprovado.']
+    # Arquivos temporários das páginas apagados depois de copiados para o store
+    assert list(spool.iterdir()) == []
+
+
+def test_pdf_indexed_before_page_extraction_is_read_again(indexer, tmp_path):
+    from unittest.mock import MagicMock
+
+    (tmp_path / 'ata.pdf').write_bytes(b'%PDF-1.4 fake')
+    pages = [MagicMock(), MagicMock()]
+    pages[0].extract_text.return_value = 'Página um: ata da reunião.'
+    pages[1].extract_text.return_value = 'Página dois: orçamento aprovado.'
+    with patch('PyPDF2.PdfReader', return_value=MagicMock(pages=pages)):
+        indexer.index_directory(str(tmp_path))
+        # Como um índice antigo: sem ``chunk_pages``
+        legacy = [{k: v for k, v in doc.items() if k != 'chunk_pages'} for doc in indexer.documents]
+        indexer._snapshot = indexer._snapshot.replace(documents=legacy)
+        with patch.object(indexer, '_extract_documents', wraps=indexer._extract_documents) as mock_extract:
+            indexer.index_directory(str(tmp_path))
+    assert mock_extract.call_args.args[0] == [str(tmp_path / 'ata.pdf')]
+    assert indexer.documents[0]['chunk_pages'] == [1, 2]
+    assert indexer.documents[0]['id'] == legacy[0]['id']
+
+
+def test_follower_reload_never_refits(indexer, tmp_path):
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    (docs / 'a.txt').write_text('Ata sobre o orçamento anual.')
+    indexer.index_directory(str(docs))
+
+    with patch.object(SmartDocumentIndexer, '_init_qa_model', lambda self: setattr(self, 'llm_type', 'internal')):
+        follower = SmartDocumentIndexer()
+    follower.index_file = indexer.index_file
+    follower.vectorizer.max_df = 1.0
+    assert follower.load_index(refit=False)
+    assert [d['filename'] for d in follower.documents] == ['a.txt']
+
+    # Texto gravado por outro save no meio da leitura: mantém o snapshot atual
+    with open(indexer._index_path('.text'), 'ab') as f:
+        f.write(b'x')
+    current = follower._snapshot
+    with patch.object(follower, '_vectorize_documents') as mock_vectorize:
+        assert not follower.load_index(refit=False)
+    mock_vectorize.assert_not_called()
+    assert follower._snapshot is current
+
+
+def test_index_survives_copy_but_not_text_from_another_save(indexer, tmp_path):
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    (docs / 'a.txt').write_text('Ata sobre o orçamento anual.')
+    indexer.index_directory(str(docs))
+    text_path = indexer._index_path('.text')
+    with open(text_path, 'rb') as f:
+        saved = f.read()
+
+    # Cópia sem preservar o mtime (cp sem -p, restauração de backup): carrega normalmente
+    os.utime(text_path, (0, 0))
+    assert indexer.load_index()
+    assert indexer.document_content(indexer.documents[0]['id']) == 'Ata sobre o orçamento anual.'
+
+    # .text de outra gravação com o mesmo tamanho: nem com refit o índice vira vazio
+    with open(text_path, 'wb') as f:
+        f.write(saved[:-16] + bytes(16))
+    current = indexer._snapshot
+    assert not indexer.load_index(refit=True)
+    assert indexer._snapshot is current
+    assert [d['filename'] for d in indexer.documents] == ['a.txt']
+
+
+def test_vectors_from_another_save_are_rejected(indexer, tmp_path):
+    import glob
+
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    (docs / 'a.txt').write_text('Ata sobre o orçamento anual.')
+    indexer.index_directory(str(docs))
+    old = {path: open(path, 'rb').read() for path in (indexer.index_file, indexer._index_path('.text'))}
+
+    (docs / 'a.txt').write_text('Ata sobre o contrato da obra.')
+    indexer.index_directory(str(docs))
+    # Só os arrays da última gravação ficam no disco
+    assert len(glob.glob(indexer._index_path('.data.*.npy'))) == 1
+
+    # Seguidor que leu o JSON e o .text da gravação anterior, já com os vetores da nova
+    for path, data in old.items():
+        with open(path, 'wb') as f:
+            f.write(data)
+    current = indexer._snapshot
+    assert not indexer.load_index(refit=False)
+    assert indexer._snapshot is current
+    assert indexer._semantic_search('contrato obra')[0]['filename'] == 'a.txt'
+
+
+def test_background_init_loads_index_and_defers_hf_model(tmp_path):
+    (tmp_path / 'doc.txt').write_text('A reuniao aprovou o orcamento do projeto.')
+    with patch.object(SmartDocumentIndexer, '_init_qa_model', lambda self: setattr(self, 'llm_type', 'internal')):
+        source = SmartDocumentIndexer()
+    source.index_file = str(tmp_path / 'index.json')
+    source.vectorizer.max_df = 1.0
+    source.index_directory(tmp_path)
+
+    idx = SmartDocumentIndexer(autoload=False)
+    idx.index_file = source.index_file
+    idx.vectorizer.max_df = 1.0
+    assert not idx.initialized.is_set() and not idx.documents
+    with patch.object(idx.llm_client, 'refresh_health', return_value={'available': False, 'models': []}), \
+            patch.object(idx.llm_client, 'start_health_monitor'), \
+            patch('importlib.util.find_spec', return_value=object()):
+        idx.start_background_init().join(5)
+    assert idx.initialized.is_set()
+    assert len(idx.documents) == 1
+    assert set(idx.startup_timings) == {'index_load', 'model_init'}
+    # Hugging Face escolhido, mas o modelo só é carregado quando uma resposta precisar dele
+    assert idx.llm_type == 'huggingface' and idx.qa_pipeline is None
@@ -0,0 +1,141 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from smart_llm import CircuitBreaker, OllamaClient, StreamInterrupted
+
+
+def _response(status=200, payload=None):
+    resp = MagicMock()
+    resp.status_code = status
+    resp.json.return_value = payload or {}
+    return resp
+
+
+def test_circuit_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    breaker.reset_timeout = 0
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # só uma chamada de teste
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_generate_uses_cached_health_and_trips_breaker():
+    client = OllamaClient(host='http://ollama:11434', breaker=CircuitBreaker(failure_threshold=2))
+    with patch.object(client.session, 'get', return_value=_response(payload={'models': [{'name': 'mistral'}]})) as get:
+        client.refresh_health()
+    assert client.is_available()
+    assert client.health['models'] == ['mistral']
+
+    with patch.object(client.session, 'post', return_value=_response(payload={'response': 'ok'})) as post:
+        assert client.generate('mistral', 'oi') == 'ok'
+        assert client.generate('mistral', 'oi') == 'ok'
+    assert post.call_count == 2
+    assert get.call_count == 1
+
+    with patch.object(client.session, 'post', side_effect=requests.exceptions.ConnectionError) as post:
+        assert client.generate('mistral', 'oi') is None
+        assert client.generate('mistral', 'oi') is None
+        assert client.generate('mistral', 'oi') is None
+    assert post.call_count == 2
+    assert not client.is_available()
+
+
+def test_agenerate_skips_when_unavailable():
+    client = OllamaClient(host='http://ollama:11434')
+    assert asyncio.run(client.agenerate('mistral', 'oi')) is None
+
+
+def test_abandoned_trial_does_not_keep_the_circuit_stuck():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    client = OllamaClient(host='http://ollama:11434', breaker=breaker)
+    client.health['available'] = True
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # Consumidor larga o stream no meio da chamada de teste (GeneratorExit)
+    resp = _response()
+    resp.__enter__.return_value = resp
+    resp.iter_lines.return_value = iter([b'{"response": "Ol"}', b'{"response": "a"}'])
+    with patch.object(client.session, 'post', return_value=resp):
+        stream = client.generate_stream('mistral', 'oi')
+        assert next(stream) == 'Ol'
+        stream.close()
+    assert breaker.allow_request()
+
+    # Chamada de teste que nunca termina: perdida após ``trial_timeout``
+    assert not breaker.allow_request()
+    breaker.trial_timeout = 0
+    assert breaker.allow_request()
+
+
+def test_cancelled_agenerate_releases_the_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    client = OllamaClient(host='http://ollama:11434', breaker=breaker)
+    client.health['available'] = True
+    breaker.record_failure()
+
+    async def run():
+        started = asyncio.Event()
+
+        class _Post:
+            async def __aenter__(self):
+                started.set()
+                await asyncio.sleep(10)
+
+            async def __aexit__(self, *exc):
+                return False
+
+        session = MagicMock(post=MagicMock(return_value=_Post()))
+        with patch.object(client, '_get_async_session', return_value=session):
+            task = asyncio.ensure_future(client.agenerate('mistral', 'oi'))
+            await started.wait()
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert breaker.allow_request()
+
+
+def test_generate_stream_signals_a_stream_cut_after_tokens():
+    client = OllamaClient(host='http://ollama:11434', breaker=CircuitBreaker(failure_threshold=1))
+    client.health['available'] = True
+    resp = _response()
+    resp.__enter__.return_value = resp
+    # Conexão fechada sem a linha final ``done``
+    resp.iter_lines.return_value = iter([b'{"response": "O or"}'])
+    with patch.object(client.session, 'post', return_value=resp):
+        stream = client.generate_stream('mistral', 'oi')
+        assert next(stream) == 'O or'
+        with pytest.raises(StreamInterrupted):
+            next(stream)
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # Falha antes do primeiro token: stream vazio, sem exceção
+    client.breaker.record_success()
+    with patch.object(client.session, 'post', side_effect=requests.exceptions.ConnectionError):
+        assert list(client.generate_stream('mistral', 'oi')) == []
+
+
+def test_call_from_before_the_breaker_opened_keeps_the_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    slow_call = breaker.allow_request()
+    assert slow_call and not slow_call.trial
+    breaker.record_failure()
+    trial = breaker.allow_request()
+    assert trial.trial
+    # A chamada lenta admitida com o circuito fechado termina durante o teste
+    breaker.release_trial(slow_call)
+    assert not breaker.allow_request()
+    breaker.release_trial(trial)
+    assert breaker.allow_request()
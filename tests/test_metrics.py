@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from smart_metrics import MetricsRegistry
+
+
+def test_render_counters_gauges_and_histograms():
+    registry = MetricsRegistry()
+    requests = registry.counter("http_requests_total", "Requisições", ("endpoint", "status"))
+    requests.inc(endpoint="/search", status=200)
+    requests.inc(2, endpoint="/search", status=200)
+    registry.gauge("doc_ia_documents_indexed_total", "Documentos").set_function(lambda: 7)
+    stages = registry.histogram("doc_ia_stage_duration_seconds", "Etapas", ("stage",), buckets=(0.1, 1.0))
+    stages.observe(0.05, stage="retrieve")
+    stages.observe(0.5, stage="retrieve")
+    stages.observe(5, stage="retrieve")
+
+    text = registry.render()
+    assert '# TYPE http_requests_total counter' in text
+    assert 'http_requests_total{endpoint="/search",status="200"} 3' in text
+    assert 'doc_ia_documents_indexed_total 7' in text
+    assert 'doc_ia_stage_duration_seconds_bucket{stage="retrieve",le="0.1"} 1' in text
+    assert 'doc_ia_stage_duration_seconds_bucket{stage="retrieve",le="1"} 2' in text
+    assert 'doc_ia_stage_duration_seconds_bucket{stage="retrieve",le="+Inf"} 3' in text
+    assert 'doc_ia_stage_duration_seconds_count{stage="retrieve"} 3' in text
+
+    with pytest.raises(ValueError):
+        requests.inc(endpoint="/search")
+
+
+def test_timed_decorator_measures_generators_and_coroutines():
+    registry = MetricsRegistry()
+    stages = registry.histogram("stage_seconds", "Etapas", ("stage",))
+
+    @stages.timed(stage="stream")
+    def stream():
+        yield 1
+        yield 2
+
+    @stages.timed(stage="async")
+    async def answer():
+        await asyncio.sleep(0)
+        return "ok"
+
+    @stages.timed(stage="async_stream")
+    async def astream():
+        yield "a"
+        yield "b"
+
+    async def consume():
+        return [item async for item in astream()]
+
+    assert list(stream()) == [1, 2]
+    assert asyncio.run(answer()) == "ok"
+    assert asyncio.run(consume()) == ["a", "b"]
+    samples = stages.samples()
+    assert {key: value[2] for key, value in samples.items()} == {("stream",): 1, ("async",): 1, ("async_stream",): 1}
+
+
+def test_multiprocess_collect_sums_workers(tmp_path):
+    registry = MetricsRegistry()
+    registry.directory = str(tmp_path)
+    registry.counter("hits_total", "Acertos", ("cache",)).inc(cache="answer")
+    registry.gauge("active", "Em andamento").set(1)
+    registry.gauge("documents", "Documentos", aggregate="max").set(10)
+
+    other = MetricsRegistry()
+    other.counter("hits_total", "Acertos", ("cache",)).inc(4, cache="answer")
+    other.gauge("active", "Em andamento").set(2)
+    other.gauge("documents", "Documentos", aggregate="max").set(10)
+    # Um worker vivo (o processo pai) e um que já terminou
+    for pid in (os.getppid(), 2 ** 22 + 12345):
+        (tmp_path / f"{pid}.json").write_text(json.dumps(other.snapshot()))
+
+    merged = registry.collect()
+    assert merged['hits_total']['samples'] == [[["answer"], 9.0]]
+    assert merged['active']['samples'] == [[[], 3.0]]  # gauge do processo morto não conta
+    assert merged['documents']['samples'] == [[[], 10.0]]
+
+    registry.flush()
+    assert (tmp_path / registry.worker_file()).exists()
+    # O arquivo do processo morto foi somado ao agregado e apagado
+    assert not (tmp_path / f"{2 ** 22 + 12345}.json").exists()
+    merged = registry.collect()
+    assert merged['hits_total']['samples'] == [[["answer"], 9.0]]
+    assert merged['active']['samples'] == [[[], 3.0]]
+
+
+def test_reused_pid_does_not_overwrite_dead_worker(tmp_path):
+    registry = MetricsRegistry()
+    registry.directory = str(tmp_path)
+    other = MetricsRegistry()
+    other.counter("hits_total", "Acertos").inc(2)
+    other.gauge("active", "Em andamento").set(5)
+    # Mesmo PID (vivo) em dois arquivos: o mais antigo é de um processo que já terminou
+    pid = os.getppid()
+    old, new = tmp_path / f"{pid}-0000.json", tmp_path / f"{pid}-ffff.json"
+    for path in (old, new):
+        path.write_text(json.dumps(other.snapshot()))
+    os.utime(old, (1000, 1000))
+    merged = registry.collect()
+    assert merged['hits_total']['samples'] == [[[], 4.0]]
+    assert merged['active']['samples'] == [[[], 5.0]]
+
+    # Um arquivo já somado que não chegou a ser apagado não é somado de novo
+    registry.fold_dead_workers()
+    old.write_text(json.dumps(other.snapshot()))
+    os.utime(old, (1000, 1000))
+    registry.fold_dead_workers()
+    assert not old.exists()
+    assert registry.collect()['hits_total']['samples'] == [[[], 4.0]]
@@ -0,0 +1,47 @@
+import zipfile
+
+from smart_readers import CHEAP, get_reader, read_html, read_markdown, read_odt, read_rtf, register_reader, walk_documents
+
+
+def test_walk_is_recursive_and_honours_globs(tmp_path):
+    (tmp_path / 'atas' / '2023').mkdir(parents=True)
+    (tmp_path / 'rascunhos').mkdir()
+    (tmp_path / '.git').mkdir()
+    for rel in ['a.md', 'atas/b.md', 'atas/2023/c.html', 'rascunhos/d.rtf', '.git/e.md', '~$f.odt', 'g.xyz']:
+        (tmp_path / rel).write_text('x')
+
+    found = [rel for rel, _ in walk_documents(str(tmp_path))]
+    assert found == ['a.md', 'atas/b.md', 'atas/2023/c.html', 'rascunhos/d.rtf']
+    assert [rel for rel, _ in walk_documents(str(tmp_path), exclude=('rascunhos', '.*', '~$*'))] == \
+        ['a.md', 'atas/b.md', 'atas/2023/c.html']
+    assert [rel for rel, _ in walk_documents(str(tmp_path), include=('atas/*',))] == ['atas/b.md', 'atas/2023/c.html']
+
+
+def test_additional_formats(tmp_path):
+    (tmp_path / 'a.md').write_text('# Ata\n\n**Aprovado** o [orçamento](http://x).')
+    assert read_markdown(str(tmp_path / 'a.md')) == 'Ata\n\nAprovado o orçamento.'
+
+    (tmp_path / 'a.html').write_text('<html><head><style>p{}</style></head><body><h1>Ata</h1>'
+                                     '<p>Valor: R$ 10,00 &amp; mais.</p><script>x()</script></body></html>')
+    assert read_html(str(tmp_path / 'a.html')) == 'Ata\n\nValor: R$ 10,00 & mais.'
+
+    (tmp_path / 'a.rtf').write_text(r"{\rtf1\ansi{\fonttbl{\f0 Arial;}}\f0 Ata da reuni\'e3o\par Or\u231?amento aprovado.\par}")
+    assert read_rtf(str(tmp_path / 'a.rtf')) == 'Ata da reunião\n\nOrçamento aprovado.'
+
+    content = ('<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+               'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0"><office:body><office:text>'
+               '<text:h>Ata</text:h><text:p>Primeiro<text:s/>parágrafo <text:span>com estilo</text:span>.</text:p>'
+               '</office:text></office:body></office:document-content>')
+    with zipfile.ZipFile(tmp_path / 'a.odt', 'w') as archive:
+        archive.writestr('content.xml', content)
+    assert read_odt(str(tmp_path / 'a.odt')) == 'Ata\n\nPrimeiro parágrafo com estilo.'
+
+
+def test_register_custom_reader(tmp_path):
+    spec = register_reader(('.csvx',), lambda path: 'conteúdo', cost='custom')
+    try:
+        assert get_reader(str(tmp_path / 'A.CSVX')) is spec
+        assert spec.cost == 'custom' and get_reader('x.md').cost == CHEAP
+    finally:
+        from smart_readers import _READERS
+        _READERS.pop('.csvx')
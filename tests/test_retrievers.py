@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from smart_retrievers import BM25Index, DenseIndex, reciprocal_rank_fusion
+
+
+@pytest.mark.parametrize('dtype', ['int8', 'float16'])
+def test_ivf_search_matches_brute_force(dtype):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(3000, 32)).astype(np.float32)
+    index = DenseIndex.build(vectors, dtype=dtype, nprobe=16)
+    assert len(index.centroids) > 1
+    assert index.codes.dtype == np.dtype(dtype)
+
+    queries = vectors[:20] + rng.normal(scale=0.05, size=(20, 32)).astype(np.float32)
+    for query_id, (ids, scores) in enumerate(index.search(queries, k=5)):
+        assert ids[0] == query_id
+        assert np.all(np.diff(scores) <= 1e-6)
+
+
+def test_save_and_load_with_mmap(tmp_path, fake_embedder):
+    index = DenseIndex.build(fake_embedder(['ata de janeiro', 'orcamento anual', 'projeto do mapa']))
+    prefix = str(tmp_path / 'idx.dense')
+    index.save(prefix, {'corpus_version': 'v1'})
+    loaded, meta = DenseIndex.load(prefix)
+    assert meta['corpus_version'] == 'v1'
+    assert isinstance(loaded.codes, np.memmap)
+    ids, _ = loaded.search(fake_embedder(['orcamento anual']), k=1)[0]
+    assert ids.tolist() == [1]
+
+
+def test_bm25_exact_terms_and_incremental_updates(tmp_path):
+    bm25 = BM25Index(stop_words=['o', 'de', 'do'])
+    bm25.add('a:0', 'Aprovado o orçamento de R$ 1.500,00 para o projeto')
+    bm25.add('b:0', 'Reunião do conselho com Maria Quitéria')
+    bm25.add('c:0', 'Orçamento revisado do projeto')
+    scores = bm25.scores('R$ 1.500,00')
+    assert scores.argmax() == 0 and scores[2] == 0
+    assert bm25.scores('quitéria').argmax() == 1
+
+    bm25.remove('a:0')
+    bm25.add('d:0', 'Nova ata: R$ 1.500,00 liberados')
+    scores = bm25.scores('1.500,00')
+    assert scores[0] == 0 and scores.argmax() == 3
+
+    compacted = bm25.compacted()
+    assert compacted.keys == ['b:0', 'c:0', 'd:0']
+    assert compacted.scores('1.500,00').argmax() == 2
+    assert bm25.n_slots == 4  # o índice original continua válido
+
+    prefix = str(tmp_path / 'idx.bm25')
+    bm25.save(prefix, {'corpus_version': 'v1'})
+    loaded, meta = BM25Index.load(prefix, stop_words=['o', 'de', 'do'])
+    assert meta['corpus_version'] == 'v1'
+    np.testing.assert_allclose(loaded.scores('orçamento projeto'), bm25.scores('orçamento projeto'), rtol=1e-6)
+    loaded.add('e:0', 'orçamento extra')
+    assert loaded.scores('orçamento').argmax() == 4
+
+
+def test_reciprocal_rank_fusion():
+    items, scores = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+    assert items == [1, 3, 2]
+    assert scores[0] == pytest.approx(1 / 61 + 1 / 62)
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+from smart_scheduler import FileWatch, LeaderElection, ReindexScheduler, touch
+
+
+def test_events_are_debounced_and_coalesced():
+    builds = []
+    scheduler = ReindexScheduler(lambda paths, full: builds.append((paths, full)), debounce=0.2)
+    for i in range(500):
+        scheduler.notify(f'documents/ata{i % 50}.pdf')
+    assert scheduler.stats()['queue_depth'] == 50
+    assert scheduler.wait_idle(timeout=5)
+    assert len(builds) == 1
+    paths, full = builds[0]
+    assert paths == {os.path.abspath(f'documents/ata{i}.pdf') for i in range(50)}
+    assert full is False
+    stats = scheduler.stats()
+    assert stats['events_total'] == 500 and stats['builds_total'] == 1
+    assert stats['last_build_duration'] is not None
+
+
+def test_only_one_build_runs_at_a_time():
+    running, overlaps, release = [], [], threading.Event()
+
+    def build(paths, full):
+        overlaps.append(len(running))
+        running.append(1)
+        release.wait(1)
+        running.pop()
+
+    scheduler = ReindexScheduler(build, debounce=0.01)
+    scheduler.request_reindex()
+    time.sleep(0.1)
+    scheduler.notify('documents/a.txt')
+    scheduler.notify('documents/b.txt')
+    time.sleep(0.1)
+    release.set()
+    assert scheduler.wait_idle(timeout=5)
+    assert overlaps == [0, 0]
+
+
+def test_only_one_process_is_elected_leader(tmp_path):
+    lock_path = str(tmp_path / 'leader.lock')
+    first, second = LeaderElection(lock_path), LeaderElection(lock_path, retry_interval=0.05)
+    assert first.try_acquire()
+    assert not second.try_acquire()
+
+    elected = threading.Event()
+    second.start(elected.set)
+    time.sleep(0.1)
+    assert not elected.is_set()
+    first.release()  # Como se o líder tivesse morrido
+    assert elected.wait(2)
+    assert second.is_leader
+    second.release()
+
+
+def test_file_watch_retries_until_callback_succeeds(tmp_path):
+    path = tmp_path / 'index.json'
+    results = [False, True]
+    calls = []
+    watch = FileWatch(str(path), lambda: calls.append(1) or results[len(calls) - 1])
+    assert not watch.check()  # Arquivo ainda não existe
+    touch(str(path))
+    assert not watch.check()  # Callback pediu nova tentativa
+    assert watch.check()
+    assert not watch.check()  # Sem alteração nova
+    assert len(calls) == 2
@@ -0,0 +1,39 @@
+import numpy as np
+
+from smart_store import DocumentStore, DocumentStoreBuilder, byte_spans
+
+
+def test_byte_spans_follow_utf8_lengths():
+    content = 'Ata da reunião. Orçamento aprovado.'
+    spans = [(0, 15), (16, len(content))]
+    offsets = byte_spans(content, spans)
+    data = content.encode('utf-8')
+    assert [data[s:e].decode('utf-8') for s, e in offsets] == ['Ata da reunião.', 'Orçamento aprovado.']
+    assert byte_spans('abc def', [(0, 3), (4, 7)]).tolist() == [[0, 3], [4, 7]]
+
+
+def test_builder_copies_stored_documents_and_reopens_from_disk(tmp_path):
+    builder = DocumentStoreBuilder()
+    builder.add('Primeira ata. Decisão tomada.', [(0, 13), (14, 29)])
+    builder.add('Segunda ata.', [(0, 12)])
+    first = builder.build()
+    assert first.n_documents == 2 and first.n_chunks == 3
+    assert list(first.texts()) == ['Primeira ata.', 'Decisão tomada.', 'Segunda ata.']
+
+    builder = DocumentStoreBuilder()
+    builder.add_stored(first, 1)
+    builder.add('Nova ata.', [(0, 9)])
+    builder.add_stored(first, 0)
+    second = builder.build()
+    assert [second.content(i) for i in range(3)] == ['Segunda ata.', 'Nova ata.', 'Primeira ata. Decisão tomada.']
+    assert second.document_chunks(2) == ['Primeira ata.', 'Decisão tomada.']
+    assert second.window(2, 0, 1) == 'Primeira ata. Decisão tomada.'
+    assert second.texts()[1:3] == ['Nova ata.', 'Primeira ata.']
+
+    path = tmp_path / 'store.text'
+    with open(path, 'wb') as f:
+        second.write(f, block_size=7)
+    mapped = DocumentStore.open(str(path), second.doc_offsets, second.doc_chunks, second.chunk_offsets)
+    assert isinstance(mapped.buffer, np.memmap)
+    assert list(mapped.texts()) == list(second.texts())
+    assert DocumentStore().n_chunks == 0